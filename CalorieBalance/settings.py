@@ -10,6 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +51,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'calorie_tracker.sharding.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,6 +87,54 @@ DATABASES = {
     }
 }
 
+# Repliki tylko do odczytu (calorie_tracker/db_router.py). Lokalnie to kopie pliku SQLite odświeżane przez
+# `manage.py sync_replicas`, np. CALORIE_DB_REPLICAS=db_replica1.sqlite3,db_replica2.sqlite3
+for number, name in enumerate(filter(None, os.environ.get('CALORIE_DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Shardy danych użytkowników (calorie_tracker/sharding.py): primary + pliki SQLite z CALORIE_DB_SHARDS,
+# np. CALORIE_DB_SHARDS=db_shard1.sqlite3,db_shard2.sqlite3; schemat: `manage.py migrate --database shard1`
+for number, name in enumerate(filter(None, os.environ.get('CALORIE_DB_SHARDS', '').split(',')), start=1):
+    DATABASES[f'shard{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name.strip(),
+    }
+
+# Testy mają zawsze własne dwa shardy, a sharding włączają tylko klasy, które go testują (override_settings
+# DB_SHARDS). Bazy testowe w plikach - testy przenoszenia piszą z kilku wątków, a SQLite w pamięci
+# nie czeka na blokadę innego połączenia. WAL - odczyty przenoszenia nie czekają na commity piszącego
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    for number in (1, 2):
+        DATABASES[f'shard{number}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'db_shard{number}.sqlite3',
+            'OPTIONS': {'init_command': 'PRAGMA journal_mode = WAL'},
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), f'calorie_test_shard{number}.sqlite3')},
+        }
+
+DATABASE_ROUTERS = [
+    'calorie_tracker.sharding.ShardRouter',
+    'calorie_tracker.db_router.PrimaryReplicaRouter',
+]
+
+DB_SHARDS = {
+    'ALIASES': ['default'] if TESTING else ['default', *[alias for alias in DATABASES if alias.startswith('shard')]],
+}
+
+DB_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias.startswith('replica')],
+    # read-your-writes: tyle po zapisie użytkownik czyta z primary; ma przekraczać opóźnienie replikacji,
+    # bo cache podsumowań zapamiętuje to, co przeczytał
+    'STICKY_SECONDS': 10,
+    # przypięcia w LocMem widzi tylko jeden proces - bez wspólnego cache (Redis) repliki są pomijane
+    'ALLOW_PROCESS_LOCAL': DEBUG,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,7 +187,67 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # orjson, jeśli jest zainstalowany; bez niego zwykły JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': (
+        'calorie_tracker.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
-DATE_INPUT_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y']
\ No newline at end of file
+DATE_INPUT_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y']
+
+# Klient Nutritionix (calorie_tracker/nutritionix.py)
+NUTRITIONIX = {
+    'BASE_URL': 'https://trackapi.nutritionix.com',
+    'APP_ID': '55e405f5',
+    'APP_KEY': '60ffec6ca6a509a11fdc34925da69be4',
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'RETRIES': 2,
+    'BACKOFF': 0.3,
+    'POOL_SIZE': 10,
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_RESET': 30,
+}
+
+# Cache odpowiedzi Nutritionix (calorie_tracker/nutrition_cache.py)
+NUTRITIONIX_CACHE = {
+    'TTL': 7 * 24 * 3600,
+    'MEMORY_SIZE': 1024,
+    'MAX_ENTRIES': 50000,
+    'PRUNE_EVERY': 100,
+}
+
+# Lokalna baza produktów - plik indeksu budowany przez `manage.py load_foods`
+FOOD_INDEX_PATH = BASE_DIR / 'food_index.bin'
+
+# Czas (s), przez jaki powtórzony zapis z tym samym nagłówkiem Idempotency-Key dostaje zapisaną odpowiedź
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+
+# Cache Django (m.in. odpowiedzi podsumowań). Przy kilku procesach/serwerach potrzebny jest wspólny backend -
+# inaczej unieważnienie po zapisie widzi tylko proces, który go wykonał:
+#   CALORIE_REDIS_URL=redis://localhost:6379/0 (wymaga pakietu redis)
+if os.environ.get('CALORIE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CALORIE_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'calorie-balance',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Cache odpowiedzi podsumowań (calorie_tracker/summary_cache.py). Na LocMem działa tylko w trybie DEBUG
+# (jeden proces runservera); w produkcji bez wspólnego backendu podsumowania są liczone za każdym razem
+SUMMARY_CACHE = {
+    'ALIAS': 'default',
+    'TTL': 3600,
+    'ALLOW_PROCESS_LOCAL': DEBUG,
+}
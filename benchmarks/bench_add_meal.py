@@ -0,0 +1,58 @@
+# Porównanie ścieżki zapisu AddMealAPIView: full_clean() + save() na każdy produkt vs bulk_create w transakcji
+#
+#   python benchmarks/bench_add_meal.py
+
+from common import benchmark_database, timed, print_table
+
+from django.contrib.auth.models import User
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from calorie_tracker.models import Meal
+from calorie_tracker.serializers import MealSerializer
+from calorie_tracker.views import AddMealAPIView
+
+
+class LegacyAddMealAPIView(AddMealAPIView):
+    # Poprzednia implementacja: osobny zapis (i commit) dla każdego produktu
+    def post(self, request):
+        meal_date = request.data["date"]
+        created_meals = []
+        for food in request.data["foods"]:
+            meal = Meal.from_nutritionix(request.user, food, meal_date)
+            meal.full_clean(exclude=['raw_payload'])  # payload zapisuje dopiero save()
+            meal.save()
+            created_meals.append(meal)
+        return Response({"meals": MealSerializer(created_meals, many=True).data}, status=status.HTTP_201_CREATED)
+
+
+FOOD = {
+    "food_name": "apple", "nf_calories": 95, "nf_protein": 0.5, "nf_total_carbohydrate": 25,
+    "nf_total_fat": 0.3, "serving_qty": 1, "serving_unit": "medium",
+}
+
+
+def run():
+    factory = APIRequestFactory()
+    user = User.objects.create_user(username='bench')
+    rows = []
+
+    for count in (1, 10, 100):
+        payload = {"date": "2025-01-01", "foods": [FOOD] * count}
+        results = []
+        for view in (LegacyAddMealAPIView.as_view(), AddMealAPIView.as_view()):
+            def call():
+                request = factory.post('/api/add-meal/', payload, format='json')
+                force_authenticate(request, user=user)
+                response = view(request)
+                assert response.status_code == 201, response.data
+            results.append(timed(call))
+        rows.append((count, f"{results[0]:.2f}", f"{results[1]:.2f}", f"{results[0] / results[1]:.1f}x"))
+
+    print_table(("foods", "legacy ms", "bulk ms", "speedup"), rows)
+
+
+if __name__ == '__main__':
+    with benchmark_database():
+        run()
@@ -0,0 +1,46 @@
+# Przepustowość i pamięć importu historii (calorie_tracker.importers)
+#
+#   python benchmarks/bench_import.py [liczba_wierszy]
+
+import json
+import resource
+import sys
+import tempfile
+import time
+
+from common import benchmark_database
+
+from django.contrib.auth.models import User
+
+from calorie_tracker.importers import import_history
+
+
+def write_meals(path, count):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(json.dumps({
+                "food_name": f"meal {i % 500}", "nf_calories": 100 + i % 700, "nf_protein": 10,
+                "nf_total_carbohydrate": 20, "nf_total_fat": 5, "serving_qty": 1,
+                "serving_unit": "serving", "date": f"20{10 + i % 15}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            }) + "\n")
+
+
+def run(count):
+    user = User.objects.create_user(username='bench')
+    with tempfile.NamedTemporaryFile(suffix='.jsonl') as tmp:
+        write_meals(tmp.name, count)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        with open(tmp.name, 'rb') as stream:
+            result = import_history(user, stream, 'meals')
+        elapsed = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"rows:      {result.created} created, {result.failed} failed")
+    print(f"time:      {elapsed:.1f} s ({result.processed / elapsed:,.0f} rows/s)")
+    print(f"peak RSS:  +{(rss_after - rss_before) / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    with benchmark_database():
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
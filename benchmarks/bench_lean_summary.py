@@ -0,0 +1,97 @@
+# Pamięć i czas wczytania wpisów dnia na ścieżkach podsumowań: pełne obiekty vs only()/values()
+#
+#   python benchmarks/bench_lean_summary.py [posiłków_dziennie]
+
+import sys
+import tracemalloc
+
+from common import benchmark_database, timed, print_table
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from calorie_tracker.models import Meal, Activity, UserProfile
+from calorie_tracker.rollups import rebuild_daily_balances
+from calorie_tracker.views import DailySummaryAPIView, daily_summary_view
+
+DAY = "2025-01-01"
+
+
+def seed(meals_per_day):
+    user = User.objects.create_user(username='heavy')
+    UserProfile.objects.filter(user=user).update(weight=70, height=175, date_of_birth='1990-01-01', gender='M')
+    user = User.objects.get(pk=user.pk)  # bez profilu zapamiętanego przez sygnał przy tworzeniu
+    # Pełne odpowiedzi Nutritionix (~3 KB), różne dla każdego posiłku, żeby nie deduplikowały się do jednego wiersza
+    Meal.objects.bulk_create([
+        Meal.from_nutritionix(user, {
+            "food_name": f"meal {i}", "nf_calories": 100 + i % 500, "serving_qty": 1,
+            "full_nutrients": [{"attr_id": attr, "value": (i * attr) % 97 / 7} for attr in range(120)],
+        }, DAY)
+        for i in range(meals_per_day)
+    ])
+    Activity.objects.bulk_create([
+        Activity(user=user, activity_type='RUN', duration=30, calories_burned=300, date=DAY)
+        for _ in range(meals_per_day // 10)
+    ])
+    rebuild_daily_balances(user.id)
+    return user
+
+
+def loaders(user):
+    # Za każdym razem nowy QuerySet - inaczej drugi pomiar czytałby wyniki z cache QuerySetu
+    def meals():
+        return Meal.objects.filter(user=user, date=DAY)
+
+    return [
+        ("objects + raw payload", lambda: [(m.meal, m.calories, m.raw_api_data)
+                                           for m in meals().select_related('raw_payload')]),
+        ("full objects", lambda: [(m.meal, m.calories) for m in meals()]),
+        ("only(meal, calories)", lambda: [(m.meal, m.calories) for m in meals().only('meal', 'calories')]),
+        ("values(meal, calories)", lambda: list(meals().values('meal', 'calories'))),
+    ]
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def endpoints(user):
+    api_factory, html_factory = APIRequestFactory(), RequestFactory()
+    api_view = DailySummaryAPIView.as_view()
+
+    def api():
+        request = api_factory.get('/api/daily-summary/', {"date": DAY})
+        force_authenticate(request, user=user)
+        assert api_view(request).status_code == 200
+
+    def html():
+        request = html_factory.get('/daily-summary/', {"date": DAY})
+        request.user = user
+        assert daily_summary_view(request).status_code == 200
+
+    return [("api/daily-summary", api), ("daily-summary (html)", html)]
+
+
+def run(meals_per_day):
+    user = seed(meals_per_day)
+    print(f"{meals_per_day} meals and {meals_per_day // 10} activities on {DAY}\n")
+
+    print_table(
+        ("row loading", "ms", "peak KiB"),
+        [(label, f"{timed(fn):.2f}", f"{peak_memory(fn):,.0f}") for label, fn in loaders(user)],
+    )
+    print()
+    print_table(
+        ("endpoint", "ms", "peak KiB"),
+        [(label, f"{timed(fn):.2f}", f"{peak_memory(fn):,.0f}") for label, fn in endpoints(user)],
+    )
+
+
+if __name__ == '__main__':
+    with benchmark_database():
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,79 @@
+# Koszt serializacji listy posiłków na 1000 wpisów: ModelSerializer vs projekcja z values(), json vs orjson
+#
+#   python benchmarks/bench_read_serializers.py [posiłków]
+
+import sys
+
+from common import benchmark_database, timed, print_table
+
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from calorie_tracker.models import Meal
+from calorie_tracker.renderers import FastJSONRenderer, engine
+from calorie_tracker.serializers import MealSerializer, MealReadSerializer
+from calorie_tracker.views import MealsTodayAPIView
+
+DAY = "2025-01-01"
+
+
+def seed(meals):
+    user = User.objects.create_user(username='lister')
+    # Odpowiedzi Nutritionix (~3 KB) różne dla każdego posiłku - jak w bench_lean_summary.py
+    Meal.objects.bulk_create([
+        Meal.from_nutritionix(user, {
+            "food_name": f"meal {i}", "nf_calories": 100 + i % 500, "serving_qty": 1, "serving_unit": "g",
+            "nf_protein": i % 30, "nf_total_carbohydrate": i % 50, "nf_total_fat": i % 20,
+            "full_nutrients": [{"attr_id": attr, "value": (i * attr) % 97 / 7} for attr in range(120)],
+        }, DAY)
+        for i in range(meals)
+    ])
+    return user
+
+
+def variants(user):
+    # Za każdym razem nowy QuerySet - bez cache wyników między pomiarami
+    def meals():
+        return Meal.objects.filter(user=user, date=DAY)
+
+    read = MealReadSerializer()
+    return [
+        ("ModelSerializer + json (before)",
+         lambda: JSONRenderer().render(MealSerializer(meals().select_related('raw_payload'), many=True).data)),
+        ("values() projection + json",
+         lambda: JSONRenderer().render(read.data(meals().values(*read.columns())))),
+        (f"values() projection + {engine()}",
+         lambda: FastJSONRenderer().render(read.data(meals().values(*read.columns())))),
+    ]
+
+
+def endpoint(user):
+    factory, view = APIRequestFactory(), MealsTodayAPIView.as_view()
+
+    def call():
+        request = factory.get('/api/meals-today/', {"date": DAY})
+        force_authenticate(request, user=user)
+        response = view(request)
+        response.render()
+        return len(response.content)
+
+    return call
+
+
+def run(meals):
+    user = seed(meals)
+    per_1000 = 1000 / meals
+    print(f"{meals} meals on {DAY}, JSON engine: {engine()}\n")
+    timings = [(label, timed(fn)) for label, fn in variants(user)]
+    print_table(
+        ("serialization", "ms", "ms / 1000 meals"),
+        [(label, f"{ms:.2f}", f"{ms * per_1000:.2f}") for label, ms in timings],
+    )
+    call = endpoint(user)
+    print(f"\napi/meals-today: {timed(call):.2f} ms, {call() / 1024:,.0f} KiB")
+
+
+if __name__ == '__main__':
+    with benchmark_database():
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,146 @@
+# Plany zapytań i czasy endpointów podsumowań bez i z indeksami (user, date, id) na Meal i Activity
+#
+#   python benchmarks/bench_summary_indexes.py [liczba_użytkowników] [dni_historii]
+
+import random
+import sys
+from datetime import date, timedelta
+
+from common import benchmark_database, timed, print_table
+
+from django.contrib.auth.models import User
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from calorie_tracker.models import Meal, Activity, UserProfile
+from calorie_tracker.rollups import rebuild_daily_balances
+from calorie_tracker.views import (
+    DailySummaryAPIView, WeeklySummaryAPIView, RangeSummaryAPIView, MealsTodayAPIView, ActivityStatsAPIView,
+)
+
+MEALS_PER_DAY = 5
+ACTIVITIES_PER_DAY = 2
+BATCH_SIZE = 5000
+
+INDEXES = {
+    'meal_user_date_idx': (Meal._meta.db_table, 'user_id, date, id'),
+    'activity_user_date_idx': (Activity._meta.db_table, 'user_id, date, id'),
+}
+
+
+def seed(users, days):
+    # Wpisy użytkowników przeplatają się w tabeli, jak w produkcji - dane jednego użytkownika nie leżą obok siebie
+    rng = random.Random(0)
+    accounts = User.objects.bulk_create([User(username=f"bench{i}") for i in range(users)])
+    today = date.today()
+    meals, activities = [], []
+
+    for n in range(days):
+        day = today - timedelta(days=n)
+        for user in accounts:
+            meals += [Meal(user=user, meal=f"meal {rng.randrange(500)}", calories=rng.randrange(50, 900), date=day)
+                      for _ in range(MEALS_PER_DAY)]
+            activities += [Activity(user=user, activity_type='RUN', duration=30,
+                                    calories_burned=rng.randrange(100, 600), date=day)
+                           for _ in range(ACTIVITIES_PER_DAY)]
+        if len(meals) >= BATCH_SIZE:
+            Meal.objects.bulk_create(meals)
+            Activity.objects.bulk_create(activities)
+            meals, activities = [], []
+
+    Meal.objects.bulk_create(meals)
+    Activity.objects.bulk_create(activities)
+
+    # bulk_create nie wysyła sygnałów - dzienne sumy mierzonego użytkownika liczymy raz
+    user = accounts[len(accounts) // 2]
+    UserProfile.objects.create(user=user, weight=70, height=175, date_of_birth='1990-01-01', gender='M')
+    rebuild_daily_balances(user.id)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return user
+
+
+def hot_queries(user):
+    today = date.today()
+    month_ago = today - timedelta(days=30)
+    quarter_ago = today - timedelta(days=89)
+    return [
+        ("meals of a day", Meal.objects.filter(user=user, date=today)),
+        ("meals in range", Meal.objects.filter(user=user, date__range=[quarter_ago, today])),
+        ("activities in range", Activity.objects.filter(user=user, date__range=[quarter_ago, today])),
+        ("activity stats", Activity.objects.filter(user=user, date__range=[month_ago, today])
+            .values('activity_type').order_by().annotate()),
+        ("rollup refresh", Meal.objects.filter(user=user, date__in=[today, month_ago]).order_by().values('date')),
+    ]
+
+
+def query_plans(user):
+    plans = []
+    with connection.cursor() as cursor:
+        for label, queryset in hot_queries(user):
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plans.append((label, " | ".join(row[-1] for row in cursor.fetchall())))
+    return plans
+
+
+def endpoint_timings(user):
+    factory = APIRequestFactory()
+    today = date.today()
+    endpoints = [
+        ("daily-summary", DailySummaryAPIView.as_view(), {"date": today.isoformat()}),
+        ("meals-today", MealsTodayAPIView.as_view(), {}),
+        ("weekly-summary", WeeklySummaryAPIView.as_view(), {}),
+        ("range-summary 90d", RangeSummaryAPIView.as_view(),
+         {"start": (today - timedelta(days=89)).isoformat(), "end": today.isoformat()}),
+        ("activity-stats month", ActivityStatsAPIView.as_view(), {"range": "month"}),
+    ]
+
+    timings = []
+    for label, view, params in endpoints:
+        def call():
+            request = factory.get('/api/', params)
+            force_authenticate(request, user=user)
+            response = view(request)
+            assert response.status_code == 200, response.data
+        timings.append((label, timed(call)))
+    return timings
+
+
+def set_indexes(enabled):
+    with connection.cursor() as cursor:
+        for name, (table, columns) in INDEXES.items():
+            if enabled:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+            else:
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        cursor.execute("ANALYZE")
+
+
+def run(users, days):
+    user = seed(users, days)
+    print(f"{Meal.objects.count():,} meals, {Activity.objects.count():,} activities, {users} users\n")
+
+    results = {}
+    for enabled in (False, True):
+        set_indexes(enabled)
+        results[enabled] = (query_plans(user), endpoint_timings(user))
+
+    for enabled, title in ((False, "without (user, date) indexes"), (True, "with (user, date) indexes")):
+        print(f"query plans {title}:")
+        for label, plan in results[enabled][0]:
+            print(f"  {label:<20} {plan}")
+        print()
+
+    print_table(
+        ("endpoint", "before ms", "after ms", "speedup"),
+        [(label, f"{before:.2f}", f"{after:.2f}", f"{before / after:.1f}x")
+         for (label, before), (_, after) in zip(results[False][1], results[True][1])],
+    )
+
+
+if __name__ == '__main__':
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    with benchmark_database():
+        run(users, days)
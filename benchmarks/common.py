@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CalorieBalance.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+
+
+# --- Wspólne narzędzia benchmarków: tymczasowa baza SQLite w pliku (jak produkcyjna) i pomiar czasu ---
+
+@contextmanager
+def benchmark_database():
+    # Osobny plik bazy, żeby nie dotykać db.sqlite3 i żeby fsync przy commitach był realny
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmp) / 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def timed(fn, repeat=5):
+    # Najlepszy z `repeat` pomiarów w milisekundach
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers, *rows]:
+        print("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
@@ -1,14 +1,98 @@
-# Register your models here.
 from django.contrib import admin
-from .models import Meal, Activity, UserProfile
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import ValidationError
+from .models import Meal, Activity, UserProfile, ProfileMetrics
+from .sharding import PRIMARY, shard_aliases, sharding_enabled, user_shard, user_writes
+
+
+class ShardFilter(admin.SimpleListFilter):
+    # Lista zmian czyta jeden shard naraz (domyślnie primary)
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shard_aliases()]
+
+    def queryset(self, request, queryset):
+        return queryset.using(self.value()) if self.value() in shard_aliases() else queryset
+
+
+class UserDataAdmin(admin.ModelAdmin):
+    # Dane podzielone po użytkowniku: zapytania panelu mają jawną bazę albo użytkownika obiektu, a nie shard
+    # zalogowanego administratora
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        return [ShardFilter, *list_filter] if sharding_enabled() else list_filter
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(PRIMARY)
+
+    def get_actions(self, request):
+        # Usuwanie zaznaczonych zbiera powiązane obiekty bez użytkownika - przy shardingu tylko pojedynczo
+        actions = super().get_actions(request)
+        if sharding_enabled():
+            actions.pop('delete_selected', None)
+        return actions
+
+    def get_object(self, request, object_id, from_field=None):
+        queryset = super().get_queryset(request)
+        field = self.model._meta.pk if from_field is None else self.model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+        except (ValidationError, ValueError):
+            return None
+        # Id są unikalne między shardami - obiekt jest na jednym z nich
+        for alias in shard_aliases():
+            obj = queryset.using(alias).filter(**{field.name: object_id}).first()
+            if obj is not None:
+                return obj
+        return None
+
+    def _owner(self, request, object_id):
+        obj = self.get_object(request, unquote(object_id)) if object_id else None
+        if obj is not None:
+            return obj.user_id
+        return int(request.POST['user']) if request.POST.get('user', '').isdigit() else None
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # Walidacja formularza i sygnały zapisu czytają shard właściciela obiektu
+        with user_shard(self._owner(request, object_id)):
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        with user_writes(self._owner(request, object_id)):
+            return super().delete_view(request, object_id, extra_context)
+
+    def save_model(self, request, obj, form, change):
+        with user_writes(obj.user_id):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with user_writes(obj.user_id):
+            super().delete_model(request, obj)
+
 
 @admin.register(Meal)
-class MealAdmin(admin.ModelAdmin):
+class MealAdmin(UserDataAdmin):
     list_display = ['user', 'meal', 'calories', 'date']
     list_filter = ['date', 'user']
     search_fields = ['meal']
+    readonly_fields = ['raw_payload']
+
 
 @admin.register(Activity)
-class ActivityAdmin(admin.ModelAdmin):
+class ActivityAdmin(UserDataAdmin):
     list_display = ['user', 'get_activity_type_display', 'duration', 'calories_burned', 'date']
-    list_filter = ['activity_type', 'date', 'user']
\ No newline at end of file
+    list_filter = ['activity_type', 'date', 'user']
+
+
+@admin.register(ProfileMetrics)
+class ProfileMetricsAdmin(UserDataAdmin):
+    list_display = ['user', 'age', 'bmi', 'bmi_category', 'bmr', 'computed_at']
+    list_filter = ['bmi_category']
+    search_fields = ['user__username']
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(UserDataAdmin):
+    list_display = ['user', 'weight', 'height', 'date_of_birth', 'age']
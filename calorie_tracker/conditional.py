@@ -0,0 +1,49 @@
+import hashlib
+from datetime import date, datetime, time
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .summary_cache import get_summary_cache
+
+
+# --- Warunkowe GET-y (If-None-Match / If-Modified-Since) na podstawie wersji dni i profilu z summary_cache ---
+#
+# Walidatory liczymy z samych wersji w cache, więc odpowiedź 304 nie wykonuje żadnego zapytania podsumowania.
+
+def conditional(period):
+    # period(view, request) -> (start_date, end_date) danych, z których powstaje odpowiedź,
+    # albo None, gdy odpowiedź zależy tylko od profilu; ValueError - błędny zakres, widok sam zwróci 400
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            summary_cache = get_summary_cache()
+            try:
+                dates = period(self, request)
+            except ValueError:
+                return view_method(self, request, *args, **kwargs)
+            if not summary_cache.enabled:
+                # Wersje w cache jednego procesu nie są wspólnymi walidatorami
+                return view_method(self, request, *args, **kwargs)
+            today = date.today()
+            digest, last_modified = summary_cache.validators(request.user.id, *(dates or ()))
+            # Adres z parametrami i dzisiejsza data (wiek w PPM, zakresy "ostatnie 7 dni") też zmieniają odpowiedź -
+            # w ETagu wprost, a w Last-Modified jako najpóźniej północ dzisiejszego dnia
+            etag = quote_etag(hashlib.sha1(
+                f"{request.get_full_path()}|{today}|{digest}".encode()
+            ).hexdigest())
+            last_modified = max(last_modified, int(datetime.combine(today, time()).timestamp()))
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+                response.headers.setdefault('Last-Modified', http_date(last_modified))
+                # Dane są prywatne; klient może trzymać kopię, ale zawsze ją rewaliduje
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ('Authorization', 'Cookie'))
+            return response
+        return wrapper
+    return decorator
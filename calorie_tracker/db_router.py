@@ -0,0 +1,99 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .summary_cache import is_process_local
+
+
+# --- Router baz: zapisy na primary, ciężkie odczyty API i raportów na repliki ---
+#
+# Na replikę trafiają tylko odczyty wykonane w bloku replica_reads() (widoki podsumowań, statystyk, historii,
+# raportów) - logowanie, sesje, walidacja i wszystko w ścieżkach zapisu zostaje na primary. Po zapisie
+# użytkownik jest przez STICKY_SECONDS "przypięty" do primary, żeby zobaczył własne zmiany mimo opóźnienia
+# replikacji (read-your-writes). Przypięcia trzymamy w cache, więc działają między procesami - z cache procesu
+# (LocMem) inny worker nie widziałby przypięcia, więc wtedy wszystkie odczyty zostają na primary.
+
+PRIMARY = 'default'
+
+DEFAULT_SETTINGS = {
+    'ALIASES': [],  # aliasy z DATABASES tylko do odczytu
+    'STICKY_SECONDS': 10,
+    'CACHE_ALIAS': 'default',
+    'ALLOW_PROCESS_LOCAL': False,  # LocMem tylko przy jednym procesie (runserver, testy)
+}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def _settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'DB_REPLICAS', {})}
+
+
+def replica_aliases():
+    return list(_settings()['ALIASES'])
+
+
+def replica_reads_enabled():
+    options = _settings()
+    return bool(options['ALIASES']) and (
+        options['ALLOW_PROCESS_LOCAL'] or not is_process_local(options['CACHE_ALIAS'])
+    )
+
+
+def _pin_key(user_id):
+    return f"db:primary:{user_id}"
+
+
+def pin_to_primary(user_id):
+    options = _settings()
+    if replica_reads_enabled():
+        caches[options['CACHE_ALIAS']].set(_pin_key(user_id), True, timeout=options['STICKY_SECONDS'])
+
+
+def is_pinned(user_id):
+    options = _settings()
+    return replica_reads_enabled() and caches[options['CACHE_ALIAS']].get(_pin_key(user_id)) is not None
+
+
+@contextmanager
+def replica_reads(user_id=None):
+    # Odczyty w bloku idą na replikę, chyba że użytkownik niedawno coś zapisał
+    token = _replica_reads.set(not (user_id and is_pinned(user_id)))
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reads_from_replica(view_method):
+    # Dla metod APIView: get(self, request, ...)
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        with replica_reads(request.user.id):
+            return view_method(self, request, *args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and replica_reads_enabled():
+            return random.choice(replica_aliases())
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Repliki mają te same dane co primary
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Schemat replik pochodzi z primary (replikacja albo lokalnie sync_replicas)
+        return db not in replica_aliases()
@@ -0,0 +1,99 @@
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Meal, Activity, RawPayload
+from .pagination import keyset_page
+from .sharding import shard_for
+
+
+# --- Strumieniowy eksport całej historii posiłków i aktywności do CSV / JSONL (NDJSON), opcjonalnie gzip ---
+#
+# Wiersze czytamy stronami po (date, id) - jak w /api/meals/history/ - więc w pamięci jest zawsze co najwyżej
+# jedna paczka, niezależnie od tego, czy użytkownik ma 100 wierszy, czy 10 milionów. Kolumny pokrywają się
+# z tym, co przyjmuje import_history, więc eksport można zaimportować z powrotem.
+
+EXPORT_FIELDS = {
+    'meals': (Meal, ('id', 'date', 'meal', 'calories', 'protein', 'carbs', 'fat', 'serving_qty', 'serving_unit')),
+    'activities': (Activity, ('id', 'date', 'activity_type', 'duration', 'calories_burned', 'notes')),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+FORMAT_ALIASES = {'ndjson': 'jsonl'}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def iter_rows(user, kind, include_raw=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    model, fields = EXPORT_FIELDS[kind]
+    include_raw = include_raw and model is Meal
+    columns = fields + ('raw_payload__data',) if include_raw else fields
+    # Generator działa już po wyjściu z widoku (i z ShardMiddleware), więc shard wskazujemy wprost
+    queryset = model.objects.using(shard_for(user.id)).filter(user=user).values(*columns)
+
+    cursor = None
+    while True:
+        rows, cursor = keyset_page(queryset, cursor, chunk_size)
+        for row in rows:
+            if include_raw:
+                blob = row.pop('raw_payload__data')
+                row['raw_api_data'] = RawPayload.decode(blob) if blob is not None else None
+            yield row
+        if cursor is None:
+            return
+
+
+class _Line:
+    # csv.writer pisze do "pliku", który po prostu zwraca tekst wiersza
+    def write(self, value):
+        return value
+
+
+def iter_lines(rows, fmt, columns):
+    if fmt == 'csv':
+        writer = csv.writer(_Line())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(
+                json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                for value in (row.get(column) for column in columns)
+            )
+    else:
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def export_history(user, kind, fmt='csv', include_raw=False, compress=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Generator bajtów - do StreamingHttpResponse albo zapisu do pliku
+    _, fields = EXPORT_FIELDS[kind]
+    columns = fields + ('raw_api_data',) if include_raw and kind == 'meals' else fields
+    lines = iter_lines(iter_rows(user, kind, include_raw, chunk_size), fmt, columns)
+
+    buffer, size = [], 0
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31 -> nagłówek gzip
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        # Sklejamy wiersze w kawałki ~64 KB, żeby nie wysyłać tysięcy drobnych fragmentów
+        if size >= 65536:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_filename(kind, fmt, compress):
+    return f"{kind}.{fmt}{'.gz' if compress else ''}"
@@ -0,0 +1,282 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .models import Food
+from .query_parser import UNITS, normalize_query, parse_query, scaled_response
+
+
+# --- Lokalny indeks produktów: posortowane nazwy (prefiksy) + trigramy (literówki) w jednym pliku mmap ---
+#
+# Układ pliku (natywna kolejność bajtów, tablice uint32 poza food_ids):
+#   nagłówek:        magic, wersja, liczba nazw (n), liczba trigramów (t), długość listy postings (p)
+#   name_offsets:    n + 1 przesunięć w bloku nazw
+#   food_ids:        n kluczy Food.id (uint64, wyrównane do 8 bajtów), w kolejności posortowanych nazw
+#   trigram_keys:    t posortowanych crc32 trigramów
+#   trigram_offsets: t + 1 przesunięć w postings
+#   postings:        p pozycji nazw (rosnąco dla każdego trigramu)
+#   names:           znormalizowane nazwy w UTF-8, sklejone
+#
+# Plik jest tylko do odczytu i mapowany przez mmap, więc wszystkie procesy workerów dzielą te same strony.
+
+MAGIC = b'FIDX'
+VERSION = 2
+HEADER = struct.Struct('=4sIIII')
+
+# Trigramy występujące w większej liczbie nazw niż ten limit pomijamy, jeśli są rzadsze
+MAX_POSTINGS_PER_TRIGRAM = 20000
+MIN_SIMILARITY = 0.3
+
+
+def _padding(offset):
+    return -offset % 8
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_key(trigram):
+    return zlib.crc32(trigram.encode('utf-8'))
+
+
+def build_index(rows, path):
+    # rows: (food_id, znormalizowana nazwa) posortowane po nazwie
+    name_offsets = array('I', [0])
+    food_ids = array('Q')  # Food.id to BigAutoField
+    names = bytearray()
+    postings_by_key = {}
+
+    for position, (food_id, name) in enumerate(rows):
+        names += name.encode('utf-8')
+        name_offsets.append(len(names))
+        food_ids.append(food_id)
+        for trigram in trigrams(name):
+            postings_by_key.setdefault(trigram_key(trigram), array('I')).append(position)
+
+    trigram_keys = array('I', sorted(postings_by_key))
+    trigram_offsets = array('I', [0])
+    postings = array('I')
+    for key in trigram_keys:
+        postings.extend(postings_by_key[key])
+        trigram_offsets.append(len(postings))
+
+    # Zapis do pliku tymczasowego i podmiana - działające procesy dalej czytają starą wersję
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(food_ids), len(trigram_keys), len(postings)))
+        name_offsets.tofile(f)
+        f.write(b'\0' * _padding(f.tell()))
+        for part in (food_ids, trigram_keys, trigram_offsets, postings):
+            part.tofile(f)
+        f.write(names)
+    os.replace(tmp_path, path)
+    return len(food_ids)
+
+
+class FoodIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mtime = os.stat(path).st_mtime_ns
+
+        magic, version, n, t, p = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a food index (version {VERSION})")
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+
+        def take(count, fmt='I'):
+            nonlocal offset
+            size = count * struct.calcsize(fmt)
+            part = view[offset:offset + size].cast(fmt)
+            offset += size
+            return part
+
+        self.name_offsets = take(n + 1)
+        offset += _padding(offset)
+        self.food_ids = take(n, 'Q')
+        self.trigram_keys = take(t)
+        self.trigram_offsets = take(t + 1)
+        self.postings = take(p)
+        self.names = view[offset:]
+        self.size = n
+        self.readers = 0
+        self.retired = False
+
+    def name(self, position):
+        return bytes(self.names[self.name_offsets[position]:self.name_offsets[position + 1]]).decode('utf-8')
+
+    def _lower_bound(self, text):
+        return bisect_left(range(self.size), text, key=self.name)
+
+    def exact(self, query):
+        text = normalize_query(query)
+        position = self._lower_bound(text)
+        if position < self.size and self.name(position) == text:
+            return self.food_ids[position]
+        return None
+
+    def prefix(self, query, limit=10):
+        text = normalize_query(query)
+        results = []
+        position = self._lower_bound(text)
+        while position < self.size and len(results) < limit:
+            name = self.name(position)
+            if not name.startswith(text):
+                break
+            results.append((self.food_ids[position], name, 1.0))
+            position += 1
+        return results
+
+    def _postings(self, trigram):
+        key = trigram_key(trigram)
+        i = bisect_left(self.trigram_keys, key)
+        if i < len(self.trigram_keys) and self.trigram_keys[i] == key:
+            return self.postings[self.trigram_offsets[i]:self.trigram_offsets[i + 1]]
+        return None
+
+    def fuzzy(self, query, limit=10, min_similarity=MIN_SIMILARITY):
+        text = normalize_query(query)
+        query_trigrams = trigrams(text)
+        lists = sorted(filter(None, map(self._postings, query_trigrams)), key=len)
+        if not lists:
+            return []
+
+        # Bardzo częste trigramy (np. " ch") nic nie wnoszą do rankingu, a kosztują najwięcej
+        selected = [lst for lst in lists if len(lst) <= MAX_POSTINGS_PER_TRIGRAM] or lists[:1]
+        counts = Counter()
+        for lst in selected:
+            counts.update(lst)
+
+        scored = []
+        for position, common in counts.most_common(limit * 5):
+            # Podobieństwo Dice'a; liczba trigramów nazwy ~ długość nazwy + 1
+            name_length = self.name_offsets[position + 1] - self.name_offsets[position]
+            score = 2 * common / (len(query_trigrams) + name_length + 1)
+            if score >= min_similarity:
+                scored.append((score, position))
+        scored.sort(reverse=True)
+
+        return [(self.food_ids[position], self.name(position), round(score, 3))
+                for score, position in scored[:limit]]
+
+    def search(self, query, limit=10):
+        # Najpierw tanie dopasowanie prefiksu, resztę listy uzupełniamy wynikami rozmytymi
+        results = self.prefix(query, limit)
+        if len(results) < limit:
+            seen = {food_id for food_id, _, _ in results}
+            for item in self.fuzzy(query, limit):
+                if item[0] not in seen and len(results) < limit:
+                    results.append(item)
+        return results
+
+    def close(self):
+        for part in (self.name_offsets, self.food_ids, self.trigram_keys,
+                     self.trigram_offsets, self.postings, self.names):
+            part.release()
+        self._mmap.close()
+
+
+def index_path():
+    return str(getattr(settings, 'FOOD_INDEX_PATH', settings.BASE_DIR / 'food_index.bin'))
+
+
+def rebuild_food_index(path=None):
+    path = path or index_path()
+    rows = Food.objects.order_by('normalized_name', 'id').values_list('id', 'normalized_name')
+    return build_index(rows.iterator(chunk_size=5000), path)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_food_index():
+    # Indeks otwieramy leniwie i przeładowujemy, gdy komenda load_foods podmieni plik
+    global _index
+    path = index_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if _index is None or _index.path != path or _index.mtime != mtime:
+        with _index_lock:
+            if _index is None or _index.path != path or _index.mtime != mtime:
+                previous, _index = _index, FoodIndex(path)
+                if previous is not None:
+                    _retire(previous)
+    return _index
+
+
+def _retire(index):
+    # Starą mapę zamyka ostatni wątek, który jeszcze z niej czyta (open_food_index)
+    index.retired = True
+    if index.readers == 0:
+        index.close()
+
+
+@contextmanager
+def open_food_index():
+    # Indeks do odczytu w bloku with - podmiana pliku w tym czasie nie zamknie mapy pod spodem
+    if get_food_index() is None:
+        yield None
+        return
+    with _index_lock:
+        index = _index
+        index.readers += 1
+    try:
+        yield index
+    finally:
+        with _index_lock:
+            index.readers -= 1
+            if index.retired and index.readers == 0:
+                index.close()
+
+
+def local_nutrients(query):
+    # Odpowiedź w formacie Nutritionix dla produktu o dokładnie tej nazwie albo None
+    with open_food_index() as index:
+        food_id = index.exact(query) if index is not None else None
+    if food_id is None:
+        return None
+
+    food = Food.objects.filter(pk=food_id).first()
+    if food is None:
+        return None
+    return {"foods": [food.as_nutritionix()], "source": "local"}
+
+
+def _serving_factor(food, parsed):
+    # Ile porcji z bazy odpowiada zapytaniu - tylko przy zgodnej jednostce (albo gramach przy znanej wadze porcji)
+    unit = UNITS.get(normalize_query(food["serving_unit"]), normalize_query(food["serving_unit"]))
+    if parsed.unit in ('', unit) and food["serving_qty"]:
+        return parsed.quantity / food["serving_qty"]
+    if parsed.unit == 'g' and food["serving_weight_grams"]:
+        return parsed.quantity / food["serving_weight_grams"]
+    return None
+
+
+def approximate_nutrients(query):
+    # Zapas na czas awarii Nutritionix: produkt o dokładnie tej nazwie co w zapytaniu ("2 bananas" -> "banana"),
+    # przeliczony na żądaną ilość i oznaczony jako przybliżony. Podobne nazwy to często inny produkt - ich nie zgadujemy
+    parsed = parse_query(query)
+    if not parsed.scalable:
+        return None
+    data = local_nutrients(parsed.food)
+    factor = _serving_factor(data["foods"][0], parsed) if data is not None else None
+    if factor is None:
+        return None
+    return {**scaled_response(data["foods"][0], factor), "source": "local", "approximate": True}
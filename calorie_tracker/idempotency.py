@@ -0,0 +1,111 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .sharding import shard_aliases, shard_for
+
+
+# --- Obsługa nagłówka Idempotency-Key dla zapisów z aplikacji mobilnych (ponawiane POST-y) ---
+
+HEADER = 'Idempotency-Key'
+DEFAULT_TTL = 24 * 3600  # sekundy
+RESERVE_ATTEMPTS = 3
+
+
+def key_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL))
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode('utf-8')).hexdigest()
+
+
+def replay(record, request, fingerprint):
+    if record.path != request.path or record.fingerprint != fingerprint:
+        return Response(
+            {"error": f"{HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record.status_code is None:
+        return Response(
+            {"error": "A request with this Idempotency-Key is still being processed"},
+            status=status.HTTP_409_CONFLICT
+        )
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+
+        key = key.strip()
+        if not key or len(key) > 255:
+            return Response({"error": f"{HEADER} must be 1-255 characters"}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        now = timezone.now()
+        # Przeterminowany klucz nie blokuje ponownego użycia
+        IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__lte=now).delete()
+
+        db = shard_for(request.user.id)
+        for _ in range(RESERVE_ATTEMPTS):
+            with transaction.atomic(using=db):
+                # Rezerwacja klucza w tej samej transakcji co zapis: równoległa powtórka czeka na commit
+                # i dostaje IntegrityError, a wtedy odtwarzamy zapisaną odpowiedź
+                try:
+                    with transaction.atomic(using=db):
+                        record = IdempotencyKey.objects.create(
+                            user=request.user,
+                            key=key,
+                            path=request.path,
+                            fingerprint=fingerprint,
+                            expires_at=now + key_ttl(),
+                        )
+                except IntegrityError:
+                    record = None
+
+                if record is not None:
+                    response = view_method(self, request, *args, **kwargs)
+                    if response.status_code >= 500:
+                        # Błąd serwera - nic nie zapamiętujemy, klient może spróbować ponownie
+                        transaction.set_rollback(True, using=db)
+                        return response
+                    record.status_code = response.status_code
+                    record.response_body = response.data
+                    record.save(update_fields=['status_code', 'response_body'])
+                    return response
+
+            try:
+                return replay(IdempotencyKey.objects.get(user=request.user, key=key), request, fingerprint)
+            except IdempotencyKey.DoesNotExist:
+                # Równoległe pierwsze żądanie skończyło się 5xx i wycofało rezerwację - rezerwujemy od nowa
+                continue
+
+        return Response(
+            {"error": "A request with this Idempotency-Key is still being processed"},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    return wrapper
+
+
+def purge_expired_keys(now=None):
+    # Jedno DELETE po indeksie expires_at na każdym shardzie
+    now = now or timezone.now()
+    return sum(
+        IdempotencyKey.objects.using(alias).filter(expires_at__lte=now).delete()[0] for alias in shard_aliases()
+    )
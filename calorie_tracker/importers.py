@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Meal, Activity
+from .signals import daily_data_changed
+from .sharding import user_shard, user_writes
+
+
+# --- Strumieniowy import historii posiłków i aktywności z CSV / JSONL ---
+
+# Kolumny pliku -> pola modelu; dla posiłków akceptujemy też nazwy z Nutritionix
+MEAL_COLUMNS = {
+    'meal': ('meal', 'food_name'),
+    'calories': ('calories', 'nf_calories'),
+    'protein': ('protein', 'nf_protein'),
+    'carbs': ('carbs', 'nf_total_carbohydrate'),
+    'fat': ('fat', 'nf_total_fat'),
+    'serving_qty': ('serving_qty',),
+    'serving_unit': ('serving_unit',),
+    'date': ('date',),
+}
+
+ACTIVITY_COLUMNS = {
+    'activity_type': ('activity_type',),
+    'duration': ('duration',),
+    'calories_burned': ('calories_burned',),
+    'date': ('date',),
+    'notes': ('notes',),
+}
+
+KINDS = {
+    'meals': (Meal, MEAL_COLUMNS),
+    'activities': (Activity, ACTIVITY_COLUMNS),
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []  # {line, error}, maksymalnie MAX_REPORTED_ERRORS
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        return {
+            "processed": self.processed,
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def detect_format(filename):
+    return 'csv' if str(filename).lower().endswith('.csv') else 'jsonl'
+
+
+def iter_rows(stream, fmt):
+    # stream: plik binarny; zwraca (numer wiersza, słownik albo wyjątek) bez wczytywania całego pliku
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except UnicodeDecodeError:
+                # Dalej plik nie da się czytać - reszta wierszy nie zostanie zaimportowana
+                yield reader.line_num + 1, ValueError("File is not valid UTF-8")
+                return
+            except csv.Error as e:
+                yield reader.line_num, e
+                continue
+            yield reader.line_num, row
+    else:
+        line_number = 0
+        while True:
+            try:
+                line = next(text)
+            except StopIteration:
+                return
+            except UnicodeDecodeError:
+                yield line_number + 1, ValueError("File is not valid UTF-8")
+                return
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, e
+                continue
+            yield line_number, row
+
+
+def build_instance(model, columns, user, row):
+    if not isinstance(row, dict):
+        raise ValidationError("Row must be an object")
+
+    values = {}
+    for field, candidates in columns.items():
+        for column in candidates:
+            value = row.get(column)
+            if value not in (None, ''):
+                values[field] = value
+                break
+
+    instance = model(user=user, **values)
+    # Te same reguły co w formularzach i API; użytkownik jest znany, więc bez zapytania o FK
+    instance.full_clean(exclude=['user'], validate_unique=False)
+    return instance
+
+
+def import_history(user, stream, kind, fmt='jsonl', chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None):
+    with user_shard(user.id):
+        return _import_history(user, stream, kind, fmt, chunk_size, on_progress)
+
+
+def _import_history(user, stream, kind, fmt, chunk_size, on_progress):
+    model, columns = KINDS[kind]
+    result = ImportResult()
+    rows = iter_rows(stream, fmt)
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        instances = []
+        for line, row in chunk:
+            result.processed += 1
+            if isinstance(row, Exception):
+                result.add_error(line, str(row))
+                continue
+            try:
+                instances.append(build_instance(model, columns, user, row))
+            except ValidationError as e:
+                result.add_error(line, e.message_dict if hasattr(e, 'error_dict') else e.messages)
+
+        # Każda paczka w osobnej transakcji - pamięć i czas blokady bazy są stałe niezależnie od rozmiaru pliku
+        with user_writes(user.id) as db, transaction.atomic(using=db):
+            model.objects.bulk_create(instances)
+            # bulk_create pomija post_save, więc dzienne bilanse odświeżamy raz na paczkę
+            if instances:
+                daily_data_changed.send(sender=model, user_id=user.id, dates={i.date for i in instances})
+        result.created += len(instances)
+
+        if on_progress:
+            on_progress(result)
+
+    return result
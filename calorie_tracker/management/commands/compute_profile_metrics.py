@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from calorie_tracker.population import refresh_profile_metrics, population_report, engine, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Przelicza wiek, BMI i PPM wszystkich profili do tabeli ProfileMetrics"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--report', action='store_true', help="Wypisz raport po przeliczeniu")
+
+    def handle(self, *args, chunk_size, report=False, **options):
+        started = time.perf_counter()
+        total = refresh_profile_metrics(
+            chunk_size=chunk_size,
+            on_progress=lambda count: self.stdout.write(f"{count} profiles"),
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Computed metrics for {total} profiles in {elapsed:.2f} s ({engine()})"))
+
+        if report:
+            summary = population_report()
+            self.stdout.write(
+                f"avg age {summary['avg_age']}, avg BMI {summary['avg_bmi']}, avg BMR {summary['avg_bmr']}"
+            )
+            for row in summary['by_bmi_category']:
+                self.stdout.write(f"  {row['bmi_category'] or '-':<7} {row['profiles']:>8}  BMI {row['avg_bmi']}")
@@ -0,0 +1,40 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from calorie_tracker.exporters import EXPORT_FIELDS, FORMATS, DEFAULT_CHUNK_SIZE, export_history
+
+
+class Command(BaseCommand):
+    help = "Eksportuje historię posiłków lub aktywności użytkownika do CSV/JSONL (opcjonalnie gzip)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--kind', choices=sorted(EXPORT_FIELDS), required=True)
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--include-raw', action='store_true', help="Dołącz raw_api_data z Nutritionix")
+        parser.add_argument('--output', '-o', help="Plik wynikowy; domyślnie stdout")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, username, kind, format='csv', gzip=False, include_raw=False, output=None,
+               chunk_size=DEFAULT_CHUNK_SIZE, **options):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"User {username} does not exist")
+
+        chunks = export_history(user, kind, fmt=format, include_raw=include_raw, compress=gzip,
+                                chunk_size=chunk_size)
+        try:
+            if output:
+                with open(output, 'wb') as stream:
+                    written = sum(stream.write(chunk) for chunk in chunks)
+                self.stdout.write(self.style.SUCCESS(f"Exported {kind} to {output} ({written} bytes)"))
+            else:
+                for chunk in chunks:
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+        except OSError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from calorie_tracker.importers import KINDS, DEFAULT_CHUNK_SIZE, detect_format, import_history
+
+
+class Command(BaseCommand):
+    help = "Importuje historię posiłków lub aktywności użytkownika z pliku CSV/JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--kind', choices=sorted(KINDS), required=True)
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, username, path, kind, format=None, chunk_size=DEFAULT_CHUNK_SIZE, **options):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"User {username} does not exist")
+
+        def progress(result):
+            self.stdout.write(f"{result.processed} rows processed, {result.created} created, {result.failed} failed")
+
+        try:
+            with open(path, 'rb') as stream:
+                result = import_history(
+                    user, stream, kind, fmt=format or detect_format(path),
+                    chunk_size=chunk_size, on_progress=progress,
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created} {kind} ({result.failed} rows rejected)"
+        ))
@@ -0,0 +1,103 @@
+import csv
+import json
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from calorie_tracker.food_index import rebuild_food_index
+from calorie_tracker.models import Food
+from calorie_tracker.query_parser import normalize_query
+
+
+# Kolumny w formacie Nutritionix (jak w payloadzie AddMealAPIView) -> pola modelu Food
+COLUMNS = {
+    'name': ('food_name', 'name'),
+    'calories': ('nf_calories', 'calories'),
+    'protein': ('nf_protein', 'protein'),
+    'carbs': ('nf_total_carbohydrate', 'carbs'),
+    'fat': ('nf_total_fat', 'fat'),
+    'serving_qty': ('serving_qty',),
+    'serving_unit': ('serving_unit',),
+    'serving_weight_grams': ('serving_weight_grams',),
+}
+
+
+def read_rows(path, fmt):
+    with open(path, encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def pick(row, field):
+    for column in COLUMNS[field]:
+        value = row.get(column)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def to_food(row):
+    name = (pick(row, 'name') or '').strip()
+    calories = pick(row, 'calories')
+    if not name or calories is None:
+        raise ValueError("food_name and nf_calories are required")
+
+    weight = pick(row, 'serving_weight_grams')
+    return Food(
+        name=name[:200],
+        normalized_name=normalize_query(name)[:200],
+        calories=float(calories),
+        protein=float(pick(row, 'protein') or 0),
+        carbs=float(pick(row, 'carbs') or 0),
+        fat=float(pick(row, 'fat') or 0),
+        serving_qty=float(pick(row, 'serving_qty') or 1),
+        serving_unit=(pick(row, 'serving_unit') or '')[:50],
+        serving_weight_grams=float(weight) if weight is not None else None,
+    )
+
+
+class Command(BaseCommand):
+    help = "Ładuje lokalną bazę produktów z pliku CSV/JSONL i przebudowuje indeks wyszukiwania"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--replace', action='store_true', help="Usuń istniejące produkty przed importem")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, path, format=None, replace=False, batch_size=5000, **options):
+        fmt = format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        loaded = skipped = 0
+
+        try:
+            rows = read_rows(path, fmt)
+            with transaction.atomic():
+                if replace:
+                    Food.objects.all().delete()
+                line = 0
+                while True:
+                    chunk = list(islice(rows, batch_size))
+                    if not chunk:
+                        break
+                    foods = []
+                    for row in chunk:
+                        line += 1
+                        try:
+                            foods.append(to_food(row))
+                        except (ValueError, TypeError) as e:
+                            skipped += 1
+                            self.stderr.write(f"row {line}: {e}")
+                    Food.objects.bulk_create(foods)
+                    loaded += len(foods)
+        except (OSError, json.JSONDecodeError, csv.Error) as e:
+            raise CommandError(str(e))
+
+        indexed = rebuild_food_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {loaded} foods ({skipped} skipped), index has {indexed} entries"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from calorie_tracker.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Usuwa przeterminowane klucze Idempotency-Key (do uruchamiania z crona)"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired idempotency keys"))
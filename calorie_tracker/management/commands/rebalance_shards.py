@@ -0,0 +1,78 @@
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from calorie_tracker.models import UserShard
+from calorie_tracker.rollups import rebuild_daily_balances
+from calorie_tracker.sharding import (
+    PRIMARY, shard_aliases, shard_for, hashed_shard, move_user, sweep_strays, shard_report, sharding_enabled,
+    ShardConflict, UserMoving,
+)
+
+
+class Command(BaseCommand):
+    help = "Przenosi dane użytkowników między shardami bez wyłączania aplikacji"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Użytkownicy do przeniesienia na --to")
+        parser.add_argument('--to', help="Docelowy shard (alias z DATABASES)")
+        parser.add_argument('--rehash', action='store_true',
+                            help="Przenieś użytkowników, których shard różni się od wyliczonego z hasha "
+                                 "(np. po dodaniu sharda albo użytkowników sprzed włączenia shardingu)")
+        parser.add_argument('--limit', type=int, help="Najwyżej tylu użytkowników w jednym przebiegu (--rehash)")
+        parser.add_argument('--sweep', action='store_true',
+                            help="Dosyła zapisy, które trafiły na stary shard w trakcie przenoszenia")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            self.rebalance(**options)
+        except (ImproperlyConfigured, ShardConflict, UserMoving) as e:
+            raise CommandError(str(e))
+
+    def rebalance(self, usernames, to=None, rehash=False, limit=None, sweep=False, chunk_size=2000, **options):
+        if not sharding_enabled():
+            raise CommandError("Sharding is not configured (set CALORIE_DB_SHARDS)")
+        if usernames and to not in shard_aliases():
+            raise CommandError(f"--to must be one of: {', '.join(shard_aliases())}")
+
+        moves = []
+        if usernames:
+            users = dict(User.objects.using(PRIMARY).filter(username__in=usernames).values_list('username', 'id'))
+            missing = set(usernames) - set(users)
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+            moves = [(users[username], to) for username in usernames]
+        elif rehash:
+            user_ids = User.objects.using(PRIMARY).order_by('id').values_list('id', flat=True).iterator()
+            moves = list(islice(
+                ((user_id, hashed_shard(user_id)) for user_id in user_ids
+                 if shard_for(user_id) != hashed_shard(user_id)),
+                limit,
+            ))
+
+        for user_id, target in moves:
+            source = shard_for(user_id)
+            started = time.perf_counter()
+            delta = move_user(user_id, target, chunk_size=chunk_size)
+            self.stdout.write(
+                f"user {user_id}: {source} -> {target} in {time.perf_counter() - started:.2f} s "
+                f"({delta} rows re-synced under lock)"
+            )
+
+        if sweep:
+            for user_id, rows in sweep_strays(chunk_size=chunk_size).items():
+                rebuild_daily_balances(user_id)
+                self.stdout.write(f"user {user_id}: {rows} stray rows moved to {shard_for(user_id)}")
+
+        for row in shard_report():
+            self.stdout.write(
+                f"{row['alias']:<10} users {row['assigned_users']:>7}  profiles {row['profiles']:>7}  "
+                f"meals {row['meals']:>9}  activities {row['activities']:>9}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {len(moves)} users ({UserShard.objects.using(PRIMARY).count()} with explicit shard)"
+        ))
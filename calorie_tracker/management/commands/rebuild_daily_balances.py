@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from calorie_tracker.rollups import rebuild_daily_balances
+
+
+class Command(BaseCommand):
+    help = "Przelicza od zera tabelę DailyBalance (wszyscy użytkownicy albo wskazani)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*')
+
+    def handle(self, *args, usernames, **options):
+        users = User.objects.order_by('id')
+        if usernames:
+            users = users.filter(username__in=usernames)
+            missing = set(usernames) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        total = 0
+        for user_id, username in users.values_list('id', 'username').iterator():
+            days = rebuild_daily_balances(user_id)
+            total += days
+            self.stdout.write(f"{username}: {days} days")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} daily balances"))
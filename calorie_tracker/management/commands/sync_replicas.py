@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from calorie_tracker.db_router import PRIMARY, replica_aliases
+
+
+class Command(BaseCommand):
+    help = "Kopiuje bazę primary do lokalnych replik SQLite (CALORIE_DB_REPLICAS) - do testów routera"
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError("No replicas configured (set CALORIE_DB_REPLICAS)")
+
+        primary = connections[PRIMARY]
+        for alias in [PRIMARY, *aliases]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"{alias} is not SQLite - real replicas are fed by database replication")
+
+        primary.ensure_connection()
+        for alias in aliases:
+            replica = connections[alias]
+            replica.close()
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                # Backup API SQLite - spójna kopia także przy równoległych zapisach
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f"{alias} <- {PRIMARY} ({replica.settings_dict['NAME']})"))
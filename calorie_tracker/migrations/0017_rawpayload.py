@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:18
+
+import hashlib
+import json
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def encode(payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(canonical).hexdigest(), zlib.compress(canonical, 6)
+
+
+def move_raw_api_data(apps, schema_editor):
+    # Przenosimy raw_api_data do RawPayload paczkami po id, żeby nie ładować całej tabeli naraz
+    Meal = apps.get_model('calorie_tracker', 'Meal')
+    RawPayload = apps.get_model('calorie_tracker', 'RawPayload')
+    db = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        meals = list(
+            Meal.objects.using(db).filter(id__gt=last_id, raw_api_data__isnull=False)
+            .order_by('id')
+            .only('id', 'raw_api_data')[:BATCH_SIZE]
+        )
+        if not meals:
+            break
+        payloads = {}
+        for meal in meals:
+            digest, blob = encode(meal.raw_api_data)
+            payloads[digest] = blob
+            meal.raw_payload_id = digest
+        RawPayload.objects.using(db).bulk_create(
+            [RawPayload(digest=digest, data=blob) for digest, blob in payloads.items()],
+            ignore_conflicts=True,
+        )
+        Meal.objects.using(db).bulk_update(meals, ['raw_payload'])
+        last_id = meals[-1].id
+
+
+def restore_raw_api_data(apps, schema_editor):
+    Meal = apps.get_model('calorie_tracker', 'Meal')
+    RawPayload = apps.get_model('calorie_tracker', 'RawPayload')
+    db = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        meals = list(
+            Meal.objects.using(db).filter(id__gt=last_id, raw_payload__isnull=False)
+            .order_by('id')
+            .only('id', 'raw_payload')[:BATCH_SIZE]
+        )
+        if not meals:
+            break
+        blobs = RawPayload.objects.using(db).in_bulk({meal.raw_payload_id for meal in meals})
+        for meal in meals:
+            meal.raw_api_data = json.loads(zlib.decompress(blobs[meal.raw_payload_id].data))
+        Meal.objects.using(db).bulk_update(meals, ['raw_api_data'])
+        last_id = meals[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_tracker', '0016_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawPayload',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='raw_payload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='calorie_tracker.rawpayload'),
+        ),
+        migrations.RunPython(move_raw_api_data, restore_raw_api_data),
+        migrations.RemoveField(
+            model_name='meal',
+            name='raw_api_data',
+        ),
+    ]
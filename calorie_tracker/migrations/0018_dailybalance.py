@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum, Count
+
+
+def fill_daily_balances(apps, schema_editor):
+    # Jednorazowe wypełnienie tabeli z istniejących danych (później: manage.py rebuild_daily_balances)
+    Meal = apps.get_model('calorie_tracker', 'Meal')
+    Activity = apps.get_model('calorie_tracker', 'Activity')
+    DailyBalance = apps.get_model('calorie_tracker', 'DailyBalance')
+    db = schema_editor.connection.alias
+
+    balances = {}
+
+    def balance(user_id, day):
+        if (user_id, day) not in balances:
+            balances[user_id, day] = DailyBalance(user_id=user_id, date=day)
+        return balances[user_id, day]
+
+    meals = Meal.objects.using(db).order_by().values('user_id', 'date').annotate(
+        eaten_kcal=Sum('calories'), protein=Sum('protein'), carbs=Sum('carbs'), fat=Sum('fat'),
+        meal_count=Count('id'),
+    )
+    activities = Activity.objects.using(db).order_by().values('user_id', 'date').annotate(
+        burned_kcal=Sum('calories_burned'), activity_minutes=Sum('duration'), activity_count=Count('id'),
+    )
+    for row in [*meals, *activities]:
+        target = balance(row.pop('user_id'), row.pop('date'))
+        for field, value in row.items():
+            setattr(target, field, value or 0)
+
+    DailyBalance.objects.using(db).bulk_create(balances.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_tracker', '0017_rawpayload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('eaten_kcal', models.FloatField(default=0)),
+                ('burned_kcal', models.PositiveIntegerField(default=0)),
+                ('protein', models.FloatField(default=0)),
+                ('carbs', models.FloatField(default=0)),
+                ('fat', models.FloatField(default=0)),
+                ('activity_minutes', models.PositiveIntegerField(default=0)),
+                ('meal_count', models.PositiveIntegerField(default=0)),
+                ('activity_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_balance_per_user')],
+            },
+        ),
+        migrations.RunPython(fill_daily_balances, migrations.RunPython.noop),
+    ]
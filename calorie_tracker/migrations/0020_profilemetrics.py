@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_tracker', '0019_user_date_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('age', models.PositiveSmallIntegerField(null=True)),
+                ('bmi', models.FloatField(null=True)),
+                ('bmi_category', models.CharField(choices=[('UNDER', 'Niedowaga'), ('NORMAL', 'Waga prawidłowa'), ('OVER', 'Nadwaga'), ('OBESE', 'Otyłość')], db_index=True, max_length=6, null=True)),
+                ('bmr', models.FloatField(null=True)),
+                ('computed_at', models.DateTimeField()),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile_metrics', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
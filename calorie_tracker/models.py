@@ -1,9 +1,94 @@
+import hashlib
+import json
+import zlib
 from django.db import models
 from django.contrib.auth.models import User
 from datetime import date
-from django.contrib import admin
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
-class Meal(models.Model):
+class RawPayload(models.Model):
+    # Surowe odpowiedzi Nutritionix adresowane treścią: jeden skompresowany wiersz na unikalny payload
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+
+    def __str__(self):
+        return self.digest
+
+    @staticmethod
+    def encode(payload):
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        return hashlib.sha256(canonical).hexdigest(), zlib.compress(canonical, 6)
+
+    @staticmethod
+    def decode(blob):
+        # Także dla samej kolumny data czytanej przez values() (bez tworzenia obiektu)
+        return json.loads(zlib.decompress(blob))
+
+    def decoded(self):
+        return self.decode(self.data)
+
+    @classmethod
+    def store_pending(cls, meals, using=None):
+        # Zapisuje payloady ustawione przez Meal.raw_api_data (jeden INSERT ... ON CONFLICT DO NOTHING)
+        # w tej samej bazie co posiłki (przy shardingu - shard ich użytkownika)
+        pending = {}
+        for meal in meals:
+            encoded = meal.__dict__.pop('_pending_raw_payload', None)
+            if encoded is not None:
+                pending[encoded[0]] = encoded[1]
+        if pending:
+            cls.objects.db_manager(using, hints={'instance': meals[0]}).bulk_create(
+                [cls(digest=digest, data=blob) for digest, blob in pending.items()],
+                ignore_conflicts=True,
+            )
+
+
+class UserDataQuerySet(models.QuerySet):
+    # Dane podzielone po użytkowniku (sharding.py): zapis bez .using() idzie na shard użytkownika obiektu
+    def _insert_db(self, objs):
+        if objs and self._db is None:
+            self._add_hints(instance=objs[0])
+        self._for_write = True
+        return self.db
+
+    def create(self, **kwargs):
+        # QuerySet.create nie przekazuje routerowi obiektu - save() bez using wybiera bazę po nim
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .sharding import allocate_ids
+
+        objs = list(objs)
+        allocate_ids([obj for obj in objs if obj.pk is None], using=self._insert_db(objs))
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class UserData(models.Model):
+    objects = UserDataQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from .sharding import allocate_ids
+
+        if self._state.adding and self.pk is None and allocate_ids([self], using=kwargs.get('using')):
+            kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
+
+
+class MealQuerySet(UserDataQuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        RawPayload.store_pending(objs, using=self._insert_db(objs))
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class Meal(UserData):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     calories = models.FloatField()
     meal = models.CharField(max_length=100)
@@ -13,16 +98,60 @@ class Meal(models.Model):
     serving_qty = models.FloatField(default=0)
     serving_unit = models.CharField(max_length=50, blank=True)
     date = models.DateField()
-    raw_api_data = models.JSONField(null=True, blank=True)
+    raw_payload = models.ForeignKey(RawPayload, null=True, blank=True, on_delete=models.SET_NULL)
+
+    objects = MealQuerySet.as_manager()
 
     class Meta:
         ordering = ['-date', '-id']  # Domyślne sortowanie
+        indexes = [
+            # Wszystkie podsumowania filtrują po (user, date) i sortują jak `ordering`
+            models.Index(fields=['user', 'date', 'id'], name='meal_user_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.meal} ({self.date}): {self.calories} kcal"
 
+    @property
+    def raw_api_data(self):
+        # Odczyt przez raw_payload - przy listach używaj select_related('raw_payload')
+        if '_raw_api_data' not in self.__dict__:
+            self._raw_api_data = self.raw_payload.decoded() if self.raw_payload_id else None
+        return self._raw_api_data
+
+    @raw_api_data.setter
+    def raw_api_data(self, payload):
+        self._raw_api_data = payload
+        if payload is None:
+            self.raw_payload_id = None
+            self.__dict__.pop('_pending_raw_payload', None)
+        else:
+            digest, blob = RawPayload.encode(payload)
+            self.raw_payload_id = digest
+            self._pending_raw_payload = (digest, blob)
+
+    def save(self, *args, **kwargs):
+        RawPayload.store_pending([self], using=kwargs.get('using'))
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_nutritionix(cls, user, food, meal_date):
+        # Posiłek z pojedynczego produktu w formacie Nutritionix (bez zapisu do bazy)
+        return cls(
+            user=user,
+            meal=food.get("food_name", ""),
+            calories=food.get("nf_calories", 0),
+            protein=food.get("nf_protein", 0),
+            carbs=food.get("nf_total_carbohydrate", 0),
+            fat=food.get("nf_total_fat", 0),
+            serving_qty=food.get("serving_qty", 0),
+            serving_unit=food.get("serving_unit", ""),
+            raw_api_data=food,
+            date=meal_date
+        )
+
 
-class Activity(models.Model):
+class Activity(UserData):
     ACTIVITY_CHOICES = [
         ('RUN', 'Bieganie'),
         ('SWIM', 'Pływanie'),
@@ -45,10 +174,15 @@ class Activity(models.Model):
     date = models.DateField()
     notes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], name='activity_user_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.get_activity_type_display()} - {self.duration}min, {self.calories_burned} kcal"
 
-class UserProfile(models.Model):
+class UserProfile(UserData):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     first_name = models.CharField(max_length=30, blank=True)
     last_name = models.CharField(max_length=30, blank=True)
@@ -91,6 +225,128 @@ class UserProfile(models.Model):
     def gender_display(self):
         return self.get_gender_display()
 
-@admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'weight', 'height', 'date_of_birth', 'age']
\ No newline at end of file
+class DailyBalance(UserData):
+    # Dzienne sumy użytkownika utrzymywane przez sygnały (signals.py) - podsumowania nie skanują posiłków
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    eaten_kcal = models.FloatField(default=0)
+    burned_kcal = models.PositiveIntegerField(default=0)
+    protein = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    activity_minutes = models.PositiveIntegerField(default=0)
+    meal_count = models.PositiveIntegerField(default=0)
+    activity_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_balance_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.date}: +{self.eaten_kcal} / -{self.burned_kcal} kcal"
+
+
+class NutrientCacheEntry(models.Model):
+    # Trwała warstwa cache odpowiedzi Nutritionix (klucz = hash znormalizowanego zapytania)
+    key = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+    hit_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.query} (do {self.expires_at:%Y-%m-%d %H:%M})"
+
+
+class Food(models.Model):
+    # Lokalna baza produktów ładowana z pliku (komenda load_foods), wartości na porcję
+    name = models.CharField(max_length=200)
+    normalized_name = models.CharField(max_length=200, db_index=True)
+    calories = models.FloatField()
+    protein = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    serving_qty = models.FloatField(default=1)
+    serving_unit = models.CharField(max_length=50, blank=True)
+    serving_weight_grams = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.calories} kcal / {self.serving_qty} {self.serving_unit}"
+
+    def as_nutritionix(self):
+        return {
+            "food_name": self.name,
+            "nf_calories": self.calories,
+            "nf_protein": self.protein,
+            "nf_total_carbohydrate": self.carbs,
+            "nf_total_fat": self.fat,
+            "serving_qty": self.serving_qty,
+            "serving_unit": self.serving_unit,
+            "serving_weight_grams": self.serving_weight_grams,
+        }
+
+
+class IdempotencyKey(UserData):
+    # Zapamiętana odpowiedź na zapis z nagłówkiem Idempotency-Key - powtórki dostają ją bez ponownego zapisu
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.key} ({self.path})"
+
+
+class UserShard(models.Model):
+    # Przypisanie użytkownika do sharda (sharding.py); użytkownicy sprzed włączenia shardingu nie mają wpisu
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=50, db_index=True)
+    moved_at = models.DateTimeField(null=True, blank=True)
+    moving = models.BooleanField(default=False)  # w trakcie move_user - zapisy użytkownika są odrzucane
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.alias}"
+
+
+class IdSequence(models.Model):
+    # Liczniki id tabel danych użytkowników na shardzie SQLite (sharding.allocate_ids) - AUTOINCREMENT
+    # liczy od max(id), a wiersze przeniesione z innego sharda mają id z jego zakresu
+    table = models.CharField(max_length=100, primary_key=True)
+    next_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.table}: {self.next_id}"
+
+
+class ProfileMetrics(UserData):
+    # Wiek, BMI i PPM wszystkich profili liczone hurtowo (population.py) - raporty nie iterują po UserProfile
+    BMI_CATEGORY_CHOICES = [
+        ('UNDER', 'Niedowaga'),
+        ('NORMAL', 'Waga prawidłowa'),
+        ('OVER', 'Nadwaga'),
+        ('OBESE', 'Otyłość'),
+    ]
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile_metrics')
+    age = models.PositiveSmallIntegerField(null=True)
+    bmi = models.FloatField(null=True)
+    bmi_category = models.CharField(max_length=6, choices=BMI_CATEGORY_CHOICES, null=True, db_index=True)
+    bmr = models.FloatField(null=True)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user}: BMI {self.bmi}, PPM {self.bmr}"
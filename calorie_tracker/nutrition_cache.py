@@ -0,0 +1,296 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .food_index import local_nutrients, approximate_nutrients
+from .models import NutrientCacheEntry
+from .nutritionix import NutritionixError
+from .query_parser import normalize_query, parse_query, per_unit_key, per_unit_food, scaled_response
+
+
+# --- Cache odpowiedzi Nutritionix: LRU w pamięci procesu + trwała tabela w bazie ---
+
+DEFAULT_SETTINGS = {
+    'TTL': 7 * 24 * 3600,     # sekundy
+    'MEMORY_SIZE': 1024,      # liczba wpisów w LRU procesu
+    'MAX_ENTRIES': 50000,     # limit wierszy w tabeli NutrientCacheEntry
+    'PRUNE_EVERY': 100,       # co ile zapisów sprawdzamy limit tabeli
+}
+
+
+def cache_key(normalized):
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class NutrientCache:
+    def __init__(self, ttl, memory_size, max_entries, prune_every):
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._memory = OrderedDict()  # key -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_SETTINGS, **getattr(settings, 'NUTRITIONIX_CACHE', {})}
+        return cls(
+            ttl=options['TTL'],
+            memory_size=options['MEMORY_SIZE'],
+            max_entries=options['MAX_ENTRIES'],
+            prune_every=options['PRUNE_EVERY'],
+        )
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def get(self, query, record_miss=True):
+        normalized = normalize_query(query)
+        key = cache_key(normalized)
+        now = time.time()
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                expires_at, payload = cached
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return payload
+                del self._memory[key]
+
+        entry = (
+            NutrientCacheEntry.objects
+            .filter(key=key, expires_at__gt=timezone.now())
+            .values('payload', 'expires_at')
+            .first()
+        )
+        if entry is None:
+            if record_miss:
+                self._count('misses')
+            return None
+
+        NutrientCacheEntry.objects.filter(key=key).update(
+            hit_count=F('hit_count') + 1,
+            last_used=timezone.now(),
+        )
+        self._remember(key, entry['expires_at'].timestamp(), entry['payload'])
+        self._count('db_hits')
+        return entry['payload']
+
+    def set(self, query, payload):
+        normalized = normalize_query(query)
+        key = cache_key(normalized)
+        expires_at = timezone.now() + timedelta(seconds=self.ttl)
+
+        NutrientCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'query': normalized,
+                'payload': payload,
+                'expires_at': expires_at,
+                'last_used': timezone.now(),
+            },
+        )
+        self._remember(key, expires_at.timestamp(), payload)
+
+        with self._lock:
+            self.counters['stores'] += 1
+            self._writes += 1
+            should_prune = self._writes % self.prune_every == 0
+        if should_prune:
+            self.prune()
+
+    def _remember(self, key, expires_at, payload):
+        with self._lock:
+            self._memory[key] = (expires_at, payload)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def prune(self):
+        # Usuwamy przeterminowane wpisy, a potem najdawniej używane ponad limit
+        removed, _ = NutrientCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+        overflow = NutrientCacheEntry.objects.count() - self.max_entries
+        if overflow > 0:
+            stale_ids = list(
+                NutrientCacheEntry.objects.order_by('last_used').values_list('id', flat=True)[:overflow]
+            )
+            extra, _ = NutrientCacheEntry.objects.filter(id__in=stale_ids).delete()
+            removed += extra
+        self._count('evictions', removed)
+        return removed
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['memory_entries'] = len(self._memory)
+        lookups = counters['memory_hits'] + counters['db_hits'] + counters['misses']
+        counters['hit_ratio'] = (
+            round((counters['memory_hits'] + counters['db_hits']) / lookups, 4) if lookups else None
+        )
+        return counters
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Łączy równoległe wywołania z tym samym kluczem: liczy tylko pierwsze, reszta czeka na jego wynik
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.counters['executed'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['in_flight'] = len(self._calls)
+        return counters
+
+
+single_flight = SingleFlight()
+
+
+def cached_nutrients(query, parsed=None):
+    # Dla pojedynczego produktu szukamy faktów "na jednostkę" i skalujemy je lokalnie do żądanej ilości,
+    # więc "1 egg", "2 eggs" i "3 eggs" korzystają z jednego wpisu
+    cache = get_nutrient_cache()
+    parsed = parsed or parse_query(query)
+    if parsed.scalable:
+        per_unit = cache.get(per_unit_key(parsed), record_miss=False)
+        if per_unit is not None:
+            return scaled_response(per_unit, parsed.quantity)
+    return cache.get(query)
+
+
+def store_nutrients(query, data, parsed=None):
+    cache = get_nutrient_cache()
+    parsed = parsed or parse_query(query)
+    per_unit = per_unit_food(data, parsed)
+    if per_unit is not None:
+        cache.set(per_unit_key(parsed), per_unit)
+    else:
+        cache.set(query, data)
+
+
+def known_nutrients(query, parsed=None):
+    # Bez sieci: popularne produkty z lokalnej bazy, potem cache (LRU procesu -> tabela w bazie)
+    local = local_nutrients(query)
+    return local if local is not None else cached_nutrients(query, parsed)
+
+
+def lookup_nutrients(query, fetch):
+    # lokalna baza / cache -> (jedno wspólne) zapytanie do upstreamu -> zapis do cache
+    parsed = parse_query(query)
+    known = known_nutrients(query, parsed)
+    if known is not None:
+        return known
+
+    def load():
+        data = fetch(query)
+        store_nutrients(query, data, parsed)
+        return data
+
+    return single_flight.do(cache_key(normalize_query(query)), load)
+
+
+def lookup_many(queries, fetch, max_workers):
+    # Trafienia z lokalnej bazy i cache obsługujemy od razu, chybienia idą równolegle do upstreamu
+    # (max_workers naraz). Wątki robią tylko HTTP - zapis do cache i bazy zostaje w wątku żądania.
+    results = [None] * len(queries)
+    misses = {}  # znormalizowane zapytanie -> indeksy w `queries`
+
+    for i, query in enumerate(queries):
+        known = known_nutrients(query)
+        if known is not None:
+            results[i] = {"query": query, "data": known}
+        else:
+            misses.setdefault(normalize_query(query), []).append(i)
+
+    if misses:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(misses))) as pool:
+            futures = {
+                normalized: pool.submit(single_flight.do, cache_key(normalized), lambda q=queries[indices[0]]: fetch(q))
+                for normalized, indices in misses.items()
+            }
+            for normalized, future in futures.items():
+                try:
+                    data = future.result()
+                except NutritionixError as e:
+                    # Jak w pojedynczym wyszukiwaniu: przybliżenie z lokalnej bazy albo błąd pozycji
+                    fallback = approximate_nutrients(queries[misses[normalized][0]])
+                    item = {"data": fallback} if fallback is not None else {"error": str(e)}
+                except Exception as e:
+                    item = {"error": str(e)}
+                else:
+                    store_nutrients(normalized, data)
+                    item = {"data": data}
+                for i in misses[normalized]:
+                    results[i] = {"query": queries[i], **item}
+
+    return results
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_nutrient_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = NutrientCache.from_settings()
+    return _cache
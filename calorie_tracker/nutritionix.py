@@ -0,0 +1,191 @@
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+# --- Współdzielony klient Nutritionix: pula połączeń, timeouty, retry, circuit breaker ---
+
+DEFAULT_SETTINGS = {
+    'BASE_URL': 'https://trackapi.nutritionix.com',
+    'APP_ID': '',
+    'APP_KEY': '',
+    'CONNECT_TIMEOUT': 3.05,   # sekundy
+    'READ_TIMEOUT': 10,
+    'RETRIES': 2,              # dodatkowe próby po pierwszej
+    'BACKOFF': 0.3,            # bazowe opóźnienie (s), rośnie wykładniczo z jitterem
+    'MAX_BACKOFF': 5,
+    'POOL_SIZE': 10,
+    'BREAKER_THRESHOLD': 5,    # kolejne porażki, po których odcinamy upstream
+    'BREAKER_RESET': 30,       # po ilu sekundach przepuszczamy próbne zapytanie
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class NutritionixError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(NutritionixError):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == self.HALF_OPEN:
+                # Przepuszczamy jedno próbne zapytanie, kolejne czekają na jego wynik
+                self.opened_at = self.clock()
+                return True
+            return state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class NutritionixClient:
+    def __init__(self, app_id, app_key, base_url=DEFAULT_SETTINGS['BASE_URL'],
+                 connect_timeout=DEFAULT_SETTINGS['CONNECT_TIMEOUT'],
+                 read_timeout=DEFAULT_SETTINGS['READ_TIMEOUT'],
+                 retries=DEFAULT_SETTINGS['RETRIES'], backoff=DEFAULT_SETTINGS['BACKOFF'],
+                 max_backoff=DEFAULT_SETTINGS['MAX_BACKOFF'], pool_size=DEFAULT_SETTINGS['POOL_SIZE'],
+                 breaker=None, transport=None, sleep=time.sleep):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {
+            "x-app-id": app_id,
+            "x-app-key": app_key,
+            "Content-Type": "application/json",
+        }
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker(
+            DEFAULT_SETTINGS['BREAKER_THRESHOLD'], DEFAULT_SETTINGS['BREAKER_RESET']
+        )
+        # transport: dowolny obiekt z metodą post(url, json=, headers=, timeout=) jak requests.Session
+        self.transport = transport or self._build_session(pool_size)
+        self.sleep = sleep
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        options = {**DEFAULT_SETTINGS, **getattr(settings, 'NUTRITIONIX', {})}
+        kwargs = dict(
+            app_id=options['APP_ID'],
+            app_key=options['APP_KEY'],
+            base_url=options['BASE_URL'],
+            connect_timeout=options['CONNECT_TIMEOUT'],
+            read_timeout=options['READ_TIMEOUT'],
+            retries=options['RETRIES'],
+            backoff=options['BACKOFF'],
+            max_backoff=options['MAX_BACKOFF'],
+            pool_size=options['POOL_SIZE'],
+            breaker=CircuitBreaker(options['BREAKER_THRESHOLD'], options['BREAKER_RESET']),
+        )
+        kwargs.update(overrides)
+        return cls(**kwargs)
+
+    @staticmethod
+    def _build_session(pool_size):
+        session = requests.Session()
+        # Retry robimy sami (z jitterem), więc adapter nie ponawia zapytań
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _delay(self, attempt, response=None):
+        if response is not None and response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        # "Full jitter": losowe opóźnienie z przedziału [0, backoff * 2^attempt]
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def post(self, path, payload):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Nutritionix is temporarily unavailable", status_code=503)
+
+        url = f"{self.base_url}{path}"
+        last_error = None
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = self.transport.post(url, json=payload, headers=self.headers, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                # Także RetryError, ChunkedEncodingError itp. - każdy błąd transportu liczy się do breakera
+                last_error = NutritionixError(str(e))
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                last_error = NutritionixError(
+                    f"Nutritionix returned HTTP {response.status_code}", status_code=response.status_code
+                )
+            if attempt < self.retries:
+                self.sleep(self._delay(attempt, response))
+        else:
+            self.breaker.record_failure()
+            raise last_error
+
+        # Odpowiedź dotarła, więc upstream żyje - błędy 4xx nie otwierają breakera
+        self.breaker.record_success()
+        try:
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise NutritionixError(str(e), status_code=response.status_code) from e
+
+    def natural_nutrients(self, query):
+        return self.post("/v2/natural/nutrients", {"query": query})
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_nutritionix_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = NutritionixClient.from_settings()
+    return _client
@@ -0,0 +1,51 @@
+import base64
+import binascii
+from datetime import date
+
+
+# --- Stronicowanie kluczem (keyset) po (date, id), malejąco - zgodnie z Meal.Meta.ordering ---
+#
+# Kursor wskazuje ostatni wiersz poprzedniej strony; kolejna strona to "wiersze przed nim", więc baza
+# zaczyna od miejsca w indeksie (user, date, id) zamiast pomijać OFFSET wierszy - strona 1000 kosztuje
+# tyle samo co pierwsza.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(day, pk):
+    return base64.urlsafe_b64encode(f"{day.isoformat()}|{pk}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        day, pk = raw.split('|')
+        return date.fromisoformat(day), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def _key(row):
+    if isinstance(row, dict):
+        return row['date'], row['id']
+    return row.date, row.id
+
+
+def keyset_page(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    # queryset: wiersze jednego użytkownika (modele albo values() z polami date i id);
+    # zwraca (wiersze strony, kursor następnej strony albo None)
+    if cursor:
+        day, pk = decode_cursor(cursor)
+        # (date, id) < (day, pk) zapisane tak, żeby baza użyła zakresu na indeksie
+        queryset = queryset.filter(date__lte=day).exclude(date=day, id__gte=pk)
+
+    rows = list(queryset.order_by('-date', '-id')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*_key(rows[-1]))
@@ -0,0 +1,179 @@
+from datetime import date
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import UserProfile, ProfileMetrics
+from .sharding import shard_aliases, fan_out
+
+try:
+    import numpy as np
+except ImportError:  # numpy jest opcjonalny - bez niego te same wzory liczymy w pętli
+    np = None
+
+
+# --- Hurtowe liczenie wieku, BMI i PPM dla wszystkich profili (raporty admina, eksporty kohort) ---
+#
+# Profile czytamy paczkami jako kolumny (values_list), liczymy całą paczkę naraz i zapisujemy ją jednym upsertem
+# do ProfileMetrics. Wzory są te same co w calculate_age / calculate_bmi / calculate_ppm (views.py).
+
+PROFILE_COLUMNS = ('user_id', 'weight', 'height', 'date_of_birth', 'gender')
+METRIC_FIELDS = ['age', 'bmi', 'bmi_category', 'bmr', 'computed_at']
+DEFAULT_CHUNK_SIZE = 20000
+
+# Progi BMI jak w DailySummaryAPIView: <18.5, <25, <30, reszta
+BMI_BINS = (18.5, 25, 30)
+BMI_CATEGORIES = [code for code, _ in ProfileMetrics.BMI_CATEGORY_CHOICES]
+
+
+def _metrics_numpy(rows, today):
+    user_ids, weight, height, birth, gender = zip(*rows)
+    weight = np.array(weight, dtype=float)  # None -> nan
+    height = np.array(height, dtype=float)
+    weight[weight == 0] = np.nan
+    height[height == 0] = np.nan
+    # Daty jako liczby RRRRMMDD: pełne lata życia to po prostu (dziś - urodziny) // 10000
+    born = np.fromiter((b.year * 10000 + b.month * 100 + b.day if b else -1 for b in birth),
+                       dtype=np.int64, count=len(birth))
+    gender = np.array(gender, dtype=object)
+
+    age = (today.year * 10000 + today.month * 100 + today.day - born) // 10000
+    with np.errstate(invalid='ignore'):
+        bmi = weight / (height / 100) ** 2
+        bmr = np.where(
+            gender == 'F',
+            655 + 9.6 * weight + 1.8 * height - 4.7 * age,
+            66 + 13.7 * weight + 5 * height - 6.8 * age,
+        )
+    # Data urodzenia z przyszłości (literówka w profilu) - brak wieku zamiast ujemnego
+    has_birth = (born >= 0) & (age >= 0)
+    has_bmi = ~np.isnan(bmi)
+    has_bmr = has_bmi & has_birth & (gender != None) & (gender != '')  # noqa: E711
+
+    categories = np.array(BMI_CATEGORIES + [None], dtype=object)
+    return list(zip(
+        user_ids,
+        np.where(has_birth, age, None).tolist(),
+        # round() Pythona, nie np.round - ten sam wynik co UserProfile.calculate_bmi także w połówkach
+        [round(value, 2) if ok else None for value, ok in zip(bmi.tolist(), has_bmi.tolist())],
+        categories[np.where(has_bmi, np.digitize(bmi, BMI_BINS), len(BMI_CATEGORIES))].tolist(),
+        np.where(has_bmr, bmr, None).tolist(),
+    ))
+
+
+def _metrics_python(rows, today):
+    results = []
+    for user_id, weight, height, birth, gender in rows:
+        age = (today.year - birth.year - ((today.month, today.day) < (birth.month, birth.day))) if birth else None
+        if age is not None and age < 0:
+            age = None
+        bmi = weight / (height / 100) ** 2 if weight and height else None
+        category = BMI_CATEGORIES[sum(bmi >= edge for edge in BMI_BINS)] if bmi is not None else None
+        bmr = None
+        if bmi is not None and age is not None and gender:
+            if gender == 'F':
+                bmr = 655 + 9.6 * weight + 1.8 * height - 4.7 * age
+            else:
+                bmr = 66 + 13.7 * weight + 5 * height - 6.8 * age
+        results.append((user_id, age, round(bmi, 2) if bmi is not None else None, category, bmr))
+    return results
+
+
+def engine():
+    return 'numpy' if np is not None else 'python'
+
+
+def compute_metrics(rows, today=None):
+    # rows: krotki PROFILE_COLUMNS; zwraca (user_id, wiek, BMI, kategoria BMI, PPM) w tej samej kolejności
+    today = today or date.today()
+    if not rows:
+        return []
+    return (_metrics_numpy if np is not None else _metrics_python)(rows, today)
+
+
+def refresh_profile_metrics(chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None):
+    # Shard po shardzie - metryki leżą na tym samym shardzie co profil
+    computed_at = timezone.now()
+    today = date.today()
+    total = 0
+
+    for alias in shard_aliases():
+        rows = (
+            UserProfile.objects.using(alias).order_by('user_id')
+            .values_list(*PROFILE_COLUMNS).iterator(chunk_size=chunk_size)
+        )
+        while chunk := list(islice(rows, chunk_size)):
+            metrics = [
+                ProfileMetrics(user_id=user_id, age=age, bmi=bmi, bmi_category=category, bmr=bmr,
+                               computed_at=computed_at)
+                for user_id, age, bmi, category, bmr in compute_metrics(chunk, today)
+            ]
+            with transaction.atomic(using=alias):
+                ProfileMetrics.objects.using(alias).bulk_create(
+                    metrics, update_conflicts=True, unique_fields=['user'], update_fields=METRIC_FIELDS,
+                )
+            total += len(metrics)
+            if on_progress:
+                on_progress(total)
+
+        # Profile usunięte (albo przeniesione na inny shard) od ostatniego przeliczenia
+        ProfileMetrics.objects.using(alias).filter(computed_at__lt=computed_at).delete()
+    return total
+
+
+# Sumy i liczności zamiast średnich - średnie z shardów trzeba ważyć liczbą profili
+METRIC_TOTALS = {
+    'profiles': Count('user_id'),
+    **{f'{metric}_sum': Sum(metric) for metric in ('age', 'bmi', 'bmr')},
+    **{f'{metric}_count': Count(metric) for metric in ('age', 'bmi', 'bmr')},
+}
+
+
+def _shard_totals(alias):
+    metrics = ProfileMetrics.objects.db_manager(alias)
+    return {
+        'overall': metrics.aggregate(**METRIC_TOTALS, computed_at=Max('computed_at')),
+        'by_category': list(metrics.order_by('bmi_category').values('bmi_category').annotate(**METRIC_TOTALS)),
+    }
+
+
+def _merge(rows):
+    totals = {}
+    for row in rows:
+        for key, value in row.items():
+            totals[key] = totals.get(key, 0) + (value or 0)
+
+    def average(metric):
+        count = totals.get(f'{metric}_count')
+        return round(totals[f'{metric}_sum'] / count, 2) if count else None
+
+    return {
+        'profiles': totals.get('profiles', 0),
+        'avg_age': average('age'),
+        'avg_bmi': average('bmi'),
+        'avg_bmr': average('bmr'),
+    }
+
+
+def population_report():
+    # Raport liczy baza - dwa zapytania na shard, wszystkie shardy równolegle
+    shards = fan_out(_shard_totals).values()
+    overall = [shard['overall'] for shard in shards]
+    computed = [row.pop('computed_at') for row in overall]
+    last = max(filter(None, computed), default=None)
+
+    by_category = {}
+    for shard in shards:
+        for row in shard['by_category']:
+            by_category.setdefault(row.pop('bmi_category'), []).append(row)
+
+    return {
+        **_merge(overall),
+        'computed_at': last,
+        'by_bmi_category': [
+            {'bmi_category': category, **_merge(rows)}
+            for category, rows in sorted(by_category.items(), key=lambda item: (item[0] is not None, item[0] or ''))
+        ],
+    }
@@ -0,0 +1,151 @@
+import re
+from collections import namedtuple
+
+
+# --- Rozbijanie zapytania "2 cups of rice" na ilość, jednostkę i produkt ---
+
+ParsedQuery = namedtuple('ParsedQuery', ['quantity', 'unit', 'food', 'scalable'])
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'dozen': 12, 'half': 0.5,
+}
+
+UNITS = {
+    'g': 'g', 'gram': 'g', 'grams': 'g', 'gr': 'g',
+    'kg': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'oz': 'oz', 'ounce': 'oz', 'ounces': 'oz',
+    'lb': 'lb', 'lbs': 'lb', 'pound': 'lb', 'pounds': 'lb',
+    'ml': 'ml', 'l': 'l', 'liter': 'l', 'liters': 'l', 'litre': 'l', 'litres': 'l',
+    'cup': 'cup', 'cups': 'cup',
+    'tbsp': 'tbsp', 'tablespoon': 'tbsp', 'tablespoons': 'tbsp',
+    'tsp': 'tsp', 'teaspoon': 'tsp', 'teaspoons': 'tsp',
+    'slice': 'slice', 'slices': 'slice',
+    'piece': 'piece', 'pieces': 'piece',
+    'serving': 'serving', 'servings': 'serving',
+    'bowl': 'bowl', 'bowls': 'bowl',
+    'glass': 'glass', 'glasses': 'glass',
+    'can': 'can', 'cans': 'can',
+    'small': 'small', 'medium': 'medium', 'large': 'large',
+}
+
+QUANTITY_RE = re.compile(
+    r'^(?:(?P<whole>\d+)\s+(?P<num>\d+)/(?P<den>\d+)'    # 1 1/2
+    r'|(?P<fnum>\d+)/(?P<fden>\d+)'                       # 1/2
+    r'|(?P<decimal>\d+(?:[.,]\d+)?))'                     # 2, 1.5, 1,5
+    r'(?P<attached>[a-z]+)?(?=\s|$)'                      # 100g
+)
+
+# Zapytania z kilkoma produktami ("eggs and toast", "jajka i chleb") nie dają się przeskalować
+# jednym współczynnikiem
+MULTI_FOOD_RE = re.compile(r',|;|\+|&|\band\b|\bwith\b|\bi\b')
+
+# Nutrienty skalowane proporcjonalnie do ilości
+SCALED_FIELDS = ('serving_weight_grams',)
+
+
+def normalize_query(text):
+    return " ".join(str(text).lower().split())
+
+
+def singularize(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('ches', 'shes', 'toes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us')):
+        return word[:-1]
+    return word
+
+
+def _parse_quantity(match):
+    # None dla ułamka z zerowym mianownikiem ("1/0 egg") - zapytanie idzie wtedy bez skalowania
+    if match.group('whole'):
+        den = int(match.group('den'))
+        return int(match.group('whole')) + int(match.group('num')) / den if den else None
+    if match.group('fnum'):
+        den = int(match.group('fden'))
+        return int(match.group('fnum')) / den if den else None
+    return float(match.group('decimal').replace(',', '.'))
+
+
+def parse_query(text):
+    rest = normalize_query(text)
+    quantity, unit, valid = 1.0, '', True
+
+    match = QUANTITY_RE.match(rest)
+    if match and (match.group('attached') is None or match.group('attached') in UNITS):
+        parsed = _parse_quantity(match)
+        if parsed is None:
+            valid = False
+        else:
+            quantity = parsed
+            if match.group('attached'):
+                unit = UNITS[match.group('attached')]
+            rest = rest[match.end():].strip()
+    else:
+        word, _, tail = rest.partition(' ')
+        if word in NUMBER_WORDS and tail:
+            quantity = NUMBER_WORDS[word]
+            rest = tail
+            # "half a banana" - przedimek po "half" nie jest częścią nazwy
+            if word == 'half':
+                article, _, food = rest.partition(' ')
+                if article in ('a', 'an') and food:
+                    rest = food
+
+    if not unit:
+        word, _, tail = rest.partition(' ')
+        if word in UNITS and tail:
+            unit = UNITS[word]
+            rest = tail
+    if rest.startswith('of '):
+        rest = rest[3:]
+
+    words = rest.split()
+    if words:
+        words[-1] = singularize(words[-1])
+    food = ' '.join(words)
+
+    scalable = valid and bool(food) and quantity > 0 and not MULTI_FOOD_RE.search(food)
+    return ParsedQuery(quantity, unit, food, scalable)
+
+
+def per_unit_key(parsed):
+    return f"per-unit:{parsed.food}|{parsed.unit}"
+
+
+def scale_food(food, factor):
+    scaled = dict(food)
+    for field, value in food.items():
+        if (field.startswith('nf_') or field in SCALED_FIELDS) and isinstance(value, (int, float)):
+            scaled[field] = value * factor
+    if isinstance(food.get('serving_qty'), (int, float)):
+        scaled['serving_qty'] = food['serving_qty'] * factor
+    if isinstance(food.get('full_nutrients'), list):
+        scaled['full_nutrients'] = [
+            {**n, 'value': n['value'] * factor} if isinstance(n.get('value'), (int, float)) else n
+            for n in food['full_nutrients']
+        ]
+    return scaled
+
+
+def per_unit_food(data, parsed):
+    # Fakty na 1 jednostkę - tylko gdy Nutritionix zwrócił jeden produkt w tej samej ilości, o którą pytaliśmy
+    foods = data.get('foods') if isinstance(data, dict) else None
+    if not parsed.scalable or not foods or len(foods) != 1:
+        return None
+    serving_qty = foods[0].get('serving_qty')
+    if not isinstance(serving_qty, (int, float)) or serving_qty <= 0:
+        return None
+    if abs(serving_qty - parsed.quantity) > 1e-6:
+        return None
+    return scale_food(foods[0], 1 / serving_qty)
+
+
+def scaled_response(food, quantity):
+    scaled = scale_food(food, quantity)
+    for field, value in scaled.items():
+        if isinstance(value, float) and (field.startswith('nf_') or field in SCALED_FIELDS + ('serving_qty',)):
+            scaled[field] = round(value, 2)
+    return {"foods": [scaled]}
@@ -0,0 +1,25 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson jest opcjonalny - bez niego zwykły JSONRenderer DRF
+    orjson = None
+
+
+# --- Szybki renderer JSON: orjson (C/Rust) zamiast json.dumps, ten sam wynik co JSONRenderer DRF ---
+#
+# Typy, których orjson nie zna (Decimal, leniwe tłumaczenia, QuerySet...), przechodzą przez enkoder DRF;
+# daty UTC kończą się "Z" jak w DRF. Wcięcia (?indent / Accept: ...; indent=) obsługuje zwykły renderer.
+
+class FastJSONRenderer(JSONRenderer):
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self.encoder.default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+def engine():
+    return 'orjson' if orjson is not None else 'json'
@@ -0,0 +1,81 @@
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Sum, Count
+
+from .models import Meal, Activity, DailyBalance
+from .sharding import user_writes
+
+
+# --- Dzienne sumy (DailyBalance): przeliczanie tylko zmienionych dni i odczyt dla podsumowań ---
+
+ROLLUP_FIELDS = ['eaten_kcal', 'burned_kcal', 'protein', 'carbs', 'fat',
+                 'activity_minutes', 'meal_count', 'activity_count']
+
+DATE_CHUNK = 500  # limit parametrów w zapytaniu IN na SQLite
+
+
+def _chunks(values, size):
+    iterator = iter(values)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def refresh_daily_balances(user_id, dates):
+    # Przelicza wskazane dni użytkownika dwoma zgrupowanymi zapytaniami (posiłki, aktywności) na paczkę dat;
+    # dni bez wpisów znikają z tabeli
+    with user_writes(user_id):
+        _refresh_daily_balances(user_id, dates)
+
+
+def _refresh_daily_balances(user_id, dates):
+    for chunk in _chunks(sorted(set(dates)), DATE_CHUNK):
+        balances = {day: DailyBalance(user_id=user_id, date=day) for day in chunk}
+
+        meals = (
+            Meal.objects.filter(user_id=user_id, date__in=chunk)
+            .order_by()
+            .values('date')
+            .annotate(eaten_kcal=Sum('calories'), protein=Sum('protein'), carbs=Sum('carbs'),
+                      fat=Sum('fat'), meal_count=Count('id'))
+        )
+        activities = (
+            Activity.objects.filter(user_id=user_id, date__in=chunk)
+            .order_by()
+            .values('date')
+            .annotate(burned_kcal=Sum('calories_burned'), activity_minutes=Sum('duration'),
+                      activity_count=Count('id'))
+        )
+        for row in [*meals, *activities]:
+            balance = balances[row.pop('date')]
+            for field, value in row.items():
+                setattr(balance, field, value or 0)
+
+        filled = [b for b in balances.values() if b.meal_count or b.activity_count]
+        empty = [b.date for b in balances.values() if not (b.meal_count or b.activity_count)]
+        if filled:
+            DailyBalance.objects.bulk_create(
+                filled,
+                update_conflicts=True,
+                unique_fields=['user', 'date'],
+                update_fields=ROLLUP_FIELDS + ['updated_at'],
+            )
+        if empty:
+            DailyBalance.objects.filter(user_id=user_id, date__in=empty).delete()
+
+
+def rebuild_daily_balances(user_id):
+    with user_writes(user_id) as db, transaction.atomic(using=db):
+        dates = set(Meal.objects.filter(user_id=user_id).order_by().values_list('date', flat=True).distinct())
+        dates |= set(Activity.objects.filter(user_id=user_id).order_by().values_list('date', flat=True).distinct())
+        DailyBalance.objects.filter(user_id=user_id).exclude(date__in=dates).delete()
+        refresh_daily_balances(user_id, dates)
+    return len(dates)
+
+
+def balances_by_date(user, start_date, end_date):
+    return {
+        balance.date: balance
+        for balance in DailyBalance.objects.filter(user=user, date__range=[start_date, end_date])
+    }
+
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Activity, UserProfile
+from .models import Activity, UserProfile, RawPayload
 from .models import Meal
 
 
@@ -25,10 +25,12 @@ class ActivitySerializer(serializers.ModelSerializer):
 
 class MealSerializer(serializers.ModelSerializer):
     date = serializers.DateField(format='%Y-%m-%d', input_formats=['%Y-%m-%d'])
+    # Surowy payload trzymany w RawPayload (deduplikowany, skompresowany) - w API wygląda jak dawne pole JSON
+    raw_api_data = serializers.JSONField(required=False, allow_null=True)
 
     class Meta:
         model = Meal
-        fields = '__all__'
+        exclude = ('raw_payload',)
         read_only_fields = ('user',)
 
 
@@ -51,3 +53,70 @@ class UserProfileSerializer(serializers.ModelSerializer):
     def get_bmi(self, obj):
         return obj.calculate_bmi()
 
+
+
+# --- Lekkie serializery list do odczytu: projekcje wierszy z .values(), bez maszynerii pól DRF ---
+#
+# ModelSerializer tworzy obiekt modelu i przepuszcza każde pole przez to_representation; dla list po kilkaset
+# wpisów to większość czasu odpowiedzi. Tu baza zwraca od razu słowniki tylko z potrzebnych kolumn,
+# a klient może zawęzić odpowiedź parametrem ?fields=.
+
+class InvalidFields(ValueError):
+    pass
+
+
+class ReadSerializer:
+    fields = ()  # zwracane domyślnie
+    optional_fields = ()  # tylko na życzenie, przez ?fields=
+    sources = {}  # pole wyliczane -> kolumny, z których powstaje (metoda get_<pole>)
+
+    def __init__(self, fields=None):
+        fields = tuple(fields) if fields else self.fields
+        unknown = [name for name in fields if name not in self.fields + self.optional_fields]
+        if unknown:
+            raise InvalidFields(
+                f"Unknown fields: {', '.join(unknown)}; available: {', '.join(self.fields + self.optional_fields)}"
+            )
+        self.output = tuple(dict.fromkeys(fields))
+        self._computed = [(name, getattr(self, f'get_{name}')) for name in self.output if name in self.sources]
+
+    @classmethod
+    def from_query(cls, value):
+        # "meal,calories" z ?fields=; brak parametru - domyślny zestaw pól
+        return cls([name.strip() for name in value.split(',') if name.strip()] if value else None)
+
+    def columns(self, *required):
+        # Kolumny dla values(): wymagane przez wywołującego (np. date i id do kursora) + potrzebne do odpowiedzi
+        columns = dict.fromkeys(required)
+        for name in self.output:
+            columns.update(dict.fromkeys(self.sources.get(name, (name,))))
+        return tuple(columns)
+
+    def to_representation(self, row):
+        data = {name: row[name] for name in self.output if name not in self.sources}
+        for name, getter in self._computed:
+            data[name] = getter(row)
+        return data
+
+    def data(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+class MealReadSerializer(ReadSerializer):
+    fields = ('id', 'date', 'meal', 'calories', 'protein', 'carbs', 'fat', 'serving_qty', 'serving_unit')
+    # Surowa odpowiedź Nutritionix bywa kilka KB na posiłek, a UI jej nie pokazuje
+    optional_fields = ('raw_api_data',)
+    sources = {'raw_api_data': ('raw_payload__data',)}
+
+    def get_raw_api_data(self, row):
+        blob = row['raw_payload__data']
+        return RawPayload.decode(blob) if blob is not None else None
+
+
+class ActivityReadSerializer(ReadSerializer):
+    fields = ('id', 'date', 'activity_type', 'activity_type_display', 'duration', 'calories_burned', 'notes')
+    sources = {'activity_type_display': ('activity_type',)}
+    names = dict(Activity.ACTIVITY_CHOICES)
+
+    def get_activity_type_display(self, row):
+        return self.names.get(row['activity_type'], row['activity_type'])
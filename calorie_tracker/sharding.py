@@ -0,0 +1,487 @@
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Max
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import Meal, Activity, UserProfile, DailyBalance, RawPayload, ProfileMetrics, IdempotencyKey, UserShard, \
+    IdSequence
+from .summary_cache import is_process_local
+
+
+# --- Sharding danych użytkowników: każdy użytkownik ma swój shard (alias z DATABASES) ---
+#
+# Dane podzielone po użytkowniku (posiłki, aktywności, profil, bilanse...) leżą na shardzie użytkownika;
+# konta, sesje, baza produktów i samo przypisanie (UserShard) zostają na primary. Nowy użytkownik dostaje
+# shard z hasha id zapisany w UserShard, więc dodanie sharda nikogo nie przenosi - robi to rebalance_shards.
+# Użytkownicy sprzed włączenia shardingu nie mają wpisu i zostają na primary (który też jest shardem).
+#
+# Zapytania trafiają na shard przez ShardRouter: odczyt konkretnego obiektu - po jego user_id, a zapytania
+# bez obiektu (filter, update) - po użytkowniku z user_shard() (ShardMiddleware ustawia zalogowanego
+# użytkownika na czas żądania). Zapytanie bez użytkownika to błąd (ShardRoutingError), a nie primary.
+# Zapisy wymagają user_writes(): transakcja na shardzie z blokadą użytkownika, na którą czeka move_user.
+# Każdy shard numeruje wiersze od własnego progu, więc wiersze przenoszone między shardami zachowują id.
+
+PRIMARY = 'default'
+
+DEFAULT_SETTINGS = {
+    'ALIASES': [PRIMARY],
+    'CACHE_ALIAS': 'default',
+    'LOOKUP_TTL': 300,  # sekundy; cache przypisań musi być wspólny dla procesów, inaczej po przeniesieniu
+                        # procesy z nieaktualnym wpisem piszą na stary shard - move_user odmawia przy LocMem
+    'ALLOW_PROCESS_LOCAL': False,  # przenoszenie przy cache w pamięci procesu (testy, jeden proces)
+    'ID_RANGE': 2 ** 40,  # shard n numeruje wiersze od n * ID_RANGE
+}
+
+# Kolejność kopiowania przy przenoszeniu (usuwanie - odwrotnie); RawPayload idzie razem z posiłkami
+USER_MODELS = [UserProfile, Meal, Activity, DailyBalance, ProfileMetrics, IdempotencyKey]
+SHARDED_MODELS = {*USER_MODELS, RawPayload}
+
+_current_user = ContextVar('shard_user', default=None)        # user_shard()
+_current_request = ContextVar('shard_request', default=None)  # ShardMiddleware
+_write_lease = ContextVar('shard_write_lease', default=None)  # user_writes(): (user_id, alias)
+
+
+class ShardRoutingError(RuntimeError):
+    pass
+
+
+class UserMoving(Exception):
+    # Dane użytkownika są właśnie przenoszone - zapis trzeba ponowić (ShardMiddleware odpowiada 503)
+    pass
+
+
+class ShardConflict(Exception):
+    pass
+
+
+def _settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'DB_SHARDS', {})}
+
+
+def shard_aliases():
+    return list(_settings()['ALIASES'])
+
+
+def sharding_enabled():
+    return len(shard_aliases()) > 1
+
+
+def _cache():
+    return caches[_settings()['CACHE_ALIAS']]
+
+
+def _key(user_id):
+    return f"db:shard:{user_id}"
+
+
+def hashed_shard(user_id):
+    # crc32, a nie hash() - ten sam wynik w każdym procesie
+    aliases = shard_aliases()
+    return aliases[zlib.crc32(str(user_id).encode()) % len(aliases)]
+
+
+def _lookup(user_id):
+    # (alias, czy trwa przenoszenie)
+    entry = _cache().get(_key(user_id))
+    if entry is None:
+        row = UserShard.objects.using(PRIMARY).filter(user_id=user_id).values_list('alias', 'moving').first()
+        entry = tuple(row) if row else (PRIMARY, False)
+        _cache().set(_key(user_id), entry, timeout=_settings()['LOOKUP_TTL'])
+    return entry
+
+
+def shard_for(user_id):
+    if user_id is None or not sharding_enabled():
+        return PRIMARY
+    return _lookup(user_id)[0]
+
+
+def _set_shard(user_id, alias, moving=False):
+    defaults = {'alias': alias, 'moving': moving}
+    if not moving:
+        defaults['moved_at'] = timezone.now()
+    UserShard.objects.using(PRIMARY).update_or_create(user_id=user_id, defaults=defaults)
+    _cache().set(_key(user_id), (alias, moving), timeout=_settings()['LOOKUP_TTL'])
+
+
+def ensure_user_row(user_id, alias):
+    # Klucze obce do auth_user na shardzie potrzebują wiersza użytkownika - kopia bez hasła i uprawnień
+    if alias != PRIMARY:
+        username = User.objects.using(PRIMARY).filter(pk=user_id).values_list('username', flat=True).first()
+        User.objects.using(alias).bulk_create(
+            [User(pk=user_id, username=username or f"user-{user_id}", password='!', is_active=False)],
+            ignore_conflicts=True,
+        )
+
+
+def assign_shard(user):
+    if not sharding_enabled():
+        return PRIMARY
+    alias = hashed_shard(user.pk)
+    ensure_user_row(user.pk, alias)
+    UserShard.objects.using(PRIMARY).get_or_create(user_id=user.pk, defaults={'alias': alias})
+    _cache().set(_key(user.pk), (alias, False), timeout=_settings()['LOOKUP_TTL'])
+    return alias
+
+
+@contextmanager
+def user_shard(user_id):
+    # Zapytania o dane użytkownika w bloku idą na jego shard; zwraca alias (np. do transaction.atomic(using=...))
+    token = _current_user.set(user_id)
+    try:
+        yield shard_for(user_id)
+    finally:
+        _current_user.reset(token)
+
+
+def _context_user():
+    user_id = _current_user.get()
+    request = _current_request.get()
+    # Użytkownik żądania czytany dopiero przy zapytaniu - DRF uwierzytelnia token w widoku
+    if user_id is None and request is not None and request.user.is_authenticated:
+        user_id = request.user.id
+    return user_id
+
+
+def current_shard():
+    return shard_for(_context_user())
+
+
+def _lock_user(alias, user_id, exclusive=False):
+    # Zapisy użytkownika biorą blokadę współdzieloną, move_user - wyłączną (do końca transakcji)
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"SELECT pg_advisory_xact_lock{'' if exclusive else '_shared'}(%s)", [user_id])
+        elif connection.vendor == 'sqlite':
+            # SQLite ma jednego piszącego na plik - pierwszy zapis w transakcji blokuje cały shard do commitu
+            table = connection.ops.quote_name(User._meta.db_table)
+            cursor.execute(f"UPDATE {table} SET id = id WHERE id = %s", [user_id])
+        else:
+            raise ImproperlyConfigured(f"No user lock for shard {alias} ({connection.vendor})")
+
+
+@contextmanager
+def user_writes(user_id):
+    # Zapisy danych użytkownika: transakcja na jego shardzie pod blokadą, sprawdzoną względem przypisania.
+    # Przenoszony użytkownik dostaje UserMoving, a zapis w toku wstrzymuje przeniesienie do commitu
+    if not sharding_enabled():
+        with user_shard(user_id) as db:
+            yield db
+        return
+    lease = _write_lease.get()
+    if lease is not None and lease[0] == user_id:
+        with user_shard(user_id), transaction.atomic(using=lease[1]):
+            yield lease[1]
+        return
+
+    with user_shard(user_id) as db, transaction.atomic(using=db):
+        _lock_user(db, user_id)
+        alias, moving = _lookup(user_id)
+        if moving or alias != db:
+            raise UserMoving(f"User {user_id} is being moved to another shard, retry shortly")
+        token = _write_lease.set((user_id, db))
+        try:
+            yield db
+        finally:
+            _write_lease.reset(token)
+
+
+def writes_user_data(view_method):
+    # Dla metod APIView zapisujących dane zalogowanego użytkownika
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        with user_writes(request.user.id):
+            return view_method(self, request, *args, **kwargs)
+    return wrapper
+
+
+class ShardRouter:
+    # Tylko modele podzielone po użytkowniku; resztą (i wszystkim przy jednym shardzie) zajmuje się
+    # PrimaryReplicaRouter. Dane z shardów czytamy z ich primary - repliki obsługują tylko bazę default
+    def _user(self, model, hints):
+        if model not in SHARDED_MODELS or not sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        user_id = instance.pk if isinstance(instance, User) else getattr(instance, 'user_id', None)
+        if user_id is None:
+            user_id = _context_user()
+        if user_id is None:
+            raise ShardRoutingError(
+                f"No user to route {model.__name__} by - use user_shard(), user_writes() or .using(alias)"
+            )
+        return user_id
+
+    def db_for_read(self, model, **hints):
+        user_id = self._user(model, hints)
+        return shard_for(user_id) if user_id is not None else None
+
+    def db_for_write(self, model, **hints):
+        user_id = self._user(model, hints)
+        if user_id is None:
+            return None
+        lease = _write_lease.get()
+        if lease is not None and lease[0] == user_id:
+            return lease[1]
+        if isinstance(hints.get('instance'), User):
+            # Przypisanie użytkownika do nowego obiektu (Meal(user=...)) pyta o bazę, ale jeszcze nic nie zapisuje
+            return shard_for(user_id)
+        raise ShardRoutingError(f"Write to {model.__name__} of user {user_id} outside user_writes()")
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Np. posiłek na shardzie i jego użytkownik z primary
+        aliases = shard_aliases()
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ShardMiddleware:
+    # Po AuthenticationMiddleware: żądania zalogowanego użytkownika czytają na jego shardzie (zapisy - pod
+    # user_writes). Panel admina wybiera bazy jawnie albo przez user_shard() właściciela obiektu (admin.py)
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sharding_enabled():
+            return self.get_response(request)
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, UserMoving):
+            response = JsonResponse({"error": str(exception)}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        return None
+
+
+def _id_floor(alias):
+    return shard_aliases().index(alias) * _settings()['ID_RANGE']
+
+
+def allocate_ids(objs, using=None):
+    # SQLite AUTOINCREMENT liczy od max(id), więc wiersz przeniesiony z innego sharda przestawiłby licznik w jego
+    # zakres - nowe wiersze dostają id z licznika sharda (IdSequence). Zwraca True, gdy nadał id
+    if not objs or not sharding_enabled():
+        return False
+    model = type(objs[0])
+    alias = using or router.db_for_write(model, instance=objs[0])
+    if alias not in shard_aliases() or connections[alias].vendor == 'postgresql':
+        return False
+    floor, table = _id_floor(alias), model._meta.db_table
+    sequences = IdSequence.objects.using(alias).filter(table=table)
+    with transaction.atomic(using=alias):
+        if not sequences.update(next_id=F('next_id') + len(objs)):
+            top = model._base_manager.using(alias).filter(
+                pk__gt=floor, pk__lte=floor + _settings()['ID_RANGE'],
+            ).aggregate(top=Max('pk'))['top']
+            IdSequence.objects.using(alias).get_or_create(table=table, defaults={'next_id': (top or floor) + 1})
+            sequences.update(next_id=F('next_id') + len(objs))
+        next_id = sequences.values_list('next_id', flat=True).get()
+    for pk, obj in zip(range(next_id - len(objs), next_id), objs):
+        obj.pk = pk
+    return True
+
+
+def reserve_id_range(alias):
+    # Wywoływane po migracji sharda: w PostgreSQL sekwencje tabel podzielonych startują od progu sharda
+    # (wiersze wstawiane z jawnym id ich nie przestawiają); pozostałe bazy - allocate_ids
+    aliases = shard_aliases()
+    if alias not in aliases or aliases.index(alias) == 0 or connections[alias].vendor != 'postgresql':
+        return
+    floor = _id_floor(alias)
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for table in [model._meta.db_table for model in USER_MODELS]:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                [table, floor],
+            )
+
+
+# --- Przenoszenie użytkownika między shardami (rebalance_shards) ---
+
+def _field_names(model):
+    # Klucz główny pierwszy - po nim idą paczki
+    pk = model._meta.pk.attname
+    return [pk] + [field.attname for field in model._meta.concrete_fields if field.attname != pk]
+
+
+def _copy_payloads(meals, source, target):
+    digests = {meal.raw_payload_id for meal in meals if meal.raw_payload_id}
+    if digests:
+        present = set(RawPayload.objects.using(target).filter(digest__in=digests).values_list('digest', flat=True))
+        RawPayload.objects.using(target).bulk_create(
+            RawPayload.objects.using(source).filter(digest__in=digests - present), ignore_conflicts=True,
+        )
+
+
+def _sync_rows(model, source, target, user_id, chunk_size, overwrite=True):
+    # Doprowadza wiersze użytkownika na target do stanu z source paczkami po id; powtórne wywołanie zapisuje
+    # tylko różnice. overwrite=False (zabłąkane wiersze po przeniesieniu) - tylko brakujące, bez nadpisywania.
+    # Wiersz innego użytkownika z tym samym id na targecie przerywa przenoszenie (ShardConflict)
+    fields = _field_names(model)
+    manager = model._base_manager
+    source_rows = manager.using(source).filter(user_id=user_id).order_by('pk')
+    target_rows = manager.using(target).filter(user_id=user_id).order_by('pk')
+    last_pk, written = None, 0
+
+    while True:
+        page = source_rows if last_pk is None else source_rows.filter(pk__gt=last_pk)
+        chunk = list(page.values_list(*fields)[:chunk_size])
+        upper = chunk[-1][0] if len(chunk) == chunk_size else None  # None - ostatnia paczka, do końca
+
+        existing = target_rows if last_pk is None else target_rows.filter(pk__gt=last_pk)
+        if upper is not None:
+            existing = existing.filter(pk__lte=upper)
+        existing = {row[0]: row for row in existing.values_list(*fields)}
+
+        if overwrite:
+            # Przed wstawianiem - usunięty i ponownie dodany wiersz (np. bilans dnia) ma nowe id
+            stale = set(existing) - {row[0] for row in chunk}
+            if stale:
+                manager.using(target).filter(pk__in=stale)._raw_delete(target)
+
+        new = [model(**dict(zip(fields, row))) for row in chunk if row[0] not in existing]
+        changed = [model(**dict(zip(fields, row))) for row in chunk
+                   if overwrite and row[0] in existing and existing[row[0]] != row]
+        if new:
+            taken = list(manager.using(target).filter(pk__in=[obj.pk for obj in new])
+                         .exclude(user_id=user_id).values_list('pk', 'user_id')[:5])
+            if taken:
+                raise ShardConflict(
+                    f"{model.__name__} ids of user {user_id} belong to other users on {target}: {taken}"
+                )
+            if model is Meal:
+                _copy_payloads(new, source, target)
+            model.objects.using(target).bulk_create(new, ignore_conflicts=not overwrite)
+        if changed:
+            model.objects.using(target).bulk_update(changed, fields[1:])
+        written += len(new) + len(changed)
+
+        if upper is None:
+            return written
+        last_pk = upper
+
+
+def _delete_user_rows(alias, user_id):
+    digests = set(Meal.objects.using(alias).filter(user_id=user_id, raw_payload__isnull=False)
+                  .values_list('raw_payload_id', flat=True))
+    for model in reversed(USER_MODELS):
+        # _raw_delete - bez sygnałów: dzienne bilanse i cache podsumowań dotyczą danych, które zostają na targecie
+        model.objects.using(alias).filter(user_id=user_id)._raw_delete(alias)
+    # Payloady są wspólne dla użytkowników sharda - usuwamy tylko nieużywane
+    RawPayload.objects.using(alias).filter(digest__in=digests, meal__isnull=True)._raw_delete(alias)
+
+
+def _require_shared_cache():
+    options = _settings()
+    if is_process_local(options['CACHE_ALIAS']) and not options['ALLOW_PROCESS_LOCAL']:
+        raise ImproperlyConfigured(
+            f"Moving users needs a cache shared by all processes (CACHES['{options['CACHE_ALIAS']}'] is "
+            f"process-local) - other workers would keep writing to the old shard"
+        )
+
+
+def move_user(user_id, target, chunk_size=2000):
+    _require_shared_cache()
+    source = shard_for(user_id)
+    if target not in shard_aliases():
+        raise ValueError(f"Unknown shard {target}")
+    if source == target:
+        return 0
+    ensure_user_row(user_id, target)
+
+    # 1. Kopia bez blokady - użytkownik dalej normalnie korzysta z aplikacji
+    with transaction.atomic(using=target):
+        for model in USER_MODELS:
+            _sync_rows(model, source, target, user_id, chunk_size)
+
+    # 2. Od tej chwili nowe zapisy użytkownika dostają UserMoving; blokada wyłączna czeka na zapisy w toku.
+    # Potem dosłanie zmian z czasu kopiowania, przełączenie przypisania i usunięcie ze źródła
+    _set_shard(user_id, source, moving=True)
+    try:
+        with transaction.atomic(using=source):
+            _lock_user(source, user_id, exclusive=True)
+            with transaction.atomic(using=target):
+                delta = sum(_sync_rows(model, source, target, user_id, chunk_size) for model in USER_MODELS)
+            _set_shard(user_id, target)
+            _delete_user_rows(source, user_id)
+    except BaseException:
+        UserShard.objects.using(PRIMARY).filter(user_id=user_id).update(moving=False)
+        _cache().delete(_key(user_id))
+        raise
+    return delta
+
+
+def stray_users(alias):
+    # Użytkownicy z danymi na shardzie, do którego nie są przypisani (zapisy w trakcie przenoszenia)
+    user_ids = set()
+    for model in USER_MODELS:
+        user_ids |= set(model.objects.using(alias).order_by().values_list('user_id', flat=True).distinct())
+    return sorted(user_id for user_id in user_ids if shard_for(user_id) != alias)
+
+
+def sweep_strays(chunk_size=2000):
+    # Zwraca {user_id: liczba dosłanych wierszy}; bilanse tych użytkowników trzeba potem przeliczyć
+    _require_shared_cache()
+    moved = {}
+    for alias in shard_aliases():
+        for user_id in stray_users(alias):
+            ensure_user_row(user_id, shard_for(user_id))
+            # user_writes - przenoszenie tego użytkownika nie zmieni targetu w trakcie
+            with user_writes(user_id) as target, transaction.atomic(using=alias):
+                moved[user_id] = sum(
+                    _sync_rows(model, alias, target, user_id, chunk_size, overwrite=False) for model in USER_MODELS
+                )
+                _delete_user_rows(alias, user_id)
+    return moved
+
+
+# --- Raporty przekrojowe: to samo zapytanie na każdym shardzie równolegle ---
+
+def fan_out(fn, aliases=None):
+    # fn(alias) w osobnym wątku na shard (osobne połączenia); bez shardingu fn(None) w tym wątku -
+    # zapytania idą wtedy zwykłą ścieżką routera (także na repliki)
+    if not sharding_enabled():
+        return {PRIMARY: fn(None)}
+    aliases = aliases or shard_aliases()
+
+    def run(alias):
+        try:
+            return fn(alias)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+        return dict(zip(aliases, pool.map(run, aliases)))
+
+
+def shard_report():
+    def counts(alias):
+        return {
+            'profiles': UserProfile.objects.db_manager(alias).count(),
+            'meals': Meal.objects.db_manager(alias).count(),
+            'activities': Activity.objects.db_manager(alias).count(),
+        }
+
+    assigned = dict(UserShard.objects.using(PRIMARY).order_by().values_list('alias').annotate(users=Count('pk')))
+    return [
+        {'alias': alias, 'assigned_users': assigned.get(alias, 0), **stats}
+        for alias, stats in fan_out(counts).items()
+    ]
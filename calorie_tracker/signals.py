@@ -1,16 +1,103 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete, post_migrate
+from django.dispatch import receiver, Signal
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, Meal, Activity
+from .rollups import refresh_daily_balances
+from .summary_cache import get_summary_cache
+from .db_router import pin_to_primary
+from .sharding import PRIMARY, assign_shard, shard_for, user_writes, reserve_id_range
+
+# Wysyłany po każdej zmianie posiłków/aktywności użytkownika (także po bulk_create, który pomija
+# post_save) - argumenty: user_id, dates
+daily_data_changed = Signal()
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        UserProfile.objects.get_or_create(
-            user=instance,
-            defaults={
-                'first_name': instance.first_name,
-                'last_name': instance.last_name,
-                'email': instance.email
-            }
-        )
\ No newline at end of file
+        # Najpierw shard - profil powstaje już na nim
+        assign_shard(instance)
+        with user_writes(instance.id):
+            UserProfile.objects.get_or_create(
+                user=instance,
+                defaults={
+                    'first_name': instance.first_name,
+                    'last_name': instance.last_name,
+                    'email': instance.email
+                }
+            )
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_user_data(sender, instance, using, **kwargs):
+    # Kaskada z primary nie sięga innych baz - kopia użytkownika na shardzie usuwa jego dane tam
+    alias = shard_for(instance.id)
+    if using == PRIMARY and alias != PRIMARY:
+        User.objects.using(alias).filter(pk=instance.id).delete()
+
+
+@receiver(post_migrate)
+def reserve_shard_id_ranges(sender, using, **kwargs):
+    if sender.name == 'calorie_tracker':
+        reserve_id_range(using)
+
+
+def _day(instance):
+    # Formularze potrafią przypisać datę jako tekst (np. add_meal_dynamic)
+    return instance.user_id, instance._meta.get_field('date').to_python(instance.date)
+
+
+@receiver(pre_save, sender=Meal)
+@receiver(pre_save, sender=Activity)
+def remember_previous_day(sender, instance, **kwargs):
+    # Przy edycji trzeba przeliczyć także dzień, z którego wpis został przeniesiony
+    if instance.pk and not instance._state.adding:
+        instance._previous_day = (
+            sender.objects.filter(pk=instance.pk).order_by().values_list('user_id', 'date').first()
+        )
+
+
+@receiver(post_save, sender=Meal)
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Meal)
+@receiver(post_delete, sender=Activity)
+def notify_day_changed(sender, instance, **kwargs):
+    days = {_day(instance)}
+    previous = instance.__dict__.pop('_previous_day', None)
+    if previous:
+        days.add(previous)
+
+    by_user = {}
+    for user_id, day in days:
+        by_user.setdefault(user_id, set()).add(day)
+    for user_id, dates in by_user.items():
+        daily_data_changed.send(sender=sender, user_id=user_id, dates=dates)
+
+
+@receiver(daily_data_changed)
+@receiver(post_save, sender=UserProfile)
+def pin_writer_to_primary(sender, user_id=None, instance=None, **kwargs):
+    # Kolejne odczyty użytkownika z primary, dopóki repliki nie nadrobią zapisu. Rejestrowany przed
+    # unieważnieniem cache, więc przypięcie działa po commicie wcześniej niż nowa wersja - inaczej odczyt
+    # z opóźnionej repliki trafiłby do cache pod nową wersją
+    user_id = user_id if user_id is not None else instance.user_id
+    transaction.on_commit(lambda: pin_to_primary(user_id), using=shard_for(user_id))
+
+
+@receiver(daily_data_changed)
+def update_daily_balances(sender, user_id, dates, **kwargs):
+    refresh_daily_balances(user_id, dates)
+
+
+@receiver(daily_data_changed)
+def invalidate_day_summaries(sender, user_id, dates, **kwargs):
+    # Po commicie - inaczej równoległy odczyt mógłby zapisać w cache dane sprzed zapisu pod nową wersją
+    dates = set(dates)
+    transaction.on_commit(lambda: get_summary_cache().invalidate_days(user_id, dates), using=shard_for(user_id))
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_summaries(sender, instance, using, **kwargs):
+    # Waga, wzrost i data urodzenia zmieniają PPM, a więc bilans każdego dnia
+    transaction.on_commit(lambda: get_summary_cache().invalidate_profile(instance.user_id), using=using)
@@ -0,0 +1,154 @@
+import hashlib
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+# --- Cache odpowiedzi podsumowań: klucz = użytkownik + zakres dat + wersje dni i profilu ---
+#
+# Każdy dzień użytkownika i jego profil mają w cache swoją wersję (losowy token). Zapis posiłku/aktywności
+# zmienia wersje tylko dotkniętych dni, zapis profilu - wersję profilu; odpowiedź dla zakresu jest zapisana
+# pod skrótem wszystkich wersji, więc po zmianie po prostu przestaje być trafiana i wygasa po TTL.
+# Brakującą wersję (np. wyrzuconą z cache) zastępuje nowy token, więc stara odpowiedź nigdy nie wraca.
+# Te same wersje są walidatorami ETag/Last-Modified w conditional.py.
+
+DEFAULT_SETTINGS = {
+    'ALIAS': 'default',
+    'TTL': 3600,  # sekundy; ogranicza też nieaktualność wieku (PPM) po urodzinach
+    'ALLOW_PROCESS_LOCAL': False,  # LocMem tylko przy jednym procesie (runserver, testy)
+}
+
+
+def is_process_local(alias):
+    # LocMemCache żyje w pamięci jednego procesu - inne workery nie widzą jego zmian
+    return isinstance(caches[alias], LocMemCache)
+
+
+def _day_key(user_id, day):
+    return f"summary:day:{user_id}:{day}"
+
+
+def _profile_key(user_id):
+    return f"summary:profile:{user_id}"
+
+
+def _new_version():
+    # "<czas zmiany>.<losowy token>" - czas służy jako Last-Modified w warunkowych GET-ach
+    return f"{int(time.time())}.{uuid.uuid4().hex}"
+
+
+def _changed_at(version):
+    timestamp, _, _ = version.partition('.')
+    return int(timestamp) if timestamp.isdigit() else 0
+
+
+class SummaryCache:
+    def __init__(self, alias, ttl, allow_process_local=False):
+        self.alias = alias
+        self.ttl = ttl
+        self.allow_process_local = allow_process_local
+        self._lock = threading.Lock()
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'recompute_ms': 0.0,
+            'invalidated_days': 0,
+            'invalidated_profiles': 0,
+        }
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_SETTINGS, **getattr(settings, 'SUMMARY_CACHE', {})}
+        return cls(alias=options['ALIAS'], ttl=options['TTL'], allow_process_local=options['ALLOW_PROCESS_LOCAL'])
+
+    @property
+    def enabled(self):
+        # Unieważnienie w cache jednego procesu nie dociera do pozostałych workerów - bez wspólnego
+        # backendu nie cache'ujemy wcale, zamiast serwować nieaktualne podsumowania przez cały TTL
+        return self.allow_process_local or not is_process_local(self.alias)
+
+    @property
+    def cache(self):
+        # caches[...] zwraca obiekt per wątek, więc nie trzymamy go w instancji
+        return caches[self.alias]
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def validators(self, user_id, start_date=None, end_date=None):
+        # (skrót wersji, czas ostatniej zmiany) profilu i wszystkich dni zakresu; bez zakresu - tylko profilu.
+        # Skrót zmienia się po każdym zapisie, który dotyczy zakresu
+        keys = [_profile_key(user_id)]
+        if start_date is not None:
+            keys += [_day_key(user_id, start_date + timedelta(days=n))
+                     for n in range((end_date - start_date).days + 1)]
+        versions = self.cache.get_many(keys)
+        missing = {key: _new_version() for key in keys if key not in versions}
+        if missing:
+            self.cache.set_many(missing, timeout=None)
+            versions.update(missing)
+
+        digest = hashlib.sha1("|".join(versions[key] for key in keys).encode()).hexdigest()
+        return digest, max(_changed_at(versions[key]) for key in keys)
+
+    def version(self, user_id, start_date, end_date):
+        return self.validators(user_id, start_date, end_date)[0]
+
+    def get_or_compute(self, user_id, name, start_date, end_date, compute):
+        if not self.enabled:
+            self._count('misses')
+            return compute()
+
+        key = f"summary:{name}:{user_id}:{start_date}:{end_date}:{self.version(user_id, start_date, end_date)}"
+        data = self.cache.get(key)
+        if data is not None:
+            self._count('hits')
+            return data
+
+        started = time.perf_counter()
+        data = compute()
+        elapsed = (time.perf_counter() - started) * 1000
+        self.cache.set(key, data, timeout=self.ttl)
+        with self._lock:
+            self.counters['misses'] += 1
+            self.counters['recompute_ms'] += elapsed
+        return data
+
+    def invalidate_days(self, user_id, dates):
+        self.cache.set_many({_day_key(user_id, day): _new_version() for day in dates}, timeout=None)
+        self._count('invalidated_days', len(dates))
+
+    def invalidate_profile(self, user_id):
+        self.cache.set(_profile_key(user_id), _new_version(), timeout=None)
+        self._count('invalidated_profiles')
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_ratio'] = round(counters['hits'] / lookups, 4) if lookups else None
+        counters['avg_recompute_ms'] = (
+            round(counters['recompute_ms'] / counters['misses'], 3) if counters['misses'] else None
+        )
+        counters['recompute_ms'] = round(counters['recompute_ms'], 3)
+        counters['enabled'] = self.enabled
+        return counters
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SummaryCache.from_settings()
+    return _cache
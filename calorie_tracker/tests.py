@@ -1,9 +1,44 @@
-from django.test import TestCase
+import gzip
+import json
+from contextlib import nullcontext
+from io import StringIO
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import Mock, patch
+import tempfile
+from pathlib import Path
+import requests
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.admin import AdminSite
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
 from django.contrib.auth.models import User
-from .models import Meal, Activity, UserProfile
+from django.core.cache import cache
+from django.db import IntegrityError, connections, router
+from django.utils import timezone
+from .models import Meal, Activity, UserProfile, NutrientCacheEntry, Food, IdempotencyKey, RawPayload, DailyBalance, \
+    ProfileMetrics, UserShard
+from .idempotency import purge_expired_keys
+from .food_index import open_food_index, build_index, get_food_index
+from .nutrition_cache import get_nutrient_cache, SingleFlight
+from .summary_cache import get_summary_cache
+from .db_router import replica_reads, pin_to_primary
+from .sharding import user_shard, user_writes, hashed_shard, shard_aliases, shard_for, shard_report, move_user, \
+    ensure_user_row, _set_shard, ShardRoutingError, ShardConflict, UserMoving
+from .population import refresh_profile_metrics, population_report
+from .views import calculate_ppm, calculate_age
+from .query_parser import parse_query
+from .nutritionix import NutritionixClient, NutritionixError, CircuitBreaker, CircuitOpenError
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from .renderers import FastJSONRenderer
+from .admin import MealAdmin
 
 
 class ModelTests(TestCase):
@@ -26,6 +61,7 @@ class ModelTests(TestCase):
 
 class APITests(APITestCase):
     def setUp(self):
+        cache.clear()  # cache podsumowań przeżywa rollback bazy między testami
         self.user = User.objects.create_user(username='testuser', password='12345')
         self.client.force_authenticate(user=self.user)
 
@@ -34,7 +70,1154 @@ class APITests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_daily_summary_lists_entries_without_loading_models(self):
+        Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-01-01",
+                            raw_api_data={"food_name": "pizza", "nf_calories": 800})
+        Activity.objects.create(user=self.user, activity_type='SWIM', duration=45, calories_burned=350,
+                                date="2025-01-01")
+
+        # DailyBalance, posiłki, aktywności, profil
+        with self.assertNumQueries(4):
+            data = self.client.get(reverse('daily-summary'), {"date": "2025-01-01"}).json()
+
+        self.assertEqual(data["total_eaten"], 800)
+        self.assertEqual(data["meals"], [{"meal": "pizza", "calories": 800}])
+        self.assertEqual(data["activities"], [{"activity_type": "Pływanie", "duration": 45, "calories_burned": 350}])
+
+    def test_add_meal_creates_all_foods_in_one_insert(self):
+        foods = [{"food_name": f"food {i}", "nf_calories": 100 + i} for i in range(10)]
+        # SAVEPOINT, INSERT payloadów, INSERT posiłków, 2x SELECT + upsert DailyBalance, RELEASE
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('add-meal'), {"foods": foods, "date": "2025-01-01"}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()["meals"]), 10)
+        self.assertTrue(all(meal["id"] for meal in response.json()["meals"]))
+
+    def test_add_meal_rejects_whole_list_on_invalid_food(self):
+        foods = [{"food_name": "apple", "nf_calories": 95}, {"food_name": "broken", "nf_calories": "abc"}]
+        response = self.client.post(reverse('add-meal'), {"foods": foods, "date": "2025-01-01"}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("1", response.json()["details"])
+        self.assertFalse(Meal.objects.exists())
+
+    def test_range_summary_query_count_does_not_grow_with_range(self):
+        for day in ("2025-01-01", "2025-01-15", "2025-02-20"):
+            Meal.objects.create(user=self.user, meal="pizza", calories=800, date=day)
+            Activity.objects.create(user=self.user, activity_type='RUN', duration=30, calories_burned=300, date=day)
+
+        # profil, DailyBalance, posiłki, aktywności - tyle samo dla tygodnia i kwartału
+        for start in ("2025-01-01", "2024-12-01"):
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse('range-summary-api'), {"start": start, "end": "2025-02-28"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = response.json()
+        self.assertEqual(len(data["daily_data"]), 90)
+        self.assertEqual(data["summary"]["total_eaten"], 2400)
+        day = next(d for d in data["daily_data"] if d["date"] == "2025-01-15")
+        self.assertEqual(day["meals"], ["pizza (800.0 kcal)"])
+        self.assertEqual(day["activities"], ["Bieganie - 30 min, 300 kcal"])
+
+        # Ostatni tydzień jest pusty - list wpisów w ogóle nie pobieramy
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(reverse('weekly-summary-api')).status_code, status.HTTP_200_OK)
+
+    def test_activity_stats_series_and_previous_period_in_one_query(self):
+        today = date.today()
+        for days_ago, activity_type, kcal in ((0, 'RUN', 300), (0, 'SWIM', 200), (2, 'RUN', 100), (10, 'RUN', 400)):
+            Activity.objects.create(user=self.user, activity_type=activity_type, duration=30,
+                                    calories_burned=kcal, date=today - timedelta(days=days_ago))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('activity-stats'), {"range": "week", "split": "type"})
+        data = response.json()
+
+        self.assertEqual(data["total_calories"], 600)
+        self.assertEqual(len(data["series"]), 8)
+        self.assertEqual(data["series"][-1]["total_calories"], 500)
+        self.assertEqual([t["activity_type"] for t in data["series"][-1]["by_type"]], ["RUN", "SWIM"])
+        self.assertEqual(data["previous"]["total_calories"], 400)
+        self.assertEqual(data["change_percent"]["total_calories"], 50.0)
+
+        monthly = self.client.get(reverse('activity-stats'), {"range": "year", "bucket": "month"}).json()
+        self.assertEqual(sum(item["count"] for item in monthly["series"]), 4)
+        self.assertTrue(all(item["period"].endswith("-01") for item in monthly["series"]))
+
 
 from django.test import TestCase
 
 # Create your tests here.
+
+
+class NutrientCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cacheuser', password='12345')
+        self.client.force_authenticate(user=self.user)
+        self.cache = get_nutrient_cache()
+        self.cache.clear_memory()
+
+    @patch('calorie_tracker.views.get_nutritionix_client')
+    def test_second_lookup_served_from_cache(self, mock_client):
+        mock_post = mock_client.return_value.natural_nutrients
+        mock_post.return_value = {"foods": [{"food_name": "banana", "nf_calories": 105}]}
+        url = reverse('nutritionix-meal')
+
+        first = self.client.post(url, {"meal": "Banana"}, format='json')
+        second = self.client.post(url, {"meal": "  banana "}, format='json')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(mock_post.call_count, 1)
+
+    def test_persistent_layer_survives_memory_reset(self):
+        self.cache.set("2 eggs", {"foods": []})
+        self.cache.clear_memory()
+
+        self.assertEqual(self.cache.get("2 Eggs"), {"foods": []})
+        self.assertEqual(NutrientCacheEntry.objects.get().hit_count, 1)
+
+    def test_expired_entries_are_pruned(self):
+        self.cache.set("apple", {"foods": []})
+        NutrientCacheEntry.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.cache.clear_memory()
+
+        self.assertIsNone(self.cache.get("apple"))
+        self.assertEqual(self.cache.prune(), 1)
+
+    @patch('calorie_tracker.views.get_nutritionix_client')
+    def test_batch_lookup_mixes_cache_hits_and_errors(self, mock_client):
+        def fake_lookup(query):
+            if query == "unknown":
+                raise NutritionixError("We couldn't match any of your foods", status_code=404)
+            return {"foods": [{"food_name": query}]}
+
+        mock_client.return_value.natural_nutrients.side_effect = fake_lookup
+        self.cache.set("banana", {"foods": [{"food_name": "banana"}]})
+
+        response = self.client.post(
+            reverse('nutritionix-batch'), {"meals": ["Banana", "apple", "unknown", "APPLE"]}, format='json'
+        )
+        results = response.json()["results"]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["query"] for r in results], ["Banana", "apple", "unknown", "APPLE"])
+        self.assertEqual(results[1]["data"], results[3]["data"])
+        self.assertIn("error", results[2])
+        self.assertEqual(mock_client.return_value.natural_nutrients.call_count, 2)
+
+    @patch('calorie_tracker.views.get_nutritionix_client')
+    def test_other_quantities_are_scaled_from_cache(self, mock_client):
+        mock_client.return_value.natural_nutrients.return_value = {"foods": [{
+            "food_name": "egg", "serving_qty": 2, "serving_unit": "large",
+            "nf_calories": 143, "nf_protein": 12.6, "serving_weight_grams": 100,
+        }]}
+        url = reverse('nutritionix-meal')
+
+        self.client.post(url, {"meal": "2 eggs"}, format='json')
+        food = self.client.post(url, {"meal": "3 eggs"}, format='json').json()["foods"][0]
+
+        self.assertEqual(mock_client.return_value.natural_nutrients.call_count, 1)
+        self.assertEqual(food["serving_qty"], 3)
+        self.assertEqual(food["nf_calories"], 214.5)
+        self.assertEqual(food["serving_weight_grams"], 150)
+
+
+class QueryParserTests(TestCase):
+    def test_quantity_unit_and_food(self):
+        self.assertEqual(parse_query("2 Eggs"), (2, '', 'egg', True))
+        self.assertEqual(parse_query("1 1/2 cups of rice"), (1.5, 'cup', 'rice', True))
+        self.assertEqual(parse_query("100g chicken breasts"), (100, 'g', 'chicken breast', True))
+        self.assertEqual(parse_query("a banana"), (1, '', 'banana', True))
+        self.assertEqual(parse_query("cherries"), (1, '', 'cherry', True))
+
+    def test_multi_food_queries_are_not_scalable(self):
+        self.assertFalse(parse_query("2 eggs and toast").scalable)
+        self.assertFalse(parse_query("jajka i chleb").scalable)
+
+    def test_zero_denominator_is_not_a_quantity(self):
+        self.assertEqual(parse_query("1/0 egg"), (1.0, '', '1/0 egg', False))
+        self.assertEqual(parse_query("1 1/0 egg"), (1.0, '', '1 1/0 egg', False))
+
+    def test_article_after_half_is_dropped(self):
+        self.assertEqual(parse_query("half a banana"), (0.5, '', 'banana', True))
+        self.assertEqual(parse_query("half an apple"), (0.5, '', 'apple', True))
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_identical_calls_are_coalesced(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            release.wait(5)
+            return {"foods": []}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("banana", slow_fetch)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        while flight.stats()['coalesced'] < 4:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"foods": []}] * 5)
+        self.assertEqual(flight.stats(), {'executed': 1, 'coalesced': 4, 'in_flight': 0})
+
+    def test_errors_are_shared_and_not_cached(self):
+        flight = SingleFlight()
+
+        def failing():
+            raise NutritionixError("down")
+
+        with self.assertRaises(NutritionixError):
+            flight.do("apple", failing)
+        self.assertEqual(flight.do("apple", lambda: 1), 1)
+
+
+class StubNutritionixHandler(BaseHTTPRequestHandler):
+    # Kolejka statusów do zwrócenia; po jej wyczerpaniu odpowiadamy 200
+    statuses = []
+    calls = 0
+
+    def do_POST(self):
+        type(self).calls += 1
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        code = self.statuses.pop(0) if self.statuses else 200
+        payload = json.dumps({"foods": [{"food_name": body["query"]}]}).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class NutritionixClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(('127.0.0.1', 0), StubNutritionixHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubNutritionixHandler.statuses = []
+        StubNutritionixHandler.calls = 0
+
+    def make_client(self, **kwargs):
+        kwargs.setdefault('breaker', CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        return NutritionixClient('id', 'key', base_url=self.base_url, sleep=lambda s: None, **kwargs)
+
+    def test_retries_server_errors(self):
+        StubNutritionixHandler.statuses = [503, 429]
+        data = self.make_client(retries=2).natural_nutrients("apple")
+
+        self.assertEqual(data["foods"][0]["food_name"], "apple")
+        self.assertEqual(StubNutritionixHandler.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        StubNutritionixHandler.statuses = [404]
+        with self.assertRaises(NutritionixError) as ctx:
+            self.make_client().natural_nutrients("???")
+
+        self.assertEqual(ctx.exception.status_code, 404)
+        self.assertEqual(StubNutritionixHandler.calls, 1)
+
+    def test_breaker_opens_after_repeated_failures(self):
+        StubNutritionixHandler.statuses = [500] * 4
+        client = self.make_client(retries=1)
+        for _ in range(2):
+            with self.assertRaises(NutritionixError):
+                client.natural_nutrients("apple")
+
+        with self.assertRaises(CircuitOpenError):
+            client.natural_nutrients("apple")
+        self.assertEqual(StubNutritionixHandler.calls, 4)
+
+    def test_any_transport_error_is_retried_and_counted(self):
+        transport = Mock()
+        transport.post.side_effect = requests.exceptions.ChunkedEncodingError("connection broken")
+        client = self.make_client(retries=1, transport=transport)
+        for _ in range(2):
+            with self.assertRaises(NutritionixError):
+                client.natural_nutrients("apple")
+
+        self.assertEqual(transport.post.call_count, 4)
+        with self.assertRaises(CircuitOpenError):
+            client.natural_nutrients("apple")
+
+
+class FoodIndexTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='fooduser', password='12345')
+        self.client.force_authenticate(user=self.user)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        dump = Path(tmp.name) / 'foods.jsonl'
+        dump.write_text("\n".join(json.dumps(row) for row in [
+            {"food_name": "Banana", "nf_calories": 105, "serving_qty": 1, "serving_unit": "medium"},
+            {"food_name": "Banana bread", "nf_calories": 196, "serving_qty": 1, "serving_unit": "slice"},
+            {"food_name": "Chicken breast", "nf_calories": 284, "nf_protein": 53.4, "serving_unit": "breast"},
+            {"food_name": "", "nf_calories": 1},
+        ]), encoding='utf-8')
+
+        settings_override = override_settings(FOOD_INDEX_PATH=Path(tmp.name) / 'food_index.bin')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('load_foods', str(dump), stdout=StringIO(), stderr=StringIO())
+        self.path = Path(tmp.name) / 'food_index.bin'
+        self.index = self.enterContext(open_food_index())
+
+    def test_load_skips_invalid_rows(self):
+        self.assertEqual(Food.objects.count(), 3)
+        self.assertEqual(self.index.size, 3)
+
+    def test_prefix_and_typo_tolerant_search(self):
+        self.assertEqual([name for _, name, _ in self.index.prefix("bana")], ["banana", "banana bread"])
+        self.assertEqual(self.index.fuzzy("chiken brest")[0][1], "chicken breast")
+
+    @patch('calorie_tracker.views.get_nutritionix_client')
+    def test_known_food_served_without_upstream(self, mock_client):
+        response = self.client.post(reverse('nutritionix-meal'), {"meal": "BANANA"}, format='json')
+
+        self.assertEqual(response.json()["foods"][0]["nf_calories"], 105)
+        mock_client.return_value.natural_nutrients.assert_not_called()
+
+    @patch('calorie_tracker.views.get_nutritionix_client')
+    def test_outage_fallback_is_exact_scaled_and_approximate(self, mock_client):
+        mock_client.return_value.natural_nutrients.side_effect = CircuitOpenError("down", status_code=503)
+        url = reverse('nutritionix-meal')
+
+        data = self.client.post(url, {"meal": "2 bananas"}, format='json').json()
+        self.assertEqual((data["foods"][0]["nf_calories"], data["foods"][0]["serving_qty"]), (210, 2))
+        self.assertTrue(data["approximate"])
+        # Literówka albo inna jednostka niż porcja z bazy - bez zgadywania
+        for meal in ("2 bananna", "200 g banana"):
+            response = self.client.post(url, {"meal": meal}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @patch('calorie_tracker.views.get_nutritionix_client')
+    def test_batch_uses_local_foods_and_outage_fallback(self, mock_client):
+        mock_client.return_value.natural_nutrients.side_effect = CircuitOpenError("down", status_code=503)
+
+        response = self.client.post(
+            reverse('nutritionix-batch'), {"meals": ["Banana", "half a banana", "bananna"]}, format='json'
+        )
+        banana, half, typo = response.json()["results"]
+
+        self.assertEqual(banana["data"]["source"], "local")
+        self.assertNotIn("approximate", banana["data"])
+        self.assertEqual(half["data"]["foods"][0]["nf_calories"], 52.5)
+        self.assertTrue(half["data"]["approximate"])
+        self.assertIn("error", typo)
+        self.assertEqual(mock_client.return_value.natural_nutrients.call_count, 2)
+
+    def test_autocomplete(self):
+        response = self.client.get(reverse('food-autocomplete'), {"q": "chick"})
+
+        self.assertEqual(response.json()["results"][0]["food_name"], "Chicken breast")
+
+    def test_large_ids_and_reload_closes_previous_index(self):
+        build_index([(2 ** 40 + 7, "banana")], self.path)
+        reloaded = get_food_index()
+
+        self.assertEqual(reloaded.exact("banana"), 2 ** 40 + 7)
+        # Stary indeks ma jeszcze czytelnika (setUp) - zamyka go dopiero koniec bloku with
+        self.assertTrue(self.index.retired)
+        self.assertFalse(self.index._mmap.closed)
+        self.doCleanups()
+        self.assertTrue(self.index._mmap.closed)
+
+
+class ImportHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='12345')
+        self.client.force_authenticate(user=self.user)
+
+    def test_csv_activities_import_reports_row_errors(self):
+        content = (
+            "activity_type,duration,calories_burned,date,notes\n"
+            "RUN,30,300,2024-05-01,rano\n"
+            "DANCE,30,200,2024-05-01,\n"
+            "SWIM,45,,2024-05-02,\n"
+            "GYM,60,400,2024-05-03,\n"
+        ).encode()
+        upload = SimpleUploadedFile("history.csv", content, content_type="text/csv")
+
+        response = self.client.post(reverse('import-history'), {"file": upload, "kind": "activities"})
+        body = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((body["processed"], body["created"], body["failed"]), (4, 2, 2))
+        self.assertEqual([e["line"] for e in body["errors"]], [3, 4])
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 2)
+
+    def test_jsonl_meals_import_in_chunks(self):
+        rows = [json.dumps({"food_name": f"meal {i}", "nf_calories": i, "date": "2024-01-01"}) for i in range(25)]
+        path = Path(tempfile.mkdtemp()) / "meals.jsonl"
+        path.write_text("\n".join(rows + ["{broken"]), encoding='utf-8')
+        self.addCleanup(path.unlink)
+
+        out = StringIO()
+        call_command('import_history', 'importer', str(path), kind='meals', chunk_size=10, stdout=out, stderr=StringIO())
+
+        self.assertEqual(Meal.objects.filter(user=self.user).count(), 25)
+        self.assertIn("26 rows processed, 25 created, 1 failed", out.getvalue())
+
+
+    def test_undecodable_or_malformed_files_are_reported_not_raised(self):
+        content = (
+            "activity_type,duration,calories_burned,date,notes\n"
+            "RUN,30,300,2024-05-01,rano\n"
+            f"GYM,60,400,2024-05-03,\"{'x' * 200000}\"\n"
+            "SWIM,45,100,2024-05-02,\n"
+        ).encode()
+        upload = SimpleUploadedFile("history.csv", content, content_type="text/csv")
+        body = self.client.post(reverse('import-history'), {"file": upload, "kind": "activities"}).json()
+        self.assertEqual((body["created"], body["failed"]), (2, 1))
+        self.assertIn("field limit", body["errors"][0]["error"])
+
+        upload = SimpleUploadedFile("meals.jsonl", "jabłko;95".encode('cp1250'), content_type="text/plain")
+        response = self.client.post(reverse('import-history'), {"file": upload, "kind": "meals"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["errors"], [{"line": 1, "error": "File is not valid UTF-8"}])
+
+
+class ExportHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='12345')
+        self.client.force_authenticate(user=self.user)
+        Meal.objects.create(user=self.user, meal="pizza", calories=800, date=date(2025, 1, 2),
+                            raw_api_data={"food_name": "pizza", "nf_calories": 800})
+        Meal.objects.bulk_create([
+            Meal(user=self.user, meal=f"meal {i}", calories=i, date=date(2025, 1, 1)) for i in range(5)
+        ])
+
+    def test_streams_gzipped_jsonl_with_raw_data(self):
+        response = self.client.get(reverse('export-history'),
+                                   {"kind": "meals", "format": "ndjson", "gzip": "1", "include_raw": "1"})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="meals.jsonl.gz"')
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]["raw_api_data"], {"food_name": "pizza", "nf_calories": 800})
+        self.assertIsNone(rows[1]["raw_api_data"])
+
+    def test_csv_export_reimports_in_chunks(self):
+        path = Path(tempfile.mkdtemp()) / "meals.csv"
+        self.addCleanup(path.unlink)
+
+        call_command('export_history', 'exporter', kind='meals', output=str(path), chunk_size=2, stdout=StringIO())
+        other = User.objects.create_user(username='copy', password='12345')
+        call_command('import_history', 'copy', str(path), kind='meals', stdout=StringIO(), stderr=StringIO())
+
+        fields = ('meal', 'calories', 'date')
+        self.assertCountEqual(Meal.objects.filter(user=other).values_list(*fields),
+                              Meal.objects.filter(user=self.user).values_list(*fields))
+
+    def test_rejects_unknown_format(self):
+        response = self.client.get(reverse('export-history'), {"kind": "meals", "format": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='retry', password='12345')
+        self.client.force_authenticate(user=self.user)
+        self.payload = {"foods": [{"food_name": "apple", "nf_calories": 95}], "date": "2025-01-01"}
+
+    def test_retry_replays_stored_response(self):
+        first = self.client.post(reverse('add-meal'), self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        second = self.client.post(reverse('add-meal'), self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Meal.objects.count(), 1)
+
+    def test_key_reused_with_different_payload_is_rejected(self):
+        self.client.post(reverse('add-meal'), self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.payload["date"] = "2025-01-02"
+        response = self.client.post(reverse('add-meal'), self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Meal.objects.count(), 1)
+
+    def test_reservation_is_retried_after_concurrent_request_rolled_back(self):
+        create = IdempotencyKey.objects.create
+        # Równoległe pierwsze żądanie trzymało klucz, a potem wycofało się po 5xx - rekordu już nie ma
+        attempts = iter([IntegrityError()])
+
+        def reserve(**kwargs):
+            error = next(attempts, None)
+            if error:
+                raise error
+            return create(**kwargs)
+
+        with patch.object(IdempotencyKey.objects, 'create', side_effect=reserve):
+            response = self.client.post(reverse('add-meal'), self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+    def test_expired_keys_are_purged(self):
+        self.client.post(reverse('add-meal'), self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(purge_expired_keys(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class RawPayloadTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='raw', password='12345')
+        self.client.force_authenticate(user=self.user)
+
+    def test_identical_payloads_are_stored_once(self):
+        food = {"food_name": "apple", "nf_calories": 95, "photo": {"thumb": "x"}}
+        for day in ("2025-01-01", "2025-01-02"):
+            self.client.post(reverse('add-meal'), {"foods": [food, food], "date": day}, format='json')
+
+        self.assertEqual(Meal.objects.count(), 4)
+        self.assertEqual(RawPayload.objects.count(), 1)
+        self.assertEqual(Meal.objects.first().raw_api_data, food)
+
+    def test_raw_api_data_is_returned_only_on_request(self):
+        Meal.objects.create(user=self.user, meal="egg", calories=70, date="2025-01-01",
+                            raw_api_data={"food_name": "egg"})
+        Meal.objects.create(user=self.user, meal="manual", calories=100, date="2025-01-01")
+
+        meals = self.client.get(reverse('meals-today'), {"date": "2025-01-01"}).json()["meals"]
+        self.assertNotIn("raw_api_data", meals[0])
+
+        with self.assertNumQueries(1):
+            meals = self.client.get(reverse('meals-today'),
+                                    {"date": "2025-01-01", "fields": "meal,raw_api_data"}).json()["meals"]
+
+        self.assertEqual(meals, [{"meal": "manual", "raw_api_data": None},
+                                 {"meal": "egg", "raw_api_data": {"food_name": "egg"}}])
+
+
+class DailyBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollup', password='12345')
+
+    def balance(self, day):
+        return DailyBalance.objects.filter(user=self.user, date=day).values(
+            'eaten_kcal', 'burned_kcal', 'activity_minutes', 'meal_count', 'activity_count'
+        ).first()
+
+    def test_rollup_follows_saves_moves_and_deletes(self):
+        meal = Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-03-01")
+        Meal.objects.create(user=self.user, meal="salad", calories=200, date="2025-03-01")
+        Activity.objects.create(user=self.user, activity_type='RUN', duration=40, calories_burned=400,
+                                date="2025-03-01")
+
+        self.assertEqual(self.balance("2025-03-01"), {
+            'eaten_kcal': 1000, 'burned_kcal': 400, 'activity_minutes': 40, 'meal_count': 2, 'activity_count': 1,
+        })
+
+        meal.date = "2025-03-02"
+        meal.save()
+        self.assertEqual(self.balance("2025-03-01")['eaten_kcal'], 200)
+        self.assertEqual(self.balance("2025-03-02")['eaten_kcal'], 800)
+
+        meal.delete()
+        self.assertIsNone(self.balance("2025-03-02"))
+
+    def test_rebuild_command_restores_rollups(self):
+        Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-03-01")
+        DailyBalance.objects.all().delete()
+
+        call_command('rebuild_daily_balances', 'rollup', stdout=StringIO())
+
+        self.assertEqual(self.balance("2025-03-01")['eaten_kcal'], 800)
+
+
+class TrendTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='trends', password='12345')
+        self.client.force_authenticate(user=self.user)
+        for day, eaten, burned in (("2025-01-01", 500, 800), ("2025-01-02", 500, 700),
+                                   ("2025-01-03", 1000, 0), ("2025-01-04", 200, 300)):
+            Meal.objects.create(user=self.user, meal="meal", calories=eaten, date=day)
+            if burned:
+                Activity.objects.create(user=self.user, activity_type='RUN', duration=30,
+                                        calories_burned=burned, date=day)
+
+    def get_trends(self):
+        with self.assertNumQueries(2):  # profil + DailyBalance
+            response = self.client.get(reverse('trends-api'), {"start": "2025-01-01", "end": "2025-01-05"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_rolling_averages_streaks_and_cumulative_balance(self):
+        data = self.get_trends()
+
+        self.assertEqual(data["balance"], [-300, -200, 1000, -100, 0])
+        self.assertEqual(data["cumulative_balance"], [-300, -500, 500, 400, 400])
+        self.assertEqual(data["rolling"]["7"]["balance"][:2], [-300, -250])
+        # 5 stycznia bez wpisów - nie przerywa bilansu, ale nie liczy się do serii deficytu
+        self.assertEqual(data["deficit_streaks"]["current"], 0)
+        self.assertEqual(data["deficit_streaks"]["longest"],
+                         {"length": 2, "start": "2025-01-01", "end": "2025-01-02"})
+
+    def test_python_fallback_matches_numpy(self):
+        data = self.get_trends()
+        with patch('calorie_tracker.trends.np', None):
+            fallback = self.get_trends()
+
+        self.assertEqual(fallback.pop("engine"), "python")
+        data.pop("engine")
+        self.assertEqual(fallback, data)
+
+
+class SummaryCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='12345')
+        self.client.force_authenticate(user=self.user)
+        Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-01-01")
+
+    def daily(self, day="2025-01-01"):
+        return self.client.get(reverse('daily-summary'), {"date": day}).json()
+
+    def test_repeated_summary_is_served_without_queries(self):
+        self.daily()
+        hits = get_summary_cache().stats()['hits']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.daily()["total_eaten"], 800)
+        self.assertEqual(get_summary_cache().stats()['hits'], hits + 1)
+
+    def test_writes_invalidate_only_affected_days(self):
+        self.daily()
+        self.daily("2025-01-02")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add-meal'), {"foods": [{"food_name": "apple", "nf_calories": 95}],
+                                                   "date": "2025-01-02"}, format='json')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.daily()["total_eaten"], 800)
+        self.assertEqual(self.daily("2025-01-02")["total_eaten"], 95)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('api-profile'), {"weight": 70, "height": 175, "gender": "M",
+                                                     "date_of_birth": "1990-01-01"}, format='json')
+        self.assertIsNotNone(self.daily()["ppm"])
+
+    def test_range_summaries_share_entries_and_see_new_days(self):
+        params = {"start": "2024-12-30", "end": "2025-01-05"}
+        self.client.get(reverse('range-summary-api'), params)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.create(user=self.user, activity_type='RUN', duration=30, calories_burned=300,
+                                    date="2025-01-05")
+
+        summary = self.client.get(reverse('range-summary-api'), params).json()["summary"]
+        self.assertEqual(summary["total_burned"], 300)
+
+    def test_process_local_cache_is_not_used_outside_debug(self):
+        with patch.object(get_summary_cache(), 'allow_process_local', False):
+            first = self.client.get(reverse('daily-summary'), {"date": "2025-01-01"})
+            # Bez zapisu w cache i bez ETaga - inny worker nie zna tych wersji
+            Meal.objects.create(user=self.user, meal="apple", calories=95, date="2025-01-01")
+            self.assertEqual(self.daily()["total_eaten"], 895)
+            self.assertFalse(get_summary_cache().stats()['enabled'])
+        self.assertNotIn('ETag', first)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='etag', password='12345')
+        self.client.force_authenticate(user=self.user)
+        Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-01-01")
+
+    def test_unchanged_summary_answers_304_without_queries(self):
+        url = reverse('daily-summary')
+        first = self.client.get(url, {"date": "2025-01-01"})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, {"date": "2025-01-01"}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        since = self.client.get(url, {"date": "2025-01-01"}, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Inny dzień ma inny ETag
+        other = self.client.get(url, {"date": "2025-01-02"}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(other.status_code, status.HTTP_200_OK)
+
+    def test_write_changes_etag_of_affected_views(self):
+        meals_url, weekly_url = reverse('meals-today'), reverse('weekly-summary-api')
+        meals = self.client.get(meals_url, {"date": "2025-01-01"})
+        weekly = self.client.get(weekly_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Meal.objects.create(user=self.user, meal="apple", calories=95, date="2025-01-01")
+
+        fresh = self.client.get(meals_url, {"date": "2025-01-01"}, HTTP_IF_NONE_MATCH=meals['ETag'])
+        self.assertEqual(fresh.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(fresh.json()["meals"]), 2)
+        # Zmiana sprzed tygodnia nie unieważnia podsumowania tygodniowego
+        self.assertEqual(self.client.get(weekly_url, HTTP_IF_NONE_MATCH=weekly['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def test_profile_update_changes_profile_etag(self):
+        url = reverse('api-profile')
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(url, {"weight": 80}, format='json')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["weight"], 80)
+
+    def test_last_modified_moves_to_midnight_and_skips_invalid_ranges(self):
+        url = reverse('weekly-summary-api')
+        last_modified = self.client.get(url)['Last-Modified']
+
+        class Tomorrow(date):
+            @classmethod
+            def today(cls):
+                return date.today() + timedelta(days=1)
+
+        # "Ostatnie 7 dni" po północy to inne dane, choć żaden dzień się nie zmienił
+        with patch('calorie_tracker.conditional.date', Tomorrow):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('range-summary-api'), {"start": "2025-01-05", "end": "2025-01-01"},
+                                   HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProfileMetricsTests(APITestCase):
+    def setUp(self):
+        profiles = [(50, 180, '2000-06-15', 'M'), (90, 170, '1980-01-01', 'F'), (70, 175, None, 'M'), (None, 160, None, 'F')]
+        for i, (weight, height, born, gender) in enumerate(profiles):
+            user = User.objects.create_user(username=f'p{i}')
+            UserProfile.objects.filter(user=user).update(weight=weight, height=height, date_of_birth=born,
+                                                         gender=gender)
+
+    def assert_matches_single_profile_functions(self):
+        call_command('compute_profile_metrics', stdout=StringIO())
+
+        self.assertEqual(ProfileMetrics.objects.count(), 4)
+        for profile in UserProfile.objects.all():
+            metrics = ProfileMetrics.objects.get(user=profile.user)
+            self.assertEqual(metrics.age, profile.age)
+            self.assertEqual(metrics.bmi, profile.calculate_bmi())
+            ppm = calculate_ppm(profile)
+            if ppm is None:
+                self.assertIsNone(metrics.bmr)
+            else:
+                self.assertAlmostEqual(metrics.bmr, ppm, places=6)
+
+        categories = dict(ProfileMetrics.objects.values_list('user__username', 'bmi_category'))
+        self.assertEqual(categories, {'p0': 'UNDER', 'p1': 'OBESE', 'p2': 'NORMAL', 'p3': None})
+
+    def test_batch_metrics_match_single_profile_functions(self):
+        self.assert_matches_single_profile_functions()
+
+    def test_python_fallback_matches(self):
+        with patch('calorie_tracker.population.np', None):
+            self.assert_matches_single_profile_functions()
+
+    def test_future_date_of_birth_has_no_age_or_bmr(self):
+        user = User.objects.create_user(username='future')
+        UserProfile.objects.filter(user=user).update(weight=70, height=175, gender='M',
+                                                     date_of_birth=date.today() + timedelta(days=1))
+        for numpy in (True, False):
+            with patch('calorie_tracker.population.np', None) if not numpy else nullcontext():
+                refresh_profile_metrics()
+            metrics = ProfileMetrics.objects.get(user=user)
+            self.assertEqual((metrics.age, metrics.bmi, metrics.bmr), (None, 22.86, None))
+            self.assertEqual(ProfileMetrics.objects.count(), 5)
+
+    def test_report_is_staff_only(self):
+        user = User.objects.get(username='p0')
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(reverse('profile-metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        user.save()
+        report = self.client.post(reverse('profile-metrics')).json()
+        self.assertEqual(report["profiles"], 4)
+        self.assertEqual(sum(row["profiles"] for row in report["by_bmi_category"]), 4)
+
+
+class HistoryPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='history', password='12345')
+        self.client.force_authenticate(user=self.user)
+        # Po kilka posiłków dziennie - kursor musi rozróżniać wpisy z tej samej daty
+        Meal.objects.bulk_create([
+            Meal(user=self.user, meal=f"meal {i}", calories=100 + i, date=date(2025, 1, 1 + i // 4))
+            for i in range(25)
+        ])
+
+    def test_pages_follow_meal_ordering_without_gaps(self):
+        ids, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+            with self.assertNumQueries(1):
+                data = self.client.get(reverse('meal-history'), params).json()
+            ids += [row["id"] for row in data["results"]]
+            pages += 1
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, list(Meal.objects.filter(user=self.user).values_list('id', flat=True)))
+
+    def test_date_filters_and_invalid_cursor(self):
+        data = self.client.get(reverse('meal-history'), {"start": "2025-01-02", "end": "2025-01-03"}).json()
+        self.assertEqual({row["date"] for row in data["results"]}, {"2025-01-02", "2025-01-03"})
+        self.assertEqual(len(data["results"]), 8)
+
+        response = self.client.get(reverse('meal-history'), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_fields(self):
+        data = self.client.get(reverse('meal-history'), {"limit": 2, "fields": "calories"}).json()
+        self.assertEqual(data["results"], [{"calories": 124.0}, {"calories": 123.0}])
+        self.assertIsNotNone(data["next_cursor"])
+
+        response = self.client.get(reverse('activity-history'), {"fields": "duration,user"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("user", response.json()["error"])
+
+    def test_dashboard_renders_first_page(self):
+        UserProfile.objects.filter(user=self.user).update(weight=70, height=175, date_of_birth='1990-01-01')
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(len(response.context['recent_meals']), 10)
+        self.assertContains(response, 'data-cursor="%s"' % response.context['meals_next_cursor'])
+
+
+class DashboardBootstrapTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='bootstrap', password='12345')
+        UserProfile.objects.filter(user=self.user).update(weight=70, height=175, date_of_birth='1990-01-01',
+                                                          gender='M')
+        Meal.objects.create(user=self.user, meal="owsianka", calories=400, date=date.today())
+
+    def test_dashboard_embeds_weekly_payload(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('dashboard'))
+
+        self.assertContains(response, 'id="dashboard-data"')
+        self.assertNotContains(response, "/api/weekly-summary/")
+        payload = response.context['dashboard']
+        self.assertEqual(payload['weekly_summary']['total_eaten'], 400)
+        self.assertEqual(len(payload['daily_data']), 7)
+        self.assertEqual(response.context['bmi'], payload['profile']['bmi'])
+
+    def test_api_matches_weekly_summary_from_shared_cache(self):
+        self.client.force_authenticate(user=self.user)
+        weekly = self.client.get(reverse('weekly-summary-api')).json()
+
+        # Tydzień jest już w cache - zostaje tylko odczyt profilu
+        with self.assertNumQueries(1):
+            data = self.client.get(reverse('dashboard-api')).json()
+
+        self.assertEqual(data['weekly_summary'], weekly['weekly_summary'])
+        self.assertEqual(data['daily_data'], weekly['daily_data'])
+        self.assertEqual(data['profile']['age'], calculate_age(date(1990, 1, 1)))
+
+
+class FastJSONRendererTests(TestCase):
+    def test_output_matches_drf_json_renderer(self):
+        data = {"date": date(2025, 1, 1), "at": timezone.now(), "kcal": Decimal("12.50"), "tags": ("a", "ż"),
+                "nested": [{"n": None, "ok": True, "x": 1.5}]}
+
+        fast = FastJSONRenderer().render(data)
+
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(data)))
+
+
+@override_settings(DB_REPLICAS={'ALIASES': ['replica1', 'replica2'], 'STICKY_SECONDS': 60, 'ALLOW_PROCESS_LOCAL': True})
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='writer', password='12345')
+
+    def test_only_marked_reads_go_to_replicas(self):
+        self.assertEqual(router.db_for_read(Meal), 'default')
+        with replica_reads(self.user.id):
+            self.assertIn(router.db_for_read(Meal), {'replica1', 'replica2'})
+            self.assertEqual(router.db_for_write(Meal), 'default')
+        self.assertEqual(router.db_for_read(Meal), 'default')
+
+    def test_writer_reads_own_writes_from_primary(self):
+        other = User.objects.create_user(username='reader', password='12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-01-01")
+
+        with replica_reads(self.user.id):
+            self.assertEqual(router.db_for_read(Meal), 'default')
+        with replica_reads(other.id):
+            self.assertIn(router.db_for_read(Meal), {'replica1', 'replica2'})
+
+    def test_process_local_pin_cache_keeps_reads_on_primary(self):
+        with self.settings(DB_REPLICAS={'ALIASES': ['replica1', 'replica2']}):
+            pin_to_primary(self.user.id)
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Meal), 'default')
+
+    def test_pin_is_set_before_summaries_are_invalidated(self):
+        calls = []
+        with patch('calorie_tracker.signals.pin_to_primary', side_effect=lambda user_id: calls.append('pin')), \
+                patch.object(get_summary_cache(), 'invalidate_days', side_effect=lambda *args: calls.append('invalidate')):
+            with self.captureOnCommitCallbacks(execute=True):
+                Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-01-01")
+
+        self.assertEqual(calls, ['pin', 'invalidate'])
+
+
+class ShardRoutingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='sharded', password='12345')
+        self.legacy = User.objects.create_user(username='legacy', password='12345')
+        UserShard.objects.filter(user=self.legacy).delete()
+        UserShard.objects.update_or_create(user=self.user, defaults={'alias': 'shard1'})
+        cache.clear()
+
+    def test_user_data_routes_to_assigned_shard(self):
+        with self.settings(DB_SHARDS={'ALIASES': ['default', 'shard1']}):
+            self.assertEqual(router.db_for_read(Meal, instance=self.user), 'shard1')
+            self.assertEqual(router.db_for_read(UserProfile, instance=UserProfile(user=self.user)), 'shard1')
+            # Zapytania bez obiektu - po użytkowniku z kontekstu
+            with user_shard(self.user.id):
+                self.assertEqual(router.db_for_read(Meal), 'shard1')
+                self.assertEqual(router.db_for_read(Food), 'default')
+            with user_writes(self.user.id):
+                self.assertEqual(router.db_for_write(Meal), 'shard1')
+            # Bez wpisu w UserShard - dane sprzed włączenia shardingu zostają na primary
+            self.assertEqual(router.db_for_read(Activity, instance=self.legacy), 'default')
+
+    def test_unroutable_queries_and_writes_outside_user_writes_fail(self):
+        with self.settings(DB_SHARDS={'ALIASES': ['default', 'shard1']}):
+            ensure_user_row(self.user.id, 'shard1')
+            # Dotąd takie zapytania cicho trafiały na primary
+            with self.assertRaises(ShardRoutingError):
+                Meal.objects.filter(meal="pizza").exists()
+            with self.assertRaises(ShardRoutingError):
+                Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-01-01")
+            with user_shard(self.user.id), self.assertRaises(ShardRoutingError):
+                Meal.objects.filter(user=self.user).update(calories=1)
+
+            with user_writes(self.user.id):
+                meal = Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-01-01")
+            self.assertEqual(Meal.objects.using('shard1').get().pk, meal.pk)
+            self.assertGreater(meal.pk, 2 ** 40)
+
+    def test_admin_queries_name_their_shard(self):
+        site = AdminSite()
+        request = RequestFactory().get('/', {'shard': 'shard1'})
+        request.user = self.user
+        with self.settings(DB_SHARDS={'ALIASES': ['default', 'shard1']}):
+            ensure_user_row(self.user.id, 'shard1')
+            with user_writes(self.user.id):
+                meal = Meal.objects.create(user=self.user, meal="pizza", calories=800, date="2025-01-01")
+            meal_admin = MealAdmin(Meal, site)
+
+            # Zalogowany administrator nie wybiera sharda list - domyślnie primary, inny przez filtr
+            with user_shard(self.legacy.id):
+                self.assertEqual(meal_admin.get_queryset(request).db, 'default')
+                changelist = meal_admin.get_changelist_instance(request)
+                self.assertEqual(list(changelist.queryset), [meal])
+                self.assertEqual(meal_admin.get_object(request, str(meal.pk)), meal)
+            self.assertEqual(meal_admin.get_object(request, str(meal.pk))._state.db, 'shard1')
+
+    def test_moving_needs_shared_lookup_cache(self):
+        with self.settings(DB_SHARDS={'ALIASES': ['default', 'shard1']}):
+            with self.assertRaisesMessage(CommandError, 'process-local'):
+                call_command('rebalance_shards', 'sharded', to='default', stdout=StringIO())
+        self.assertEqual(UserShard.objects.get(user=self.user).alias, 'shard1')
+
+    def test_hashed_shard_is_stable_and_spread(self):
+        with self.settings(DB_SHARDS={'ALIASES': ['default', 'shard1', 'shard2']}):
+            shards = [hashed_shard(user_id) for user_id in range(1, 3001)]
+            self.assertEqual(shards, [hashed_shard(user_id) for user_id in range(1, 3001)])
+            self.assertTrue(all(800 < shards.count(alias) < 1200 for alias in ('default', 'shard1', 'shard2')))
+
+
+# LocMem w testach jest wspólny, bo wszystko dzieje się w jednym procesie
+@override_settings(DB_SHARDS={'ALIASES': ['default', 'shard1', 'shard2'], 'ALLOW_PROCESS_LOCAL': True})
+class ShardingTests(TransactionTestCase):
+    databases = '__all__'
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+        self.shards = shard_aliases()
+        self.users = [User.objects.create_user(username=f'user{i}', password='12345') for i in range(6)]
+        for user in self.users:
+            with user_writes(user.id):
+                UserProfile.objects.filter(user=user).update(weight=70, height=175, date_of_birth='1990-01-01')
+            self.add_meal(user)
+
+    def add_meal(self, user, name="pizza", calories=800):
+        self.client.force_login(user)
+        return self.client.post(reverse('add-meal'), {"foods": [{"food_name": name, "nf_calories": calories}],
+                                                      "date": str(date.today())}, format='json')
+
+    def meal_ids(self, user, alias=None):
+        return set(Meal.objects.using(alias or shard_for(user.id)).filter(user=user).values_list('id', flat=True))
+
+    def test_requests_use_user_shard(self):
+        by_shard = {alias: Meal.objects.using(alias).values_list('user_id', flat=True) for alias in self.shards}
+        for user in self.users:
+            self.assertEqual(list(by_shard[shard_for(user.id)]).count(user.id), 1)
+            self.client.force_login(user)
+            self.assertEqual(self.client.get(reverse('weekly-summary-api')).json()['weekly_summary']['total_eaten'],
+                             800)
+
+    def test_move_user_keeps_rows_and_ids(self):
+        user = self.users[0]
+        source = shard_for(user.id)
+        target = next(alias for alias in self.shards if alias != source)
+        meal_ids = list(Meal.objects.using(source).filter(user=user).values_list('id', flat=True))
+
+        call_command('rebalance_shards', user.username, to=target, stdout=StringIO())
+
+        self.assertEqual(shard_for(user.id), target)
+        self.assertFalse(Meal.objects.using(source).filter(user=user).exists())
+        self.assertEqual(list(Meal.objects.using(target).filter(user=user).values_list('id', flat=True)), meal_ids)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('meals-today')).json()['meals'][0]['id'], meal_ids[0])
+        # Zapis, który po przeniesieniu trafił jeszcze na stary shard, sprząta --sweep
+        Meal.objects.using(source).create(user_id=user.id, meal="late", calories=100, date=date.today())
+        call_command('rebalance_shards', sweep=True, stdout=StringIO())
+        self.assertEqual(Meal.objects.using(target).filter(user=user).count(), 2)
+        self.assertEqual(DailyBalance.objects.using(target).get(user=user).eaten_kcal, 900)
+
+    def test_repeated_moves_keep_ids_unique_and_other_users_rows(self):
+        a, c = self.users[:2]
+        move_user(a.id, 'shard2')
+        move_user(c.id, 'shard2')
+        # A przynosi na shard1 id z zakresu shard2 - nowe id na shard1 nie mogą w niego wejść
+        move_user(a.id, 'shard1')
+        self.add_meal(a, "salad", 300)
+        self.add_meal(c, "soup", 200)
+        ids = {user: self.meal_ids(user) for user in (a, c)}
+        self.assertFalse(ids[a] & ids[c])
+
+        for target in ('shard2', 'default', 'shard1', 'shard2'):
+            move_user(a.id, target)
+            self.add_meal(a, f"meal on {target}", 100)
+            ids[a] |= self.meal_ids(a) - ids[a]
+            self.assertEqual(self.meal_ids(a, target), ids[a])
+            self.assertEqual(self.meal_ids(c, 'shard2'), ids[c])
+        self.assertEqual(len(ids[a]), 6)
+
+        self.client.force_login(c)
+        history = self.client.get(reverse('meal-history')).json()['results']
+        self.assertEqual({row['id'] for row in history}, ids[c])
+        self.client.force_login(a)
+        self.assertEqual(self.client.get(reverse('weekly-summary-api')).json()['weekly_summary']['total_eaten'],
+                         1500)
+
+    def test_move_refuses_ids_owned_by_another_user(self):
+        a, c = self.users[:2]
+        move_user(a.id, 'shard1')
+        move_user(c.id, 'shard2')
+        taken = min(self.meal_ids(a))
+        ensure_user_row(c.id, 'shard2')
+        Meal.objects.using('shard2').create(id=taken, user_id=c.id, meal="soup", calories=200, date=date.today())
+
+        with self.assertRaises(ShardConflict):
+            move_user(a.id, 'shard2')
+        with self.assertRaisesMessage(CommandError, 'belong to other users'):
+            call_command('rebalance_shards', a.username, to='shard2', stdout=StringIO())
+
+        self.assertEqual(shard_for(a.id), 'shard1')
+        self.assertEqual(self.meal_ids(a, 'shard1'), {taken})
+        self.assertEqual(Meal.objects.using('shard2').get(id=taken).user_id, c.id)
+        self.assertEqual(self.add_meal(a).status_code, 201)
+
+    def test_writes_of_moving_user_are_rejected_with_503(self):
+        user = self.users[0]
+        _set_shard(user.id, shard_for(user.id), moving=True)
+
+        response = self.add_meal(user)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(len(self.meal_ids(user)), 1)
+
+    def test_concurrent_writes_during_move_are_kept_or_rejected(self):
+        user = self.users[0]
+        move_user(user.id, 'shard1')
+        written, stop = [], threading.Event()
+
+        def write():
+            try:
+                while not stop.is_set():
+                    try:
+                        with user_writes(user.id):
+                            meal = Meal.objects.create(user_id=user.id, meal="snack", calories=10, date=date.today())
+                        written.append(meal.pk)
+                    except UserMoving:
+                        pass  # klient ponowi zapis (503 z Retry-After)
+            finally:
+                connections.close_all()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for target in ('shard2', 'shard1', 'shard2'):
+                time.sleep(0.05)
+                move_user(user.id, target)
+            time.sleep(0.05)
+        finally:
+            stop.set()
+            writer.join()
+
+        self.assertTrue(written)
+        # Każdy zatwierdzony zapis jest na docelowym shardzie, a stary shard nie ma nic do sprzątania
+        self.assertEqual(set(Meal.objects.using('shard2').filter(user=user, meal="snack").values_list('id', flat=True)),
+                         set(written))
+        self.assertFalse(Meal.objects.using('shard1').filter(user=user).exists())
+        self.assertEqual(DailyBalance.objects.using('shard2').get(user=user).meal_count, len(written) + 1)
+
+    def test_population_report_merges_all_shards(self):
+        refresh_profile_metrics()
+        report = population_report()
+
+        self.assertEqual(report['profiles'], 6)
+        self.assertEqual(report['by_bmi_category'], [
+            {'bmi_category': 'NORMAL', 'profiles': 6, 'avg_age': report['avg_age'], 'avg_bmi': 22.86,
+             'avg_bmr': report['avg_bmr']},
+        ])
+        self.assertEqual(sum(row['profiles'] for row in shard_report()), 6)
@@ -0,0 +1,123 @@
+from datetime import timedelta
+from itertools import accumulate
+
+from .models import DailyBalance
+
+try:
+    import numpy as np
+except ImportError:  # numpy jest opcjonalny - bez niego liczymy tymi samymi algorytmami w czystym Pythonie
+    np = None
+
+
+# --- Trendy długoterminowe: średnie kroczące, bilans z PPM, serie deficytu i bilans skumulowany ---
+#
+# Dane dzienne to jedno zapytanie do DailyBalance; każda metryka to jeden przebieg po tablicy (sumy prefiksowe),
+# więc koszt nie zależy od długości okna, a 5 lat to ~1800 elementów.
+
+ROLLING_WINDOWS = (7, 30)
+
+
+def daily_series(user, start_date, end_date):
+    # Gęste serie (dzień po dniu) - dni bez wpisów mają zera i logged=False
+    days = (end_date - start_date).days + 1
+    eaten, burned, logged = [0.0] * days, [0.0] * days, [False] * days
+
+    rows = (
+        DailyBalance.objects.filter(user=user, date__range=[start_date, end_date])
+        .values_list('date', 'eaten_kcal', 'burned_kcal', 'meal_count')
+    )
+    for day, eaten_kcal, burned_kcal, meal_count in rows:
+        i = (day - start_date).days
+        eaten[i], burned[i], logged[i] = eaten_kcal, burned_kcal, meal_count > 0
+
+    dates = [start_date + timedelta(days=i) for i in range(days)]
+    return dates, eaten, burned, logged
+
+
+def _rolling_mean_numpy(values, window):
+    # Średnia z ostatnich `window` dni; na początku serii z tylu dni, ile jest dostępnych
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    index = np.arange(1, len(values) + 1)
+    lower = np.maximum(index - window, 0)
+    return (sums[index] - sums[lower]) / (index - lower)
+
+
+def _rolling_mean_python(values, window):
+    sums = [0.0, *accumulate(values)]
+    return [
+        (sums[i] - sums[max(i - window, 0)]) / (i - max(i - window, 0))
+        for i in range(1, len(values) + 1)
+    ]
+
+
+def _runs_numpy(mask):
+    # (początek, koniec wyłącznie) każdej serii kolejnych True
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+
+
+def _runs_python(mask):
+    runs, start = [], None
+    for i, value in enumerate([*mask, False]):
+        if value and start is None:
+            start = i
+        elif not value and start is not None:
+            runs.append((start, i))
+            start = None
+    return runs
+
+
+def _streaks(runs, dates):
+    longest = max(runs, key=lambda run: run[1] - run[0], default=None)
+    current = runs[-1][1] - runs[-1][0] if runs and runs[-1][1] == len(dates) else 0
+    return {
+        'current': current,
+        'longest': {
+            'length': longest[1] - longest[0],
+            'start': dates[longest[0]],
+            'end': dates[longest[1] - 1],
+        } if longest else None,
+    }
+
+
+def compute_trends(dates, eaten, burned, logged, ppm, windows=ROLLING_WINDOWS):
+    # Bilans dnia jak w podsumowaniach: zjedzone - spalone - PPM; seria deficytu liczy tylko dni z wpisanymi posiłkami
+    if np is not None:
+        eaten_arr, burned_arr = np.asarray(eaten, dtype=float), np.asarray(burned, dtype=float)
+        balance = eaten_arr - burned_arr - ppm
+        rolling = {
+            str(window): {
+                name: np.round(_rolling_mean_numpy(series, window), 1).tolist()
+                for name, series in (('eaten', eaten_arr), ('burned', burned_arr), ('balance', balance))
+            }
+            for window in windows
+        }
+        cumulative = np.round(np.cumsum(balance), 1).tolist()
+        runs = _runs_numpy(np.asarray(logged, dtype=bool) & (balance < 0))
+        balance = np.round(balance, 1).tolist()
+        engine = 'numpy'
+    else:
+        balance = [e - b - ppm for e, b in zip(eaten, burned)]
+        rolling = {
+            str(window): {
+                name: [round(v, 1) for v in _rolling_mean_python(series, window)]
+                for name, series in (('eaten', eaten), ('burned', burned), ('balance', balance))
+            }
+            for window in windows
+        }
+        cumulative = [round(v, 1) for v in accumulate(balance)]
+        runs = _runs_python([is_logged and value < 0 for is_logged, value in zip(logged, balance)])
+        balance = [round(v, 1) for v in balance]
+        engine = 'python'
+
+    return {
+        'dates': dates,
+        'eaten': [round(v, 1) for v in eaten],
+        'burned': [round(v, 1) for v in burned],
+        'balance': balance,
+        'rolling': rolling,
+        'cumulative_balance': cumulative,
+        'deficit_streaks': _streaks(runs, dates),
+        'logged_days': sum(logged),
+        'engine': engine,
+    }
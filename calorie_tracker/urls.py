@@ -2,19 +2,35 @@ from django.urls import path, include
 from rest_framework.authtoken.views import obtain_auth_token
 from .views import NutritionixMealAPIView, AddMealAPIView, AddActivityAPIView, add_activity_form, edit_profile_view, \
     profile_view, DailySummaryAPIView, dashboard_view, MealsTodayAPIView, daily_summary_view, home_view, register_view, \
-    ActivityStatsAPIView, WeeklySummaryAPIView
+    ActivityStatsAPIView, WeeklySummaryAPIView, NutritionixCacheStatsAPIView, NutritionixBatchAPIView, \
+    FoodAutocompleteAPIView, ImportHistoryAPIView, RangeSummaryAPIView, TrendsAPIView, SummaryCacheStatsAPIView, \
+    ProfileMetricsAPIView, MealHistoryAPIView, ActivityHistoryAPIView, ExportHistoryAPIView, \
+    DashboardAPIView, ShardStatsAPIView
 from .views import add_meal_dynamic
 from .views import UserProfileAPIView
 
 api_urlpatterns = [
     path('nutritionix-meal/', NutritionixMealAPIView.as_view(), name='nutritionix-meal'),
+    path('nutritionix-batch/', NutritionixBatchAPIView.as_view(), name='nutritionix-batch'),
+    path('foods/autocomplete/', FoodAutocompleteAPIView.as_view(), name='food-autocomplete'),
+    path('nutritionix-cache-stats/', NutritionixCacheStatsAPIView.as_view(), name='nutritionix-cache-stats'),
+    path('summary-cache-stats/', SummaryCacheStatsAPIView.as_view(), name='summary-cache-stats'),
+    path('profile-metrics/', ProfileMetricsAPIView.as_view(), name='profile-metrics'),
+    path('shard-stats/', ShardStatsAPIView.as_view(), name='shard-stats'),
     path('add-meal/', AddMealAPIView.as_view(), name='add-meal'),
     path('profile/', UserProfileAPIView.as_view(), name='api-profile'),
     path('daily-summary/', DailySummaryAPIView.as_view(), name='daily-summary'),
     path('meals-today/', MealsTodayAPIView.as_view(), name='meals-today'),
+    path('meals/history/', MealHistoryAPIView.as_view(), name='meal-history'),
+    path('activities/history/', ActivityHistoryAPIView.as_view(), name='activity-history'),
     path('add-activity/', AddActivityAPIView.as_view(), name='add-activity'),
+    path('import-history/', ImportHistoryAPIView.as_view(), name='import-history'),
+    path('export-history/', ExportHistoryAPIView.as_view(), name='export-history'),
     path('activity-stats/', ActivityStatsAPIView.as_view(), name='activity-stats'),
     path('weekly-summary/', WeeklySummaryAPIView.as_view(), name='weekly-summary-api'),
+    path('dashboard/', DashboardAPIView.as_view(), name='dashboard-api'),
+    path('range-summary/', RangeSummaryAPIView.as_view(), name='range-summary-api'),
+    path('trends/', TrendsAPIView.as_view(), name='trends-api'),
 ]
 
 html_views = [
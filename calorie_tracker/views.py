@@ -1,21 +1,47 @@
+from collections import defaultdict
 from datetime import date, timedelta, datetime
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, Value, When
 from django.db.models.aggregates import Sum, Count
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, redirect
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework import status
-from calorie_tracker.models import Meal, Activity, UserProfile
-from calorie_tracker.serializers import ActivitySerializer, UserProfileSerializer, MealSerializer
-import requests
+from calorie_tracker.models import Meal, Activity, UserProfile, Food, DailyBalance
+from calorie_tracker.serializers import ActivitySerializer, UserProfileSerializer, MealSerializer, \
+    MealReadSerializer, ActivityReadSerializer, InvalidFields
 from django.contrib import messages
 from .forms import ExtendedUserCreationForm, ActivityForm, UserProfileForm, MealForm
+from .nutrition_cache import get_nutrient_cache, lookup_nutrients, lookup_many, single_flight
+from .nutritionix import get_nutritionix_client, NutritionixError
+from .food_index import open_food_index, approximate_nutrients
+from .importers import KINDS, detect_format, import_history
+from .exporters import EXPORT_FIELDS, FORMATS, FORMAT_ALIASES, export_history, export_filename
+from .idempotency import idempotent
+from .rollups import balances_by_date
+from .signals import daily_data_changed
+from .summary_cache import get_summary_cache
+from .conditional import conditional
+from .db_router import replica_reads, reads_from_replica
+from .sharding import shard_for, shard_report, user_writes, writes_user_data
+from .pagination import keyset_page, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .population import refresh_profile_metrics, population_report, engine as population_engine
+from .trends import daily_series, compute_trends
 
 
 # ------------------------------------ Funkcje pomocnicze np. PPM, BMI, calculate age itd. --------------------
 
+ACTIVITY_NAMES = dict(Activity.ACTIVITY_CHOICES)
+DASHBOARD_PAGE_SIZE = 10
+
+
 def calculate_age(birth_date):
     today = date.today()
     return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
@@ -32,6 +58,160 @@ def calculate_ppm(profile):
 def calculate_bmi(weight: float, height: float) -> float:
     return weight / (height ** 2)
 
+
+def requested_date(request):
+    # ?date=YYYY-MM-DD, a przy braku lub błędnej wartości - dzisiaj
+    try:
+        return date.fromisoformat(request.query_params.get('date') or '')
+    except (ValueError, TypeError):
+        return date.today()
+
+
+def activity_stats_period(time_range):
+    # (początek poprzedniego okresu, początek bieżącego, koniec) - oba okresy tej samej długości
+    today = date.today()
+    if time_range == 'month':
+        start_date = today - timedelta(days=30)
+    elif time_range == 'year':
+        start_date = today - timedelta(days=365)
+    else:  # default to week
+        start_date = today - timedelta(days=7)
+    previous_start = start_date - timedelta(days=1) - (today - start_date)
+    return previous_start, start_date, today
+
+
+def activity_totals():
+    return {'total_duration': 0, 'total_calories': 0, 'count': 0}
+
+
+def add_activity_totals(totals, row):
+    for field in ('total_duration', 'total_calories', 'count'):
+        totals[field] += row[field] or 0
+
+
+def to_date(value):
+    # TruncWeek/TruncMonth na SQLite potrafią zwrócić datetime
+    return value.date() if isinstance(value, datetime) else value
+
+
+def bucket_dates(start_date, end_date, bucket):
+    if bucket == 'week':
+        current = start_date - timedelta(days=start_date.weekday())
+    elif bucket == 'month':
+        current = start_date.replace(day=1)
+    else:
+        current = start_date
+
+    while current <= end_date:
+        yield current
+        if bucket == 'week':
+            current += timedelta(days=7)
+        elif bucket == 'month':
+            current = (current + timedelta(days=32)).replace(day=1)
+        else:
+            current += timedelta(days=1)
+
+
+def build_period_summary(user, start_date, end_date, profile=None):
+    # Stała liczba zapytań niezależnie od długości okresu: profil, dzienne sumy z DailyBalance
+    # oraz po jednym przebiegu po posiłkach i aktywnościach całego zakresu (tylko gdy są jakieś wpisy)
+    if profile is None:
+        profile = UserProfile.objects.filter(user=user).first()
+    ppm_value = (calculate_ppm(profile) if profile else None) or 0
+
+    balances = balances_by_date(user, start_date, end_date)
+
+    meals_by_day = defaultdict(list)
+    if any(b.meal_count for b in balances.values()):
+        meals = (
+            Meal.objects.filter(user=user, date__range=[start_date, end_date])
+            .values_list('date', 'meal', 'calories')
+        )
+        for day, meal, calories in meals:
+            meals_by_day[day].append(f"{meal} ({calories} kcal)")
+
+    activities_by_day = defaultdict(list)
+    if any(b.activity_count for b in balances.values()):
+        activities = (
+            Activity.objects.filter(user=user, date__range=[start_date, end_date])
+            .order_by('date', 'id')
+            .values_list('date', 'activity_type', 'duration', 'calories_burned')
+        )
+        for day, activity_type, duration, calories_burned in activities:
+            activities_by_day[day].append(
+                f"{ACTIVITY_NAMES.get(activity_type, activity_type)} - {duration} min, {calories_burned} kcal"
+            )
+
+    daily_data = []
+    total_eaten = 0
+    total_burned = 0
+    total_ppm = 0
+
+    for n in range((end_date - start_date).days + 1):
+        single_date = start_date + timedelta(n)
+        daily = balances.get(single_date)
+
+        eaten = round(daily.eaten_kcal, 0) if daily else 0
+        burned = round(daily.burned_kcal, 0) if daily else 0
+        balance = round(eaten - burned - ppm_value, 0)
+
+        day_status = "Nadwyżka" if balance > 0 else "Deficyt" if balance < 0 else "Zerowy"
+
+        daily_data.append({
+            'date': single_date,
+            'total_eaten': eaten,
+            'total_burned': burned,
+            'ppm': round(ppm_value, 0),
+            'balance': balance,
+            'status': day_status,
+            'meals': meals_by_day.get(single_date, []),
+            'activities': activities_by_day.get(single_date, []),
+        })
+
+        total_eaten += eaten
+        total_burned += burned
+        total_ppm += ppm_value
+
+    summary = {
+        'total_eaten': round(total_eaten, 0),
+        'total_burned': round(total_burned, 0),
+        'total_ppm': round(total_ppm, 0),
+        'balance': round(total_eaten - total_burned - total_ppm, 0)
+    }
+    return summary, daily_data
+
+
+def weekly_period():
+    today = date.today()
+    return today - timedelta(days=6), today  # ostatnie 7 dni
+
+
+def build_dashboard_payload(user):
+    # Wszystko, czego dashboard potrzebuje do pierwszego renderu: profil z BMI/PPM liczonymi raz
+    # i tydzień z tego samego wpisu cache co /api/weekly-summary/
+    profile = UserProfile.objects.filter(user=user).first()
+    start_date, end_date = weekly_period()
+    summary, daily_data = get_summary_cache().get_or_compute(
+        user.id, 'period', start_date, end_date,
+        lambda: build_period_summary(user, start_date, end_date, profile=profile),
+    )
+
+    weight = profile.weight if profile else None
+    height = profile.height if profile else None
+    ppm = calculate_ppm(profile) if profile else None
+    bmi = calculate_bmi(weight, height / 100) if weight and height else None
+    return {
+        'profile': {
+            'age': calculate_age(profile.date_of_birth) if profile and profile.date_of_birth else None,
+            'height': height,
+            'weight': weight,
+            'bmi': round(bmi, 1) if bmi else None,
+            'ppm': round(ppm) if ppm else None,
+        },
+        'weekly_summary': summary,
+        'daily_data': daily_data,
+    }
+
 # ----------------------------------- Klasy ------------------------------------------------------------------------
 
 
@@ -44,26 +224,108 @@ class NutritionixMealAPIView(APIView):
         if not meal_name:
             return Response({"error": "Meal name is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        url = "https://trackapi.nutritionix.com/v2/natural/nutrients"
-        headers = {
-            "x-app-id": "55e405f5",
-            "x-app-key": "60ffec6ca6a509a11fdc34925da69be4",
-            "Content-Type": "application/json"
-        }
-        data = {"query": meal_name}
-
+        # Lokalna baza, potem cache, dopiero potem Nutritionix;
+        # identyczne zapytania w locie czekają na jedno wspólne wywołanie upstreamu
         try:
-            api_response = requests.post(url, json=data, headers=headers)
-            api_response.raise_for_status()
-            nutrition_data = api_response.json()
+            nutrition_data = lookup_nutrients(meal_name, get_nutritionix_client().natural_nutrients)
             return Response(nutrition_data)
-        except requests.exceptions.RequestException as e:
+        except NutritionixError as e:
+            # Gdy upstream nie działa - ten sam produkt z lokalnej bazy, przeliczony na ilość z zapytania
+            fallback = approximate_nutrients(meal_name)
+            if fallback is not None:
+                return Response(fallback)
             return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
 
+class FoodAutocompleteAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_limit = 25
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            limit = 10
+
+        with open_food_index() as index:
+            if not query or index is None:
+                return Response({"query": query, "results": []})
+            matches = index.search(query, limit)
+
+        foods = Food.objects.in_bulk([food_id for food_id, _, _ in matches])
+        results = [
+            {"id": food_id, "score": score, **foods[food_id].as_nutritionix()}
+            for food_id, _, score in matches if food_id in foods
+        ]
+        return Response({"query": query, "results": results})
+
+
+class NutritionixBatchAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_items = 50
+    max_workers = 8  # limit równoległych zapytań do Nutritionix na jedno żądanie
+
+    def post(self, request):
+        meals = request.data.get("meals")
+        if not isinstance(meals, list) or not meals:
+            return Response({"error": "meals must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(meals) > self.max_items:
+            return Response(
+                {"error": f"At most {self.max_items} meals per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not all(isinstance(meal, str) and meal.strip() for meal in meals):
+            return Response({"error": "Every meal must be a non-empty string"}, status=status.HTTP_400_BAD_REQUEST)
+
+        client = get_nutritionix_client()
+        # Błędy upstreamu trafiają do wyników poszczególnych pozycji, a nie do całej odpowiedzi
+        results = lookup_many(meals, client.natural_nutrients, self.max_workers)
+        return Response({"results": results})
+
+
+class NutritionixCacheStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        stats = get_nutrient_cache().stats()
+        stats['single_flight'] = single_flight.stats()
+        stats['upstream_circuit'] = get_nutritionix_client().breaker.state
+        return Response(stats)
+
+
+class SummaryCacheStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_summary_cache().stats())
+
+
+class ShardStatsAPIView(APIView):
+    # Liczności na każdym shardzie (zapytania równolegle) - do decyzji o rebalance_shards
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"shards": shard_report()})
+
+
+class ProfileMetricsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @reads_from_replica
+    def get(self, request):
+        return Response(population_report())
+
+    def post(self, request):
+        total = refresh_profile_metrics()
+        return Response({"profiles": total, "engine": population_engine(), **population_report()})
+
+
 class AddMealAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @writes_user_data
+    @idempotent
     def post(self, request):
         foods = request.data.get("foods", [])
         meal_date_str = request.data.get("date")
@@ -80,25 +342,25 @@ class AddMealAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        user = request.user
-        created_meals = []
-
-        for food in foods:
-            meal = Meal(
-                user=user,
-                meal=food.get("food_name", ""),
-                calories=food.get("nf_calories", 0),
-                protein=food.get("nf_protein", 0),
-                carbs=food.get("nf_total_carbohydrate", 0),
-                fat=food.get("nf_total_fat", 0),
-                serving_qty=food.get("serving_qty", 0),
-                serving_unit=food.get("serving_unit", ""),
-                raw_api_data=food,
-                date=meal_date
-            )
-            meal.full_clean()
-            meal.save()
-            created_meals.append(meal)
+        if not isinstance(foods, list) or not all(isinstance(food, dict) for food in foods):
+            return Response({"error": "foods must be a list of objects"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Walidacja całej listy w jednym przebiegu; użytkownik pochodzi z sesji, a payload zapisze
+        # bulk_create, więc nie sprawdzamy kluczy obcych zapytaniem dla każdego wiersza
+        meals = [Meal.from_nutritionix(request.user, food, meal_date) for food in foods]
+        errors = {}
+        for i, meal in enumerate(meals):
+            try:
+                meal.full_clean(exclude=['user', 'raw_payload'], validate_unique=False)
+            except ValidationError as e:
+                errors[i] = e.message_dict
+        if errors:
+            return Response({"error": "Invalid foods data", "details": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Wszystko albo nic - jeden INSERT i jeden commit zamiast osobnego zapisu na każdy produkt
+        with transaction.atomic(using=shard_for(request.user.id)):
+            created_meals = Meal.objects.bulk_create(meals)
+            daily_data_changed.send(sender=Meal, user_id=request.user.id, dates={meal_date})
 
         return Response({
             "status": f"Added {len(created_meals)} meals",
@@ -110,6 +372,8 @@ class AddMealAPIView(APIView):
 class AddActivityAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @writes_user_data
+    @idempotent
     def post(self, request):
 
         activity_type = request.data.get("activity_type")
@@ -163,44 +427,144 @@ class AddActivityAPIView(APIView):
         }
 
 
-class ActivityStatsAPIView(APIView):
+class ImportHistoryAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
 
-    def get(self, request):
-        time_range = request.query_params.get('range', 'week')  # week/month/year
+    def post(self, request):
+        upload = request.FILES.get("file")
+        kind = request.data.get("kind")
+        if upload is None or kind not in KINDS:
+            return Response(
+                {"error": f"file and kind ({', '.join(sorted(KINDS))}) are required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        today = date.today()
-        if time_range == 'month':
-            start_date = today - timedelta(days=30)
-        elif time_range == 'year':
-            start_date = today - timedelta(days=365)
-        else:  # default to week
-            start_date = today - timedelta(days=7)
+        fmt = request.data.get("format") or detect_format(upload.name)
+        if fmt not in ('csv', 'jsonl'):
+            return Response({"error": "format must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
 
-        activities = Activity.objects.filter(
-            user=request.user,
-            date__range=[start_date, today]
+        # Duże pliki Django trzyma na dysku, więc czytamy je strumieniowo paczkami
+        result = import_history(request.user, upload.file, kind, fmt=fmt)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+
+class ExportHistoryAPIView(APIView):
+    # ?kind=meals|activities&format=csv|jsonl&gzip=1&include_raw=1 - plik generowany w locie, paczka po paczce
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= wybiera tu format pliku, a nie renderer DRF (błędy i tak zwracamy jako JSON)
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request):
+        kind = request.query_params.get("kind")
+        fmt = request.query_params.get("format", "csv")
+        fmt = FORMAT_ALIASES.get(fmt, fmt)
+        if kind not in EXPORT_FIELDS or fmt not in FORMATS:
+            return Response(
+                {"error": f"kind ({', '.join(sorted(EXPORT_FIELDS))}) is required, "
+                          f"format must be {' or '.join(FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        compress = request.query_params.get("gzip") in ("1", "true")
+        include_raw = request.query_params.get("include_raw") in ("1", "true")
+
+        response = StreamingHttpResponse(
+            export_history(request.user, kind, fmt=fmt, include_raw=include_raw, compress=compress),
+            content_type='application/gzip' if compress else f"{FORMATS[fmt]}; charset=utf-8",
         )
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(kind, fmt, compress)}"'
+        return response
 
-        # Grupowanie po typie aktywności
-        by_type = activities.values('activity_type').annotate(
-            total_duration=Sum('duration'),
-            total_calories=Sum('calories_burned'),
-            count=Count('id')
+
+class ActivityStatsAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    buckets = {
+        'day': F('date'),
+        'week': TruncWeek('date'),
+        'month': TruncMonth('date'),
+    }
+
+    def period(self, request):
+        # Odpowiedź zależy od obu porównywanych okresów
+        previous_start, _, today = activity_stats_period(request.query_params.get('range', 'week'))
+        return previous_start, today
+
+    @conditional(lambda view, request: view.period(request))
+    @reads_from_replica
+    def get(self, request):
+        time_range = request.query_params.get('range', 'week')  # week/month/year
+        previous_start, start_date, today = activity_stats_period(time_range)
+
+        bucket = request.query_params.get('bucket') or ('month' if time_range == 'year' else 'day')
+        if bucket not in self.buckets:
+            return Response({"error": f"bucket must be one of: {', '.join(self.buckets)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        split_by_type = request.query_params.get('split') == 'type'
+
+        # Poprzedni okres tej samej długości, kończący się dzień przed bieżącym
+        previous_end = start_date - timedelta(days=1)
+
+        # Jedno zgrupowane zapytanie dla obu okresów: (okres, kubełek, typ aktywności) -> sumy
+        rows = (
+            Activity.objects.filter(user=request.user, date__range=[previous_start, today])
+            .annotate(
+                current=Case(When(date__gte=start_date, then=Value(True)), default=Value(False)),
+                bucket=self.buckets[bucket],
+            )
+            .order_by()
+            .values('current', 'bucket', 'activity_type')
+            .annotate(total_duration=Sum('duration'), total_calories=Sum('calories_burned'), count=Count('id'))
         )
 
+        totals = {True: activity_totals(), False: activity_totals()}
+        by_type = defaultdict(activity_totals)
+        series = {}
+        for row in rows:
+            add_activity_totals(totals[row['current']], row)
+            if not row['current']:
+                continue
+            add_activity_totals(by_type[row['activity_type']], row)
+            item = series.setdefault(to_date(row['bucket']), {**activity_totals(), 'by_type': {}})
+            add_activity_totals(item, row)
+            if split_by_type:
+                add_activity_totals(item['by_type'].setdefault(row['activity_type'], activity_totals()), row)
+
+        # Puste kubełki też zwracamy, żeby wykres nie musiał uzupełniać luk
+        series_data = []
+        for period in bucket_dates(start_date, today, bucket):
+            item = series.get(period) or {**activity_totals(), 'by_type': {}}
+            entry = {'period': period, **{k: item[k] for k in ('total_duration', 'total_calories', 'count')}}
+            if split_by_type:
+                entry['by_type'] = [{'activity_type': t, **v} for t, v in sorted(item['by_type'].items())]
+            series_data.append(entry)
+
+        current, previous = totals[True], totals[False]
         return Response({
-            "total_calories": activities.aggregate(Sum('calories_burned'))['calories_burned__sum'] or 0,
-            "total_duration": activities.aggregate(Sum('duration'))['duration__sum'] or 0,
-            "activities_by_type": by_type,
+            "total_calories": current['total_calories'],
+            "total_duration": current['total_duration'],
+            "activities_by_type": [{'activity_type': t, **v} for t, v in sorted(by_type.items())],
             "start_date": start_date,
-            "end_date": today
+            "end_date": today,
+            "bucket": bucket,
+            "series": series_data,
+            "previous": {
+                "start_date": previous_start,
+                "end_date": previous_end,
+                **previous,
+            },
+            "change_percent": {
+                field: round((current[field] - previous[field]) * 100 / previous[field], 1) if previous[field] else None
+                for field in ('total_calories', 'total_duration', 'count')
+            },
         })
 
 
 class UserProfileAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional(lambda view, request: None)
     def get(self, request):
         try:
             profile = UserProfile.objects.get(user=request.user)
@@ -209,6 +573,7 @@ class UserProfileAPIView(APIView):
         except UserProfile.DoesNotExist:
             return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
 
+    @writes_user_data
     def put(self, request):
         profile = request.user.userprofile
         serializer = UserProfileSerializer(profile, data=request.data, partial=True)
@@ -222,55 +587,102 @@ class UserProfileAPIView(APIView):
 class MealsTodayAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional(lambda view, request: (requested_date(request),) * 2)
+    @reads_from_replica
     def get(self, request):
-        selected_date = request.query_params.get('date')
-        if selected_date:
-            try:
-                meal_date = date.fromisoformat(selected_date)
-            except (ValueError, TypeError):
-                meal_date = date.today()
-        else:
-            meal_date = date.today()
+        meal_date = requested_date(request)
+
+        try:
+            serializer = MealReadSerializer.from_query(request.query_params.get('fields'))
+        except InvalidFields as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        meals = Meal.objects.filter(user=request.user, date=meal_date)
-        serializer = MealSerializer(meals, many=True)
+        meals = Meal.objects.filter(user=request.user, date=meal_date).values(*serializer.columns())
         return Response({
             "date": meal_date,
-            "meals": serializer.data
+            "meals": serializer.data(meals)
         })
 
 
-class DailySummaryAPIView(APIView):
+class HistoryAPIView(APIView):
+    # Historia wpisów stronicowana kursorem: ?cursor=&limit=&start=&end=&fields=
     permission_classes = [IsAuthenticated]
+    model = None
+    serializer_class = None
 
+    @reads_from_replica
     def get(self, request):
-        # Pobranie daty z parametrów URL
-        selected_date = request.query_params.get('date')
-        if selected_date:
-            try:
-                summary_date = date.fromisoformat(selected_date)
-            except (ValueError, TypeError):
-                summary_date = date.today()
-        else:
-            summary_date = date.today()
+        queryset = self.model.objects.filter(user=request.user)
+        try:
+            serializer = self.serializer_class.from_query(request.query_params.get('fields'))
+            limit = min(int(request.query_params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError
+            if request.query_params.get('start'):
+                queryset = queryset.filter(date__gte=date.fromisoformat(request.query_params['start']))
+            if request.query_params.get('end'):
+                queryset = queryset.filter(date__lte=date.fromisoformat(request.query_params['end']))
+            page, next_cursor = keyset_page(
+                queryset.values(*serializer.columns('date', 'id')), request.query_params.get('cursor'), limit
+            )
+        except (InvalidCursor, InvalidFields) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"error": f"limit must be 1-{MAX_PAGE_SIZE}, start/end dates in YYYY-MM-DD format"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"results": serializer.data(page), "next_cursor": next_cursor})
 
-        user = request.user
 
-        # Posiłki i aktywności
-        meals = Meal.objects.filter(user=user, date=summary_date)
-        activities = Activity.objects.filter(user=user, date=summary_date)
+class MealHistoryAPIView(HistoryAPIView):
+    model = Meal
+    serializer_class = MealReadSerializer
 
-        # Sumy kalorii
-        total_eaten = sum(meal.calories for meal in meals)
-        total_burned = sum(activity.calories_burned for activity in activities)
+
+class ActivityHistoryAPIView(HistoryAPIView):
+    model = Activity
+    serializer_class = ActivityReadSerializer
+
+
+class DailySummaryAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional(lambda view, request: (requested_date(request),) * 2)
+    @reads_from_replica
+    def get(self, request):
+        # Pobranie daty z parametrów URL
+        summary_date = requested_date(request)
+
+        # Odpowiedź z cache, dopóki nie zmienią się wpisy tego dnia ani profil
+        data = get_summary_cache().get_or_compute(
+            request.user.id, 'daily', summary_date, summary_date,
+            lambda: self.summary(request.user, summary_date),
+        )
+        return Response(data)
+
+    def summary(self, user, summary_date):
+        # Sumy kalorii z tabeli dziennych bilansów; listy wpisów pobieramy tylko, gdy dzień nie jest pusty
+        daily = DailyBalance.objects.filter(user=user, date=summary_date).first()
+        total_eaten = daily.eaten_kcal if daily else 0
+        total_burned = daily.burned_kcal if daily else 0
+
+        # Posiłki i aktywności - tylko kolumny, które zwracamy, bez budowania obiektów modelu
+        meals_data = (
+            list(Meal.objects.filter(user=user, date=summary_date).values('meal', 'calories'))
+            if daily and daily.meal_count else []
+        )
+        activities = (
+            Activity.objects.filter(user=user, date=summary_date)
+            .values_list('activity_type', 'duration', 'calories_burned')
+            if daily and daily.activity_count else []
+        )
 
         # Przetworzone dane do frontendu
-        meals_data = [{"meal": m.meal, "calories": m.calories} for m in meals]
         activities_data = [
-            {"activity_type": a.get_activity_type_display(),
-             "duration": a.duration,
-             "calories_burned": a.calories_burned}
-            for a in activities
+            {"activity_type": ACTIVITY_NAMES.get(activity_type, activity_type),
+             "duration": duration,
+             "calories_burned": calories_burned}
+            for activity_type, duration, calories_burned in activities
         ]
 
         # Dane użytkownika
@@ -313,7 +725,7 @@ class DailySummaryAPIView(APIView):
         else:
             calorie_status = "Zero"
 
-        return Response({
+        return {
             "date": summary_date,
             "total_eaten": total_eaten,
             "total_burned": total_burned,
@@ -327,66 +739,101 @@ class DailySummaryAPIView(APIView):
             "activities": activities_data,
             "weight": weight,
             "height": height
-        })
+        }
 
 class WeeklySummaryAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional(lambda view, request: weekly_period())
+    @reads_from_replica
+    def get(self, request):
+        start_date, end_date = weekly_period()
+
+        summary, daily_data = get_summary_cache().get_or_compute(
+            request.user.id, 'period', start_date, end_date,
+            lambda: build_period_summary(request.user, start_date, end_date),
+        )
+        return Response({
+            'weekly_summary': summary,
+            'daily_data': daily_data
+        })
+
+
+class DashboardAPIView(APIView):
+    # Ten sam payload, który dashboard_view osadza w stronie - do odświeżania bez przeładowania
+    permission_classes = [IsAuthenticated]
+
+    @conditional(lambda view, request: weekly_period())
+    @reads_from_replica
     def get(self, request):
-        user = request.user
-        end_date = date.today()
-        start_date = end_date - timedelta(days=6)  # ostatnie 7 dni
+        return Response(build_dashboard_payload(request.user))
+
+
+class RangeSummaryAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_days = 366
 
+    def requested_range(self, request):
         try:
-            profile = UserProfile.objects.get(user=user)
-            ppm_value = calculate_ppm(profile) or 0
-        except UserProfile.DoesNotExist:
-            ppm_value = 0
-
-        weekly_data = []
-        total_week_eaten = 0
-        total_week_burned = 0
-        total_week_ppm = 0
-
-        for single_date in (start_date + timedelta(n) for n in range(7)):
-            meals = Meal.objects.filter(user=user, date=single_date)
-            activities = Activity.objects.filter(user=user, date=single_date)
-
-            total_eaten = round(sum(meal.calories for meal in meals), 0)
-            total_burned = round(sum(activity.calories_burned for activity in activities), 0)
-            balance = round(total_eaten - total_burned - ppm_value, 0)
-
-            status = "Nadwyżka" if balance > 0 else "Deficyt" if balance < 0 else "Zerowy"
-
-            weekly_data.append({
-                'date': single_date,
-                'total_eaten': total_eaten,
-                'total_burned': total_burned,
-                'ppm': round(ppm_value, 0),
-                'balance': round(balance, 0),
-                'status': status,
-                'meals': [f"{m.meal} ({m.calories} kcal)" for m in meals],
-                'activities': [
-                    f"{a.get_activity_type_display()} - {a.duration} min, {a.calories_burned} kcal"
-                    for a in activities
-                ]
-            })
-
-            # Agregacja tygodniowa
-            total_week_eaten += total_eaten
-            total_week_burned += total_burned
-            total_week_ppm += ppm_value
-
-        weekly_summary = {
-            'total_eaten': round(total_week_eaten,0),
-            'total_burned': round(total_week_burned,0),
-            'total_ppm': round(total_week_ppm,0),
-            'balance': round(total_week_eaten - total_week_burned - total_week_ppm,0)
-        }
+            end_date = date.fromisoformat(request.query_params.get('end') or date.today().isoformat())
+            start_date = date.fromisoformat(request.query_params.get('start') or (end_date - timedelta(days=6)).isoformat())
+        except ValueError:
+            raise ValueError("start and end must be dates in YYYY-MM-DD format")
+
+        if start_date > end_date:
+            raise ValueError("start must not be after end")
+        if (end_date - start_date).days >= self.max_days:
+            raise ValueError(f"Range is limited to {self.max_days} days")
+        return start_date, end_date
+
+    @conditional(lambda view, request: view.requested_range(request))
+    @reads_from_replica
+    def get(self, request):
+        try:
+            start_date, end_date = self.requested_range(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        summary, daily_data = get_summary_cache().get_or_compute(
+            request.user.id, 'period', start_date, end_date,
+            lambda: build_period_summary(request.user, start_date, end_date),
+        )
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'summary': summary,
+            'daily_data': daily_data
+        })
+
+
+class TrendsAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_days = 3660  # ~10 lat
 
+    @reads_from_replica
+    def get(self, request):
+        try:
+            end_date = date.fromisoformat(request.query_params.get('end') or date.today().isoformat())
+            start_date = date.fromisoformat(request.query_params.get('start') or (end_date - timedelta(days=364)).isoformat())
+        except ValueError:
+            return Response({"error": "start and end must be dates in YYYY-MM-DD format"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if start_date > end_date:
+            return Response({"error": "start must not be after end"}, status=status.HTTP_400_BAD_REQUEST)
+        if (end_date - start_date).days >= self.max_days:
+            return Response({"error": f"Range is limited to {self.max_days} days"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        profile = UserProfile.objects.filter(user=request.user).first()
+        ppm_value = (calculate_ppm(profile) if profile else None) or 0
+
+        trends = compute_trends(*daily_series(request.user, start_date, end_date), ppm=ppm_value)
         return Response({
-            'weekly_summary': weekly_summary,
-            'daily_data': weekly_data
+            'start_date': start_date,
+            'end_date': end_date,
+            'ppm': round(ppm_value, 0),
+            **trends,
         })
 
 
@@ -410,43 +857,31 @@ def login_view(request):
 
 @login_required
 def dashboard_view(request):
-    profile = request.user.userprofile
-
-    age = calculate_age(profile.date_of_birth) if profile.date_of_birth else None
-    ppm = calculate_ppm(profile)
-    bmi = calculate_bmi(profile.weight, profile.height / 100) if profile.weight and profile.height else None
-
-    # Dane tygodniowe
-    today = date.today()
-    week_ago = today - timedelta(days=6)
-
-    meals = Meal.objects.filter(user=request.user, date__range=[week_ago, today])
-    activities = Activity.objects.filter(user=request.user, date__range=[week_ago, today])
-
-    total_eaten = meals.aggregate(total=Sum('calories'))['total'] or 0
-    total_burned = activities.aggregate(total=Sum('calories_burned'))['total'] or 0
+    with replica_reads(request.user.id):
+        dashboard = build_dashboard_payload(request.user)
 
-    avg_ppm = ppm
-    balance = total_eaten - total_burned - avg_ppm
+        # Ostatnie wpisy - pierwsza strona tego samego stronicowania co /api/meals/history/, kolejne doładowuje JS
+        meal_serializer, activity_serializer = MealReadSerializer(), ActivityReadSerializer()
+        meals, meals_cursor = keyset_page(
+            Meal.objects.filter(user=request.user).values(*meal_serializer.columns()), limit=DASHBOARD_PAGE_SIZE
+        )
+        activities, activities_cursor = keyset_page(
+            Activity.objects.filter(user=request.user).values(*activity_serializer.columns()),
+            limit=DASHBOARD_PAGE_SIZE,
+        )
 
-    context = {
-        'age': age,
-        'height': profile.height,
-        'weight': profile.weight,
-        'bmi': round(bmi, 1) if bmi else None,
-        'ppm': round(ppm) if ppm else None,
-        # agregaty tygodniowe
-        'weekly_aggregates': {
-            'total_eaten': round(total_eaten),
-            'total_burned': round(total_burned),
-            'avg_ppm': round(avg_ppm) if avg_ppm else 0,
-            'balance': round(balance),
-        },
-        'weekly_meals': meals,
-        'weekly_activities': activities,
-    }
+        context = {
+            **dashboard['profile'],
+            # Tydzień osadzony w stronie (json_script) - szablon nie musi pytać /api/weekly-summary/ po załadowaniu
+            'dashboard': dashboard,
+            'recent_meals': meal_serializer.data(meals),
+            'meals_next_cursor': meals_cursor,
+            'recent_activities': activity_serializer.data(activities),
+            'activities_next_cursor': activities_cursor,
+            'history_page_size': DASHBOARD_PAGE_SIZE,
+        }
 
-    return render(request, 'dashboard.html', context)
+        return render(request, 'dashboard.html', context)
 
 def home_view(request):
     if request.user.is_authenticated:
@@ -473,12 +908,14 @@ def edit_profile_view(request):
         profile = request.user.userprofile
     except UserProfile.DoesNotExist:
         profile = UserProfile(user=request.user)
-        profile.save()
+        with user_writes(request.user.id):
+            profile.save()
 
     if request.method == 'POST':
         form = UserProfileForm(request.POST, instance=profile)
         if form.is_valid():
-            form.save()
+            with user_writes(request.user.id):
+                form.save()
             return redirect('user-profile')
     else:
         form = UserProfileForm(instance=profile)
@@ -494,14 +931,15 @@ def register_view(request):
         if form.is_valid():
             user = form.save()
 
-            UserProfile.objects.get_or_create(
-                user=user,
-                defaults={
-                    'first_name': form.cleaned_data['first_name'],
-                    'last_name': form.cleaned_data['last_name'],
-                    'email': form.cleaned_data['email']
-                }
-            )
+            with user_writes(user.id):
+                UserProfile.objects.get_or_create(
+                    user=user,
+                    defaults={
+                        'first_name': form.cleaned_data['first_name'],
+                        'last_name': form.cleaned_data['last_name'],
+                        'email': form.cleaned_data['email']
+                    }
+                )
 
             login(request, user)
 
@@ -527,13 +965,21 @@ def daily_summary_view(request):
     else:
         selected_date = date.today()
 
-    # Pobierz dane dla wybranej daty
-    meals = Meal.objects.filter(user=user, date=selected_date).order_by('-id')
-    activities = Activity.objects.filter(user=user, date=selected_date).order_by('-id')
+    # Pobierz dane dla wybranej daty; szablon potrzebuje tylko nazw, czasu i kalorii
+    daily = DailyBalance.objects.filter(user=user, date=selected_date).first()
+    meals = (
+        Meal.objects.filter(user=user, date=selected_date).order_by('-id').only('meal', 'calories')
+        if daily and daily.meal_count else []
+    )
+    activities = (
+        Activity.objects.filter(user=user, date=selected_date).order_by('-id')
+        .only('activity_type', 'duration', 'calories_burned')
+        if daily and daily.activity_count else []
+    )
     ppm = calculate_ppm(profile) if profile else None
-    total_eaten = sum(meal.calories for meal in meals)
-    total_burned = sum(activity.calories_burned for activity in activities)
-    total_activity_duration = sum(activity.duration for activity in activities)
+    total_eaten = daily.eaten_kcal if daily else 0
+    total_burned = daily.burned_kcal if daily else 0
+    total_activity_duration = daily.activity_minutes if daily else 0
     balance = total_eaten - total_burned - ppm
     age = calculate_age(profile.date_of_birth) if profile.date_of_birth else None
 
@@ -570,7 +1016,8 @@ def add_meal_dynamic(request):
             meal.user = request.user
             if 'date' in request.POST:  # Jeśli data jest przekazana w formularzu
                 meal.date = request.POST['date']
-            meal.save()
+            with user_writes(request.user.id):
+                meal.save()
             return redirect('daily-summary-html')
     else:
         form = MealForm(initial={'date': date.today()})  # Domyślna data
@@ -585,7 +1032,8 @@ def add_activity_form(request):
         if form.is_valid():
             activity = form.save(commit=False)
             activity.user = request.user
-            activity.save()
+            with user_writes(request.user.id):
+                activity.save()
             return redirect('daily-summary-html')
     else:
         form = ActivityForm()